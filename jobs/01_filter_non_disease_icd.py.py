@@ -1,11 +1,15 @@
 """
 Script để lọc bỏ các ICD code không phải bệnh lý thực sự.
-Copy file từ mimiciv/3.1/hosp/ vào proc/ và lọc theo config non_disease_icd.json
+Đọc file từ mimiciv/3.1/hosp/, lọc theo config non_disease_icd.json và lưu vào proc/ dạng Parquet
+(thêm --csv để export kèm bản .csv.gz)
 """
 
 import pandas as pd
+import numpy as np
 import json
+import re
 import shutil
+import sys
 from pathlib import Path
 
 # Đường dẫn
@@ -15,143 +19,116 @@ CONFIG_FILE = BASE_DIR / "configs" / "non_disease_icd.json"
 SOURCE_DIR = DATA_DIR / "mimiciv" / "3.1" / "hosp"
 OUTPUT_DIR = DATA_DIR / "proc"
 
-# File cần xử lý
-FILES_TO_PROCESS = [
-    "d_icd_diagnoses.csv.gz",
-    "diagnoses_icd.csv.gz"
-]
+sys.path.append(str(BASE_DIR / "utils"))
+from diagnoses_io import ParquetChunkWriter, export_csv_gz, iter_chunks, read_table, write_parquet  # noqa: E402
+
+# File cần xử lý: file nguồn → file output (Parquet)
+FILES_TO_PROCESS = {
+    "d_icd_diagnoses.csv.gz": "d_icd_diagnoses.parquet",
+    "diagnoses_icd.csv.gz": "diagnoses_icd.parquet",
+}
 
 def load_config():
     """Đọc config từ file JSON"""
     with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
         return json.load(f)
 
-def is_non_disease_icd(icd_code, icd_version, config):
+def _prefix_regex(prefixes):
+    """Gộp danh sách prefix thành một regex, dùng với str.match (neo đầu chuỗi); None nếu rỗng"""
+    if not prefixes:
+        return None
+    # Prefix dài trước để regex dừng sớm ở nhánh cụ thể nhất (kết quả match không đổi)
+    alternatives = sorted({re.escape(p) for p in prefixes}, key=len, reverse=True)
+    return re.compile("(?:" + "|".join(alternatives) + ")")
+
+def compile_icd_matcher(config):
     """
-    Kiểm tra xem ICD code có phải là non-disease không
-    
+    Biên dịch config một lần thành regex theo từng ICD version
+
     Returns:
-        True nếu là non-disease (cần loại bỏ)
-        False nếu là disease (cần giữ lại)
+        {icd_version: (keep_regex, drop_regex)}; drop gồm *_prefixes và manual_exclude
+        (exact match cũng là prefix match nên chỉ cần kiểm tra prefix)
     """
-    icd_code = str(icd_code).strip()
-    icd_version = int(icd_version)
-    
-    # Kiểm tra exceptions_to_keep trước (ưu tiên giữ lại)
     exceptions = config.get("exceptions_to_keep", {})
-    if icd_version == 10:
-        for exc in exceptions.get("icd10", []):
-            if icd_code.startswith(exc) or icd_code == exc:
-                return False  # Giữ lại
-    elif icd_version == 9:
-        for exc in exceptions.get("icd9", []):
-            if icd_code.startswith(exc) or icd_code == exc:
-                return False  # Giữ lại
-    
-    # Kiểm tra prefixes để loại bỏ
-    if icd_version == 10:
-        prefixes = config.get("icd10_prefixes", [])
-        for prefix in prefixes:
-            if icd_code.startswith(prefix):
-                return True  # Loại bỏ
-    elif icd_version == 9:
-        prefixes = config.get("icd9_prefixes", [])
-        for prefix in prefixes:
-            if icd_code.startswith(prefix):
-                return True  # Loại bỏ
-    
-    # Kiểm tra manual_exclude
     manual_exclude = config.get("manual_exclude", {})
-    if icd_version == 10:
-        for exclude_pattern in manual_exclude.get("icd10", []):
-            # Kiểm tra cả prefix và exact match
-            if icd_code.startswith(exclude_pattern) or icd_code == exclude_pattern:
-                return True  # Loại bỏ
-    elif icd_version == 9:
-        for exclude_pattern in manual_exclude.get("icd9", []):
-            # Kiểm tra cả prefix và exact match
-            if icd_code.startswith(exclude_pattern) or icd_code == exclude_pattern:
-                return True  # Loại bỏ
-    
-    return False  # Giữ lại (là disease)
+    matcher = {}
+    for version, key in [(10, "icd10"), (9, "icd9")]:
+        drop = config.get(f"{key}_prefixes", []) + manual_exclude.get(key, [])
+        matcher[version] = (_prefix_regex(exceptions.get(key, [])), _prefix_regex(drop))
+    return matcher
 
-def filter_d_icd_diagnoses(input_file, output_file, config):
+def non_disease_mask(icd_code, icd_version, matcher):
+    """
+    Mask True cho các dòng là non-disease (cần loại bỏ), tính vector hoá
+
+    exceptions_to_keep được ưu tiên (giữ lại); version khác 9/10 luôn giữ lại.
+    Chỉ match regex trên các cặp (icd_code, icd_version) duy nhất rồi map ngược về từng dòng.
+    """
+    codes = icd_code.astype(str).str.strip()
+    versions = icd_version.astype(int)
+    row_ids, pairs = pd.MultiIndex.from_arrays([codes, versions]).factorize()
+    pair_codes = pd.Series(pairs.get_level_values(0))
+    pair_versions = pairs.get_level_values(1)
+
+    pair_flags = np.zeros(len(pairs), dtype=bool)
+    for version, (keep_re, drop_re) in matcher.items():
+        sel = np.asarray(pair_versions == version)
+        if drop_re is None or not sel.any():
+            continue
+        c = pair_codes[sel]
+        flags = c.str.match(drop_re).to_numpy()
+        if keep_re is not None:
+            flags = flags & ~c.str.match(keep_re).to_numpy()
+        pair_flags[sel] = flags
+    return pair_flags[row_ids]
+
+def filter_d_icd_diagnoses(input_file, output_file, matcher):
     """Lọc file d_icd_diagnoses.csv.gz"""
     print(f"\n📖 Đang xử lý: {input_file.name}")
     
-    df = pd.read_csv(input_file, compression='gzip', low_memory=False)
+    df = read_table(input_file)
     print(f"   Số dòng ban đầu: {len(df):,}")
     
     # Lọc bỏ non-disease ICD
-    mask = df.apply(
-        lambda row: not is_non_disease_icd(
-            row['icd_code'], 
-            row['icd_version'], 
-            config
-        ), 
-        axis=1
-    )
+    mask = ~non_disease_mask(df['icd_code'], df['icd_version'], matcher)
     
     df_filtered = df[mask].copy()
     print(f"   Số dòng sau khi lọc: {len(df_filtered):,}")
     print(f"   Đã loại bỏ: {len(df) - len(df_filtered):,} dòng")
     
     # Lưu file
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    df_filtered.to_csv(output_file, index=False, compression='gzip')
+    write_parquet(df_filtered, output_file)
     print(f"✅ Đã lưu: {output_file}")
     
     return df_filtered
 
-def filter_diagnoses_icd(input_file, output_file, config):
-    """Lọc file diagnoses_icd.csv.gz (xử lý theo chunks)"""
+def filter_diagnoses_icd(input_file, output_file, matcher):
+    """Lọc file diagnoses_icd.csv.gz (xử lý theo chunks, mỗi chunk một row group Parquet)"""
     print(f"\n📖 Đang xử lý: {input_file.name}")
     
-    output_file.parent.mkdir(parents=True, exist_ok=True)
-    
     total_rows = 0
     total_kept = 0
-    first_chunk = True
-    chunk_size = 100_000
     
     # Xóa file output nếu đã tồn tại
     if output_file.exists():
         output_file.unlink()
     
-    for chunk_num, chunk in enumerate(pd.read_csv(
-        input_file, 
-        compression='gzip', 
-        chunksize=chunk_size, 
-        low_memory=False
-    )):
-        total_rows += len(chunk)
-        
-        # Lọc bỏ non-disease ICD
-        mask = chunk.apply(
-            lambda row: not is_non_disease_icd(
-                row['icd_code'], 
-                row['icd_version'], 
-                config
-            ), 
-            axis=1
-        )
-        
-        chunk_filtered = chunk[mask].copy()
-        total_kept += len(chunk_filtered)
-        
-        # Lưu chunk
-        if not chunk_filtered.empty:
-            chunk_filtered.to_csv(
-                output_file, 
-                mode='w' if first_chunk else 'a',
-                header=first_chunk,
-                index=False, 
-                compression='gzip'
-            )
-            first_chunk = False
-        
-        if (chunk_num + 1) % 10 == 0:
-            print(f"   Đã xử lý {total_rows:,} dòng, giữ lại {total_kept:,} dòng...")
+    with ParquetChunkWriter(output_file) as writer:
+        for chunk_num, chunk in enumerate(iter_chunks(input_file)):
+            total_rows += len(chunk)
+            
+            # Lọc bỏ non-disease ICD
+            mask = ~non_disease_mask(chunk['icd_code'], chunk['icd_version'], matcher)
+            
+            chunk_filtered = chunk[mask]
+            total_kept += len(chunk_filtered)
+            
+            # Lưu chunk
+            if not chunk_filtered.empty:
+                writer.write(chunk_filtered.copy())
+            
+            if (chunk_num + 1) % 10 == 0:
+                print(f"   Đã xử lý {total_rows:,} dòng, giữ lại {total_kept:,} dòng...")
     
     print(f"   Tổng số dòng ban đầu: {total_rows:,}")
     print(f"   Tổng số dòng sau khi lọc: {total_kept:,}")
@@ -171,11 +148,15 @@ def main():
     config = load_config()
     print(f"   Version: {config.get('version', 'N/A')}")
     print(f"   Description: {config.get('description', 'N/A')[:60]}...")
+    matcher = compile_icd_matcher(config)
+    
+    # Export kèm gzip CSV (định dạng cũ) nếu cần
+    export_csv = '--csv' in sys.argv
     
     # Xử lý từng file
-    for filename in FILES_TO_PROCESS:
+    for filename, output_name in FILES_TO_PROCESS.items():
         input_file = SOURCE_DIR / filename
-        output_file = OUTPUT_DIR / filename
+        output_file = OUTPUT_DIR / output_name
         
         if not input_file.exists():
             print(f"\n⚠️  File không tồn tại: {input_file}")
@@ -183,9 +164,13 @@ def main():
         
         # Xử lý theo loại file
         if filename == "d_icd_diagnoses.csv.gz":
-            filter_d_icd_diagnoses(input_file, output_file, config)
+            filter_d_icd_diagnoses(input_file, output_file, matcher)
         elif filename == "diagnoses_icd.csv.gz":
-            filter_diagnoses_icd(input_file, output_file, config)
+            filter_diagnoses_icd(input_file, output_file, matcher)
+        
+        if export_csv and output_file.exists():
+            export_csv_gz(output_file, OUTPUT_DIR / filename)
+            print(f"✅ Đã export CSV: {OUTPUT_DIR / filename}")
     
     print("\n" + "=" * 60)
     print("✨ HOÀN THÀNH!")
@@ -2,9 +2,11 @@
 Script để thống nhất các ICD code có long_title trùng lặp.
 Tìm các ICD trùng, tạo mapping và áp dụng vào diagnoses_icd.csv
 Giữ nguyên dữ liệu, chỉ cập nhật ICD code để thống nhất.
+File đầy đủ được lưu dạng Parquet (thêm --csv để export kèm bản .csv.gz).
 """
 
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import os
 import sys
@@ -17,6 +19,10 @@ DATA_DIR = BASE_DIR / "data"
 SOURCE_FILE = DATA_DIR / "mimiciv" / "3.1" / "hosp" / "d_icd_diagnoses.csv.gz"
 DUPLICATE_FILE = DATA_DIR / "mimic-iv-lite" / "duplicate_icd_diagnoses.csv"
 MAPPING_FILE = DATA_DIR / "mimic-iv-lite" / "icd_deduplicated_mapping.csv"
+UNIFIED_FILE = DATA_DIR / "proc" / "diagnoses_icd_unified.parquet"
+
+sys.path.append(str(BASE_DIR / "utils"))
+from diagnoses_io import ParquetChunkWriter, export_csv_gz, is_parquet, iter_chunks, read_table  # noqa: E402
 
 def find_duplicate_icd_diagnoses():
     """Tìm và lưu các ICD code có long_title trùng lặp"""
@@ -33,7 +39,7 @@ def find_duplicate_icd_diagnoses():
     
     try:
         # Đọc file gzip
-        df = pd.read_csv(SOURCE_FILE, compression='gzip', low_memory=False)
+        df = read_table(SOURCE_FILE)
         
         print(f"   Tổng số dòng: {len(df):,}")
         print(f"   Số ICD-9: {len(df[df['icd_version'] == 9]):,}")
@@ -68,23 +74,11 @@ def find_duplicate_icd_diagnoses():
         # Thống kê các trường hợp trùng
         duplicate_df['long_title_normalized'] = duplicate_df['long_title'].astype(str).str.strip().str.lower()
         
-        # Đếm các trường hợp: 9-9, 9-10, 10-10
-        icd9_vs_icd9 = 0
-        icd9_vs_icd10 = 0
-        icd10_vs_icd10 = 0
-        
-        for title_norm in duplicate_titles:
-            group = duplicate_df[duplicate_df['long_title_normalized'] == title_norm]
-            versions = set(group['icd_version'].unique())
-            
-            if len(versions) == 1:
-                if 9 in versions:
-                    icd9_vs_icd9 += 1
-                elif 10 in versions:
-                    icd10_vs_icd10 += 1
-            else:
-                if 9 in versions and 10 in versions:
-                    icd9_vs_icd10 += 1
+        # Đếm các trường hợp: 9-9, 9-10, 10-10 (một lần groupby cho tất cả nhóm)
+        versions = duplicate_df.groupby('long_title_normalized')['icd_version'].agg(['min', 'max'])
+        icd9_vs_icd9 = int(((versions['min'] == 9) & (versions['max'] == 9)).sum())
+        icd9_vs_icd10 = int(((versions['min'] == 9) & (versions['max'] == 10)).sum())
+        icd10_vs_icd10 = int(((versions['min'] == 10) & (versions['max'] == 10)).sum())
         
         print(f"\n📊 Thống kê các trường hợp trùng:")
         print(f"   ICD-9 trùng với ICD-9: {icd9_vs_icd9:,} nhóm")
@@ -115,43 +109,30 @@ def create_icd_mapping(duplicate_df=None):
         if not DUPLICATE_FILE.exists():
             print(f"⚠️  File duplicate không tồn tại. Chạy find_duplicate_icd_diagnoses() trước")
             return None
-        duplicate_df = pd.read_csv(DUPLICATE_FILE)
+        duplicate_df = pd.read_csv(DUPLICATE_FILE, dtype={'icd_code': str})
     
     # Chuẩn hóa long_title để nhóm
     duplicate_df['long_title_normalized'] = duplicate_df['long_title'].astype(str).str.strip().str.lower()
     
     # Tạo mapping: với mỗi long_title trùng, chọn ICD canonical
     # Quy tắc: Ưu tiên ICD-10, nếu có nhiều ICD-10 thì chọn theo thứ tự alphabet của icd_code
-    mappings = []
-    
-    # Nhóm các ICD theo long_title_normalized
-    duplicate_titles = duplicate_df['long_title_normalized'].unique()
-    print(f"\n🔄 Đang xử lý {len(duplicate_titles):,} long_title trùng lặp...")
-    
-    for title_norm in duplicate_titles:
-        # Lấy tất cả ICD có cùng long_title
-        group = duplicate_df[duplicate_df['long_title_normalized'] == title_norm].copy()
-        
-        # Sắp xếp: ưu tiên ICD-10, sau đó theo icd_code
-        group = group.sort_values(['icd_version', 'icd_code'], ascending=[False, True])
-        
-        # Chọn ICD đầu tiên làm canonical (ưu tiên ICD-10)
-        canonical = group.iloc[0]
-        canonical_icd_code = canonical['icd_code']
-        canonical_icd_version = canonical['icd_version']
-        
-        # Tạo mapping cho tất cả các ICD trong nhóm (bao gồm cả canonical)
-        for _, row in group.iterrows():
-            mappings.append({
-                'original_icd_code': row['icd_code'],
-                'original_icd_version': row['icd_version'],
-                'canonical_icd_code': canonical_icd_code,
-                'canonical_icd_version': canonical_icd_version,
-                'long_title': row['long_title']
-            })
-    
-    # Tạo DataFrame mapping
-    mapping_df = pd.DataFrame(mappings)
+    print(f"\n🔄 Đang xử lý {duplicate_df['long_title_normalized'].nunique():,} long_title trùng lặp...")
+    
+    # Sắp xếp một lần: nhóm theo long_title (giữ thứ tự xuất hiện), trong nhóm ưu tiên ICD-10
+    # rồi theo icd_code → dòng đầu tiên của mỗi nhóm là canonical
+    group = duplicate_df.assign(_title_order=pd.factorize(duplicate_df['long_title_normalized'])[0])
+    group = group.sort_values(['_title_order', 'icd_version', 'icd_code'],
+                              ascending=[True, False, True], kind='stable')
+    canonical = group.groupby('_title_order', sort=False)[['icd_code', 'icd_version']].transform('first')
+    
+    # Mapping cho tất cả các ICD trong nhóm (bao gồm cả canonical)
+    mapping_df = pd.DataFrame({
+        'original_icd_code': group['icd_code'].values,
+        'original_icd_version': group['icd_version'].values,
+        'canonical_icd_code': canonical['icd_code'].values,
+        'canonical_icd_version': canonical['icd_version'].values,
+        'long_title': group['long_title'].values,
+    })
     
     # Loại bỏ các mapping trùng (nếu có)
     mapping_df = mapping_df.drop_duplicates(['original_icd_code', 'original_icd_version'])
@@ -197,6 +178,37 @@ def create_icd_mapping(duplicate_df=None):
     
     return mapping_df
 
+def build_mapping_lookup(mapping_df):
+    """Bảng lookup (icd_code, icd_version) -> canonical, index là MultiIndex để tra cứu vector hóa"""
+    index = pd.MultiIndex.from_arrays([
+        mapping_df['original_icd_code'].astype(str),
+        mapping_df['original_icd_version'].astype(int),
+    ])
+    lookup = pd.DataFrame({
+        'icd_code': mapping_df['canonical_icd_code'].astype(str).values,
+        'icd_version': mapping_df['canonical_icd_version'].astype(int).values,
+    }, index=index)
+    return lookup[~lookup.index.duplicated()]
+
+def map_icd_columns(df, lookup):
+    """
+    Thay icd_code/icd_version của df bằng mã canonical (vector hóa, không apply từng dòng)
+    
+    Returns:
+        Số dòng bị thay đổi
+    """
+    codes = df['icd_code'].astype(str).to_numpy()
+    versions = df['icd_version'].astype(int).to_numpy()
+    # Vị trí của từng (icd_code, icd_version) trong bảng lookup (-1 nếu không có mapping)
+    pos = lookup.index.get_indexer(pd.MultiIndex.from_arrays([codes, versions]))
+    hit = pos >= 0
+    new_codes = np.where(hit, lookup['icd_code'].to_numpy()[pos], codes)
+    new_versions = np.where(hit, lookup['icd_version'].to_numpy()[pos], versions)
+    changed_count = int(((new_codes != codes) | (new_versions != versions)).sum())
+    df['icd_code'] = new_codes
+    df['icd_version'] = new_versions
+    return changed_count
+
 def apply_mapping_to_diagnoses_icd(mapping_df=None, input_file=None, output_file=None, use_full_file=False):
     """Áp dụng mapping vào diagnoses_icd.csv
     
@@ -215,7 +227,7 @@ def apply_mapping_to_diagnoses_icd(mapping_df=None, input_file=None, output_file
         if not MAPPING_FILE.exists():
             print(f"⚠️  File mapping chưa tồn tại. Chạy create_icd_mapping() trước.")
             return None
-        mapping_df = pd.read_csv(MAPPING_FILE)
+        mapping_df = pd.read_csv(MAPPING_FILE, dtype={'original_icd_code': str, 'canonical_icd_code': str})
     
     # Xác định file input và output
     if use_full_file:
@@ -224,9 +236,7 @@ def apply_mapping_to_diagnoses_icd(mapping_df=None, input_file=None, output_file
             input_file = DATA_DIR / "mimiciv" / "3.1" / "hosp" / "diagnoses_icd.csv.gz"
         if output_file is None:
             # Lưu vào thư mục proc để không ảnh hưởng file gốc
-            output_dir = DATA_DIR / "proc"
-            output_dir.mkdir(parents=True, exist_ok=True)
-            output_file = output_dir / "diagnoses_icd_unified.csv.gz"
+            output_file = UNIFIED_FILE
     else:
         # Sử dụng file lite (mặc định)
         if input_file is None:
@@ -240,63 +250,35 @@ def apply_mapping_to_diagnoses_icd(mapping_df=None, input_file=None, output_file
     
     print(f"\n🔄 Áp dụng mapping vào {input_file.name}...")
     
-    # Tạo mapping dictionary để lookup nhanh
-    mapping_dict = {}
-    for _, row in mapping_df.iterrows():
-        key = (str(row['original_icd_code']), int(row['original_icd_version']))
-        mapping_dict[key] = (str(row['canonical_icd_code']), int(row['canonical_icd_version']))
+    # Tạo bảng lookup (MultiIndex) để map cả chunk một lần
+    lookup = build_mapping_lookup(mapping_df)
     
-    print(f"   Đã load {len(mapping_dict):,} mapping")
+    print(f"   Đã load {len(lookup):,} mapping")
     
-    # Xử lý file gzip hoặc file thường
-    is_gzip = str(input_file).endswith('.gz')
     use_chunks = use_full_file  # Chỉ dùng chunks cho file lớn
     
     if use_chunks:
-        # Xử lý theo chunks để tiết kiệm memory
+        # Xử lý theo chunks để tiết kiệm memory (mỗi chunk một row group Parquet)
         print(f"   Xử lý file lớn theo chunks...")
-        chunk_size = 100_000
         total_rows = 0
         changed_count = 0
-        first_chunk = True
-        
-        output_file.parent.mkdir(parents=True, exist_ok=True)
         
         # Xóa file output nếu đã tồn tại
         if output_file.exists():
             output_file.unlink()
         
-        for chunk_num, chunk in enumerate(pd.read_csv(input_file, compression='gzip' if is_gzip else None, 
-                                                      chunksize=chunk_size, low_memory=False)):
-            total_rows += len(chunk)
-            
-            # Áp dụng mapping
-            def map_icd(row):
-                key = (str(row['icd_code']), int(row['icd_version']))
-                if key in mapping_dict:
-                    return mapping_dict[key]
-                return (str(row['icd_code']), int(row['icd_version']))
-            
-            # Lưu ICD gốc để đếm số thay đổi
-            original_icd = chunk[['icd_code', 'icd_version']].copy()
-            
-            mapped = chunk.apply(lambda row: map_icd(row), axis=1)
-            chunk['icd_code'] = [x[0] for x in mapped]
-            chunk['icd_version'] = [x[1] for x in mapped]
-            
-            # Đếm số dòng thay đổi
-            changed_mask = (original_icd['icd_code'] != chunk['icd_code']) | (original_icd['icd_version'] != chunk['icd_version'])
-            changed_count += changed_mask.sum()
-            
-            # Lưu chunk
-            mode = 'w' if first_chunk else 'a'
-            header = first_chunk
-            chunk.to_csv(output_file, mode=mode, header=header, index=False, 
-                        compression='gzip' if str(output_file).endswith('.gz') else None)
-            first_chunk = False
-            
-            if (chunk_num + 1) % 10 == 0:
-                print(f"   Đã xử lý {total_rows:,} dòng, đã thay đổi {changed_count:,} dòng...")
+        with ParquetChunkWriter(output_file) as writer:
+            for chunk_num, chunk in enumerate(iter_chunks(input_file)):
+                total_rows += len(chunk)
+                
+                # Áp dụng mapping (và đếm số dòng thay đổi)
+                changed_count += map_icd_columns(chunk, lookup)
+                
+                # Lưu chunk
+                writer.write(chunk)
+                
+                if (chunk_num + 1) % 10 == 0:
+                    print(f"   Đã xử lý {total_rows:,} dòng, đã thay đổi {changed_count:,} dòng...")
         
         print(f"\n✅ Đã lưu file đã unified: {output_file}")
         print(f"   Tổng số dòng: {total_rows:,}")
@@ -305,40 +287,22 @@ def apply_mapping_to_diagnoses_icd(mapping_df=None, input_file=None, output_file
         
     else:
         # Xử lý file nhỏ (load toàn bộ vào memory)
-        df_diag = pd.read_csv(input_file, compression='gzip' if is_gzip else None, low_memory=False)
+        df_diag = read_table(input_file)
         print(f"   Số dòng ban đầu: {len(df_diag):,}")
         
-        # Lưu ICD gốc để đếm
-        original_icd = df_diag[['icd_code', 'icd_version']].copy()
-        
-        # Áp dụng mapping
-        def map_icd(row):
-            key = (str(row['icd_code']), int(row['icd_version']))
-            if key in mapping_dict:
-                canonical_code, canonical_version = mapping_dict[key]
-                return pd.Series({
-                    'icd_code': canonical_code,
-                    'icd_version': canonical_version
-                })
-            return pd.Series({
-                'icd_code': row['icd_code'],
-                'icd_version': row['icd_version']
-            })
-        
-        mapped = df_diag.apply(lambda row: map_icd(row), axis=1)
-        df_diag['icd_code'] = mapped['icd_code']
-        df_diag['icd_version'] = mapped['icd_version']
-        
-        # Đếm số dòng thay đổi
-        changed_mask = (original_icd['icd_code'] != df_diag['icd_code']) | (original_icd['icd_version'] != df_diag['icd_version'])
-        changed_count = changed_mask.sum()
+        # Áp dụng mapping (và đếm số dòng thay đổi)
+        changed_count = map_icd_columns(df_diag, lookup)
         
         print(f"   Số dòng được thay đổi: {changed_count:,}")
         print(f"   Tỷ lệ thay đổi: {changed_count/len(df_diag)*100:.2f}%")
         
         # Lưu file mới
         output_file.parent.mkdir(parents=True, exist_ok=True)
-        df_diag.to_csv(output_file, index=False, compression='gzip' if str(output_file).endswith('.gz') else None)
+        if is_parquet(output_file):
+            with ParquetChunkWriter(output_file) as writer:
+                writer.write(df_diag.copy())
+        else:
+            df_diag.to_csv(output_file, index=False, compression='gzip' if str(output_file).endswith('.gz') else None)
         print(f"\n✅ Đã lưu file đã unified: {output_file}")
         print(f"   Số dòng sau mapping: {len(df_diag):,}")
         
@@ -356,15 +320,11 @@ def load_icd_mapping():
         print(f"⚠️  File mapping chưa tồn tại: {MAPPING_FILE}")
         return None
     
-    mapping_df = pd.read_csv(MAPPING_FILE)
+    mapping_df = pd.read_csv(MAPPING_FILE, dtype={'original_icd_code': str, 'canonical_icd_code': str})
     
     # Tạo dictionary để lookup nhanh: (icd_code, icd_version) -> (canonical_code, canonical_version)
-    mapping_dict = {}
-    for _, row in mapping_df.iterrows():
-        key = (str(row['original_icd_code']), int(row['original_icd_version']))
-        mapping_dict[key] = (str(row['canonical_icd_code']), int(row['canonical_icd_version']))
-    
-    return mapping_dict
+    lookup = build_mapping_lookup(mapping_df)
+    return dict(zip(lookup.index, zip(lookup['icd_code'], lookup['icd_version'].map(int))))
 
 def map_single_icd(icd_code, icd_version, mapping_dict=None):
     """Hàm tiện ích để map một ICD code đơn lẻ"""
@@ -412,13 +372,18 @@ if __name__ == "__main__":
         print("\n⚠️  Xử lý file gốc đầy đủ (6M+ dòng), có thể mất vài phút...")
         apply_mapping_to_diagnoses_icd(mapping_df, use_full_file=True)
         
+        # Export kèm gzip CSV (định dạng cũ) nếu cần
+        if '--csv' in sys.argv and UNIFIED_FILE.exists():
+            export_csv_gz(UNIFIED_FILE, UNIFIED_FILE.with_suffix('.csv.gz'))
+            print(f"✅ Đã export CSV: {UNIFIED_FILE.with_suffix('.csv.gz')}")
+        
         print("\n" + "=" * 60)
         print("✨ HOÀN THÀNH!")
         print("=" * 60)
         print(f"\n📁 Các file đã tạo:")
         print(f"   1. Duplicate list: {DUPLICATE_FILE}")
         print(f"   2. Mapping: {MAPPING_FILE}")
-        print(f"   3. Diagnoses đã unified (file gốc): {DATA_DIR / 'proc' / 'diagnoses_icd_unified.csv.gz'}")
+        print(f"   3. Diagnoses đã unified (file gốc): {UNIFIED_FILE}")
     
     print(f"\n💡 Để sử dụng mapping trong code khác:")
     print(f"   from jobs.02_unify_duplicate_icd import load_icd_mapping, map_single_icd")
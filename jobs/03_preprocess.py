@@ -1,12 +1,18 @@
 """
 Script để tạo file train_unified.parquet từ các file nguồn.
 Kết hợp discharge notes, demographics, và ICD codes đã unified.
+Discharge notes được đọc (giải nén) ở process chính, làm sạch + merge song song trên process
+pool, và ghi ra Parquet theo đúng thứ tự chunk.
 """
 
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
-import re
+import multiprocessing
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Đường dẫn
@@ -18,7 +24,10 @@ OUTPUT_DIR = DATA_DIR / "proc"
 DISCHARGE_FILE = DATA_DIR / "mimic-iv-note" / "2.2" / "note" / "discharge.csv.gz"
 PATIENTS_FILE = DATA_DIR / "mimiciv" / "3.1" / "hosp" / "patients.csv.gz"
 ADMISSIONS_FILE = DATA_DIR / "mimiciv" / "3.1" / "hosp" / "admissions.csv.gz"
-DIAGNOSES_FILE = DATA_DIR / "proc" / "diagnoses_icd_unified.csv.gz"
+DIAGNOSES_FILE = DATA_DIR / "proc" / "diagnoses_icd_unified.parquet"
+
+sys.path.append(str(BASE_DIR / "utils"))
+from diagnoses_io import HadmCodeIndex  # noqa: E402
 
 # File output
 OUTPUT_FILE = OUTPUT_DIR / "train_unified.parquet"
@@ -26,18 +35,60 @@ OUTPUT_FILE = OUTPUT_DIR / "train_unified.parquet"
 # Cấu hình
 MAX_CHARS = 8000  # Giới hạn độ dài text
 TEXT_FROM_SERVICE_ONLY = True  # Chỉ lấy phần từ "Service:" trở đi
+CHUNK_SIZE = 20_000  # Số note mỗi chunk gửi cho worker
+N_WORKERS = os.cpu_count() or 1  # Số process làm sạch note
+MAX_IN_FLIGHT = 2 * N_WORKERS  # Số chunk đang xử lý tối đa (giới hạn bộ nhớ)
+
+# Regex tìm 'Service:' (không phân biệt hoa thường), lấy tối đa MAX_CHARS ký tự từ đó
+# (không copy phần đuôi note sẽ bị cắt bỏ)
+SERVICE_PATTERN = rf'(?is)\b(?=Service\s*:)(.{{0,{MAX_CHARS}}})'
+OUTPUT_COLS = ['subject_id', 'hadm_id', 'gender', 'age_at_admit', 'icd_codes', 'text_clean']
 
-def keep_from_service(text: str) -> str:
-    """Lấy phần text từ 'Service:' trở đi"""
-    if not isinstance(text, str):
-        return ""
-    match = re.search(r'\bService\s*:', text, flags=re.I)
-    if match is not None:
-        return text[match.start():]
-    return text
+# Dữ liệu dùng chung cho các worker (gán trước khi tạo pool, worker kế thừa khi fork)
+_demographics = None
+_hadm2codes = None
+
+def keep_from_service(txt: pd.Series) -> pd.Series:
+    """Lấy phần text từ 'Service:' trở đi, tối đa MAX_CHARS ký tự (vector hóa); giữ nguyên note không có 'Service:'"""
+    return txt.str.extract(SERVICE_PATTERN, expand=False).fillna(txt)
+
+def process_chunk(chunk, text_col):
+    """Làm sạch một chunk discharge notes, merge demographics và gắn ICD codes (chạy trong worker)"""
+    # Merge với demographics
+    chunk = chunk.merge(_demographics, on=['subject_id', 'hadm_id'], how='left')
+    
+    # Lọc các dòng có text hợp lệ
+    txt = chunk[text_col].astype(str)
+    mask = ~(txt.isna() | txt.str.lower().isin(['nan', 'none', '']))
+    chunk = chunk[mask].copy()
+    
+    if chunk.empty:
+        return chunk.reindex(columns=OUTPUT_COLS)
+    
+    # Tạo text_clean
+    if TEXT_FROM_SERVICE_ONLY:
+        chunk['text_clean'] = keep_from_service(txt[mask])
+    else:
+        chunk['text_clean'] = txt[mask]
+    
+    # Giới hạn độ dài
+    chunk['text_clean'] = chunk['text_clean'].str.slice(0, MAX_CHARS)
+    
+    # Gắn ICD codes
+    chunk['icd_codes'] = _hadm2codes.joined_codes(chunk['hadm_id'].to_numpy())
+    
+    # Chỉ giữ các dòng có cả text_clean và icd_codes
+    chunk = chunk[
+        (chunk['text_clean'].str.len() > 0) & 
+        (chunk['icd_codes'].str.len() > 0)
+    ]
+    
+    # Chọn các cột cần thiết
+    return chunk[OUTPUT_COLS].copy()
 
 def create_train_unified():
     """Tạo file train_unified.parquet"""
+    global _demographics, _hadm2codes
     
     print("=" * 60)
     print("TẠO FILE train_unified.parquet")
@@ -83,34 +134,11 @@ def create_train_unified():
     print("\n📖 Bước 2: Đọc ICD codes...")
     print("   Đang đọc diagnoses_icd_unified...")
     
-    # Tạo mapping hadm_id -> list icd_full
-    hadm2codes = {}
-    chunk_size = 200_000
-    
-    for chunk in pd.read_csv(DIAGNOSES_FILE, compression='gzip',
-                            usecols=['hadm_id', 'icd_code', 'icd_version'],
-                            chunksize=chunk_size):
-        # Loại bỏ duplicate
-        chunk = chunk.drop_duplicates(['hadm_id', 'icd_code', 'icd_version'])
-        
-        # Tạo icd_full: version-code
-        chunk['icd_full'] = (
-            chunk['icd_version'].astype(str) + "-" + 
-            chunk['icd_code'].astype(str)
-        )
-        
-        # Gộp theo hadm_id
-        for hadm_id, group in chunk.groupby('hadm_id'):
-            hadm_id_int = int(hadm_id)
-            if hadm_id_int not in hadm2codes:
-                hadm2codes[hadm_id_int] = []
-            hadm2codes[hadm_id_int].extend(group['icd_full'].tolist())
-    
-    # Loại bỏ duplicate trong mỗi hadm_id và sắp xếp
-    for hadm_id in hadm2codes:
-        hadm2codes[hadm_id] = sorted(set(hadm2codes[hadm_id]))
+    # Chỉ mục hadm_id -> các icd_full (đã sort, không trùng) dạng CSR, một lượt đọc
+    hadm2codes = HadmCodeIndex.build(DIAGNOSES_FILE)
     
     print(f"   Đã tạo mapping cho {len(hadm2codes):,} hadm_id")
+    _demographics, _hadm2codes = demographics, hadm2codes
     
     # Bước 3: Đọc discharge notes và merge
     print("\n📖 Bước 3: Đọc discharge notes và merge...")
@@ -142,100 +170,66 @@ def create_train_unified():
     total_processed = 0
     total_written = 0
     
-    print("   Đang xử lý discharge notes...")
-    
-    for chunk_num, chunk in enumerate(pd.read_csv(
-        DISCHARGE_FILE, 
-        compression='gzip',
-        usecols=['subject_id', 'hadm_id', text_col],
-        chunksize=100_000,
-        low_memory=True
-    )):
-        total_processed += len(chunk)
-        
-        # Merge với demographics
-        chunk = chunk.merge(demographics, on=['subject_id', 'hadm_id'], how='left')
-        
-        # Lọc các dòng có text hợp lệ
-        txt = chunk[text_col].astype(str)
-        mask = ~(txt.isna() | txt.str.lower().isin(['nan', 'none', '']))
-        chunk = chunk[mask].copy()
-        
-        if chunk.empty:
-            continue
-        
-        # Tạo text_clean
-        if TEXT_FROM_SERVICE_ONLY:
-            chunk['text_clean'] = txt[mask].map(keep_from_service)
-        else:
-            chunk['text_clean'] = txt[mask].str.slice(0, MAX_CHARS)
-        
-        # Giới hạn độ dài
-        chunk['text_clean'] = chunk['text_clean'].str.slice(0, MAX_CHARS)
-        
-        # Gắn ICD codes
-        chunk['icd_codes'] = chunk['hadm_id'].map(
-            lambda h: ';'.join(hadm2codes.get(int(h), []))
-        )
-        
-        # Chỉ giữ các dòng có cả text_clean và icd_codes
-        chunk = chunk[
-            (chunk['text_clean'].str.len() > 0) & 
-            (chunk['icd_codes'].str.len() > 0)
-        ].copy()
-        
-        if chunk.empty:
-            continue
-        
-        # Chọn các cột cần thiết
-        output_cols = ['subject_id', 'hadm_id', 'gender', 'age_at_admit', 
-                      'icd_codes', 'text_clean']
-        chunk = chunk[output_cols].copy()
-        
-        batch.append(chunk)
-        
-        # Ghi batch khi đủ lớn
-        if sum(len(b) for b in batch) >= batch_size:
-            combined = pd.concat(batch, ignore_index=True)
-            
-            try:
-                table = pa.Table.from_pandas(combined)
-                if writer is None:
-                    writer = pq.ParquetWriter(OUTPUT_FILE, table.schema, compression='snappy')
-                writer.write_table(table)
-                total_written += len(combined)
-                batch.clear()
-                
-                if (chunk_num + 1) % 10 == 0:
-                    print(f"   Đã xử lý {total_processed:,} dòng, đã ghi {total_written:,} dòng...")
-            except Exception as e:
-                print(f"⚠️  Lỗi khi ghi parquet: {e}")
-                # Fallback: ghi CSV
-                csv_file = OUTPUT_DIR / "train_unified.csv"
-                if not csv_file.exists():
-                    combined.to_csv(csv_file, index=False, mode='w', header=True)
-                else:
-                    combined.to_csv(csv_file, index=False, mode='a', header=False)
-                total_written += len(combined)
-                batch.clear()
-    
-    # Ghi phần còn lại
-    if batch:
-        combined = pd.concat(batch, ignore_index=True)
+    def write_batch(combined):
+        nonlocal writer, total_written
         try:
             table = pa.Table.from_pandas(combined)
             if writer is None:
                 writer = pq.ParquetWriter(OUTPUT_FILE, table.schema, compression='snappy')
             writer.write_table(table)
-            total_written += len(combined)
         except Exception as e:
             print(f"⚠️  Lỗi khi ghi parquet: {e}")
+            # Fallback: ghi CSV
             csv_file = OUTPUT_DIR / "train_unified.csv"
             if not csv_file.exists():
                 combined.to_csv(csv_file, index=False, mode='w', header=True)
             else:
                 combined.to_csv(csv_file, index=False, mode='a', header=False)
-            total_written += len(combined)
+        total_written += len(combined)
+    
+    def collect(chunk_num, processed):
+        # Gom kết quả theo đúng thứ tự chunk, ghi khi batch đủ lớn
+        if not processed.empty:
+            batch.append(processed)
+        if sum(len(b) for b in batch) >= batch_size:
+            write_batch(pd.concat(batch, ignore_index=True))
+            batch.clear()
+            if (chunk_num + 1) % 10 == 0:
+                print(f"   Đã xử lý {total_processed:,} dòng, đã ghi {total_written:,} dòng...")
+    
+    print(f"   Đang xử lý discharge notes ({N_WORKERS} workers)...")
+    
+    chunks = pd.read_csv(
+        DISCHARGE_FILE, 
+        compression='gzip',
+        usecols=['subject_id', 'hadm_id', text_col],
+        chunksize=CHUNK_SIZE,
+        low_memory=True
+    )
+    
+    if N_WORKERS <= 1:
+        # Một process: xử lý trực tiếp, không tốn chi phí gửi chunk qua pipe
+        for chunk_num, chunk in enumerate(chunks):
+            total_processed += len(chunk)
+            collect(chunk_num, process_chunk(chunk, text_col))
+    else:
+        # fork: worker kế thừa demographics + chỉ mục ICD, chỉ chunk note được gửi qua pipe
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=N_WORKERS, mp_context=multiprocessing.get_context('fork')) as pool:
+            for chunk_num, chunk in enumerate(chunks):
+                total_processed += len(chunk)
+                pending.append((chunk_num, pool.submit(process_chunk, chunk, text_col)))
+                if len(pending) >= MAX_IN_FLIGHT:
+                    num, future = pending.popleft()
+                    collect(num, future.result())
+            
+            while pending:
+                num, future = pending.popleft()
+                collect(num, future.result())
+    
+    # Ghi phần còn lại
+    if batch:
+        write_batch(pd.concat(batch, ignore_index=True))
     
     # Đóng writer
     if writer is not None:
@@ -16,6 +16,11 @@ MAX_LABELS     = 2000     # keep top-K most frequent ICDs after thresholding
 MAX_TOKENS_PER_DOC = 8000 # cap tokens per doc before vectorization (higher than before)
 
 # Vectorization (TF–IDF for better weighting versus hashing)
+#   "tfidf":   TfidfVectorizer with a learned vocabulary (MAX_FEATURES_WORD terms)
+#   "hashing": HashingVectorizer + idf per hash bucket — no vocabulary to ship or load, serving
+#              vectorizes statelessly (MAX_FEATURES_WORD / MIN_DF do not apply)
+VECTORIZER        = "tfidf"
+HASH_N_FEATURES   = 2**18             # hash buckets (hashing only); weights are buckets × labels, like MAX_FEATURES_WORD
 USE_CHAR_NGRAMS   = False             # add char n-grams for OOV robustness
 WORD_NGRAM_RANGE  = (1, 2)            # word n-grams
 CHAR_NGRAM_RANGE  = (3, 5)            # char n-grams (if enabled)
@@ -28,7 +33,27 @@ MIN_DF            = 2                 # prune ultra-rare terms
 ALPHA         = 1e-5      # L2 regularization strength
 EARLY_STOP    = True      # use built-in early stopping (per label)
 VAL_FRACTION  = 0.1       # fraction from training for early stopping
-N_JOBS        = 1         # single worker to avoid extra RAM copies on Kaggle free        # parallel OvR heads (where supported)
+N_JOBS        = 1         # >1: heads fitted on N_JOBS processes sharing one memory-mapped Xtr (no extra RAM copies)
+
+# Repo utils/ (parallel_ovr.py, needed when N_JOBS > 1): next to this script when run from the repo
+# (jobs/../utils), else the Kaggle dataset mount
+KAGGLE_UTILS = Path("/kaggle/input/revita-sympdiag/utils")
+try:
+    REPO_UTILS = Path(__file__).resolve().parent.parent / "utils"
+except NameError:  # executed cell by cell in a notebook: no __file__
+    REPO_UTILS = KAGGLE_UTILS
+if not (REPO_UTILS / "parallel_ovr.py").exists():
+    REPO_UTILS = KAGGLE_UTILS
+
+# Training mode
+#   "full":   load the whole corpus, build Xtr/Xva/Xte in RAM, fit OvR in one call
+#   "stream": stream Parquet row groups, vectorize each batch with a fixed TF-IDF (fitted on a
+#             sample of train docs) and update the SGD heads with partial_fit — RAM is bounded by
+#             the batch size, not the corpus size (needs UNIFIED_PQT)
+TRAIN_MODE        = "full"
+STREAM_BATCH_ROWS = 5_000    # docs per partial_fit batch
+STREAM_EPOCHS     = 3        # passes over the training rows (row groups reshuffled each epoch)
+STREAM_FIT_DOCS   = 50_000   # train docs sampled to fit the vocabulary/idf in stream mode
 
 # Train / Eval
 TEST_SIZE           = 0.15  # patient-level test split
@@ -44,31 +69,47 @@ SEED              = 40
 CKPT_MODEL = WORK_DIR / "ovr_sgd_tfidf.joblib"  # model + vectorizers + label binarizer
 PRECOMP_DIR = WORK_DIR / "precomp_sparse"       # cache sparse matrices
 PRECOMP_DIR.mkdir(parents=True, exist_ok=True)
+# Reuse vectorized train/val/test matrices + split across runs (keyed by data + split + vectorizer
+# config, so sweeping ALPHA / MIN_LABEL_FREQ / MAX_LABELS only repeats the classifier step)
+USE_FEATURE_CACHE = True
+FEATURE_CACHE_VERSION = 1  # bump after editing truncate_tokens or the split/vectorization code of [2]/[4]/[5]
 
 print({
     "dataset": str(BASE_INPUT),
     "unified": str(UNIFIED_PQT if UNIFIED_PQT.exists() else UNIFIED_CSV),
+    "VECTORIZER": VECTORIZER,
     "MAX_FEATURES_WORD": MAX_FEATURES_WORD,
     "USE_CHAR_NGRAMS": USE_CHAR_NGRAMS,
     "MIN_LABEL_FREQ": MIN_LABEL_FREQ,
     "MAX_LABELS": MAX_LABELS,
+    "TRAIN_MODE": TRAIN_MODE,
     "CKPT_MODEL": str(CKPT_MODEL),
 })
 
 # %% [2] LOAD unified dataframe
+import numpy as np
 import pandas as pd
-if UNIFIED_PQT.exists():
+import pyarrow.parquet as pq
+
+# Normalize & light clean
+def truncate_tokens(text: str, mx:int=MAX_TOKENS_PER_DOC):
+    return " ".join(str(text).split()[:mx])
+
+if TRAIN_MODE == "stream":
+    # Only the small metadata columns are loaded; text is streamed later by file row position
+    if not UNIFIED_PQT.exists():
+        raise FileNotFoundError("TRAIN_MODE='stream' cần train_unified.parquet ở gốc dataset.")
+    df = pd.read_parquet(UNIFIED_PQT, columns=["subject_id", "hadm_id", "icd_codes"])
+    df["row"] = np.arange(len(df))
+elif UNIFIED_PQT.exists():
     df = pd.read_parquet(UNIFIED_PQT)
 elif UNIFIED_CSV.exists():
     df = pd.read_csv(UNIFIED_CSV)
 else:
     raise FileNotFoundError("Không thấy train_unified.{parquet|csv} ở gốc dataset.")
 
-# Normalize & light clean
-def truncate_tokens(text: str, mx:int=MAX_TOKENS_PER_DOC):
-    return " ".join(str(text).split()[:mx])
-
-df["text_clean"] = df["text_clean"].map(truncate_tokens)
+if "text_clean" in df.columns:
+    df["text_clean"] = df["text_clean"].map(truncate_tokens)
 df["icd_codes_list"] = df["icd_codes"].astype(str).str.split(";")
 print("Loaded:", df.shape)
 
@@ -93,47 +134,48 @@ else:
     KEEP_LABELS = set(keep)
     print(f"Tính nhãn từ unified: {len(KEEP_LABELS)} labels")
 
-# Filter rows & form labels field
-mask = df["icd_codes_list"].map(lambda L: any(c in KEEP_LABELS for c in L))
-df = df.loc[mask].copy()
-df["labels"] = df["icd_codes_list"].map(lambda L: [c for c in L if c in KEEP_LABELS])
-print("After label filter:", df.shape)
-
 # Optional: downsample for quick syntax/logic smoke tests
 if LIMIT_SAMPLES is not None and len(df) > LIMIT_SAMPLES:
     df = df.sample(LIMIT_SAMPLES, random_state=SEED).reset_index(drop=True)
     print(f"Downsampled to {len(df)} rows for quick test")
 
-# %% [4] PATIENT-LEVEL SPLIT (no leakage)
+# Form labels field. Rows without any kept label are dropped inside each split (after [4]/[5]),
+# so the split and the cached feature matrices do not depend on the label selection
+df["labels"] = df["icd_codes_list"].map(lambda L: [c for c in L if c in KEEP_LABELS])
+has_labels = df["labels"].map(len).to_numpy() > 0
+print("After label filter:", int(has_labels.sum()), "rows with kept labels of", len(df))
+
+# %% [4] PATIENT-LEVEL SPLIT (no leakage) — row positions in df, cached with the features
+import hashlib
+import json
+import os
+import shutil
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.model_selection import GroupShuffleSplit
-
-# test split
-gss1 = GroupShuffleSplit(n_splits=1, test_size=TEST_SIZE, random_state=SEED)
-idx_tr, idx_te = next(gss1.split(df, groups=df["subject_id"]))
-train_val = df.iloc[idx_tr].reset_index(drop=True)
-test = df.iloc[idx_te].reset_index(drop=True)
-
-# val split inside train
-gss2 = GroupShuffleSplit(n_splits=1, test_size=VAL_SIZE_WITHIN_TRAIN, random_state=SEED)
-idx_tr2, idx_va = next(gss2.split(train_val, groups=train_val["subject_id"]))
-train = train_val.iloc[idx_tr2].reset_index(drop=True)
-val   = train_val.iloc[idx_va].reset_index(drop=True)
-print({"train": len(train), "val": len(val), "test": len(test)})
-
-# %% [5] VECTORIZATION — TF‑IDF (fit once, transform once, cache)
-import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from scipy import sparse
-import joblib
-
-word_vec = TfidfVectorizer(
-    ngram_range=WORD_NGRAM_RANGE,
-    max_features=MAX_FEATURES_WORD,
-    min_df=MIN_DF,
-    sublinear_tf=SUBLINEAR_TF,
-    norm="l2",
-    dtype=np.float32,
-)
+from sklearn.pipeline import make_pipeline
+
+# Unfitted vectorizers: built here so their full params go into the feature cache key
+if VECTORIZER == "hashing":
+    # Counts hashed into buckets (no vocabulary); fit only learns the idf of each bucket
+    word_vec = make_pipeline(
+        HashingVectorizer(
+            ngram_range=WORD_NGRAM_RANGE,
+            n_features=HASH_N_FEATURES,
+            alternate_sign=False,
+            norm=None,
+            dtype=np.float32,
+        ),
+        TfidfTransformer(sublinear_tf=SUBLINEAR_TF, norm="l2"),
+    )
+else:
+    word_vec = TfidfVectorizer(
+        ngram_range=WORD_NGRAM_RANGE,
+        max_features=MAX_FEATURES_WORD,
+        min_df=MIN_DF,
+        sublinear_tf=SUBLINEAR_TF,
+        norm="l2",
+        dtype=np.float32,
+    )
 
 char_vec = None
 if USE_CHAR_NGRAMS:
@@ -147,26 +189,167 @@ if USE_CHAR_NGRAMS:
         dtype=np.float32,
     )
 
-# Fit on TRAIN ONLY (avoid leakage)
-word_vec.fit(train["text_clean"]) 
-Xtr_w = word_vec.transform(train["text_clean"]) 
-Xva_w = word_vec.transform(val["text_clean"]) 
-Xte_w = word_vec.transform(test["text_clean"]) 
+def feature_cache_dir():
+    """PRECOMP_DIR/<fingerprint>: data file identity + everything that changes split or features.
+
+    The vectorizers enter with all their params (incl. the hard-coded norm/dtype/analyzer/...);
+    FEATURE_CACHE_VERSION covers code that has no params, e.g. truncate_tokens.
+    """
+    st = UNIFIED_PQT.stat() if UNIFIED_PQT.exists() else UNIFIED_CSV.stat()
+    key = {
+        "version": FEATURE_CACHE_VERSION,
+        "data": [str(BASE_INPUT), st.st_size, st.st_mtime_ns, len(df)],
+        "split": [TEST_SIZE, VAL_SIZE_WITHIN_TRAIN, SEED, LIMIT_SAMPLES],
+        "text": [MAX_TOKENS_PER_DOC],
+        "word": word_vec.get_params(deep=True),
+        "char": char_vec.get_params(deep=True) if char_vec is not None else None,
+    }
+    blob = json.dumps(key, sort_keys=True, default=str)
+    return PRECOMP_DIR / hashlib.sha1(blob.encode()).hexdigest()[:16]
+
+CACHE_DIR = feature_cache_dir() if (USE_FEATURE_CACHE and TRAIN_MODE != "stream") else None
+cache_hit = CACHE_DIR is not None and (CACHE_DIR / "done").exists()
 
-if USE_CHAR_NGRAMS:
-    char_vec.fit(train["text_clean"]) 
-    Xtr_c = char_vec.transform(train["text_clean"]) 
-    Xva_c = char_vec.transform(val["text_clean"]) 
-    Xte_c = char_vec.transform(test["text_clean"]) 
-    Xtr = sparse.hstack([Xtr_w, Xtr_c], format="csr")
-    Xva = sparse.hstack([Xva_w, Xva_c], format="csr")
-    Xte = sparse.hstack([Xte_w, Xte_c], format="csr")
+if cache_hit:
+    split = np.load(CACHE_DIR / "split.npz")
+    pos_tr, pos_va, pos_te = split["train"], split["val"], split["test"]
+    print(f"Feature cache hit: {CACHE_DIR}")
 else:
-    Xtr, Xva, Xte = Xtr_w.tocsr(), Xva_w.tocsr(), Xte_w.tocsr()
+    # test split
+    gss1 = GroupShuffleSplit(n_splits=1, test_size=TEST_SIZE, random_state=SEED)
+    idx_tr, idx_te = next(gss1.split(df, groups=df["subject_id"]))
+
+    # val split inside train
+    gss2 = GroupShuffleSplit(n_splits=1, test_size=VAL_SIZE_WITHIN_TRAIN, random_state=SEED)
+    idx_tr2, idx_va = next(gss2.split(idx_tr, groups=df["subject_id"].to_numpy()[idx_tr]))
+    pos_tr, pos_va, pos_te = idx_tr[idx_tr2], idx_tr[idx_va], idx_te
+
+# Keep only rows with at least one kept label
+train = df.iloc[pos_tr[has_labels[pos_tr]]].reset_index(drop=True)
+val   = df.iloc[pos_va[has_labels[pos_va]]].reset_index(drop=True)
+test  = df.iloc[pos_te[has_labels[pos_te]]].reset_index(drop=True)
+print({"train": len(train), "val": len(val), "test": len(test)})
 
-# Binarize labels (fix order)
+# %% [5] VECTORIZATION — TF‑IDF (fit once, transform once, cache)
+import numpy as np
+from scipy import sparse
+import joblib
+
+def iter_text_batches(rows, batch_rows=STREAM_BATCH_ROWS, seed=None):
+    """Stream text_clean of the given file row positions, one Parquet row group at a time.
+
+    Yields (sel, texts): `sel` indexes into `rows`, `texts` are the truncated notes.
+    With `seed`, row groups and rows inside each group are visited in shuffled order.
+    """
+    pf = pq.ParquetFile(UNIFIED_PQT)
+    starts = np.cumsum([0] + [pf.metadata.row_group(g).num_rows for g in range(pf.num_row_groups)])
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows, kind="stable")
+    bounds = np.searchsorted(rows[order], starts)
+    groups = np.arange(pf.num_row_groups)
+    rng = np.random.default_rng(seed)
+    if seed is not None:
+        rng.shuffle(groups)
+    for g in groups:
+        sel = order[bounds[g]:bounds[g + 1]]
+        if len(sel) == 0:
+            continue
+        if seed is not None:
+            sel = rng.permutation(sel)
+        col = pf.read_row_group(g, columns=["text_clean"]).column(0)
+        for i in range(0, len(sel), batch_rows):
+            part = sel[i:i + batch_rows]
+            texts = col.take(rows[part] - starts[g]).to_pylist()
+            yield part, [truncate_tokens(t) for t in texts]
+
+def read_texts(rows):
+    """Texts of the given file row positions, in the same order (small row sets only)."""
+    out = [None] * len(rows)
+    for sel, texts in iter_text_batches(rows):
+        for i, t in zip(sel, texts):
+            out[i] = t
+    return out
+
+if TRAIN_MODE == "stream":
+    # Fixed vectorizer: fit vocabulary/idf once on a bounded sample of TRAIN docs
+    rng = np.random.default_rng(SEED)
+    fit_rows = rng.choice(train["row"].to_numpy(), size=min(STREAM_FIT_DOCS, len(train)), replace=False)
+    fit_texts = read_texts(fit_rows)
+    word_vec.fit(fit_texts)
+    if USE_CHAR_NGRAMS:
+        char_vec.fit(fit_texts)
+    del fit_texts
+    print(f"Stream mode: vectorizer fitted on {len(fit_rows)} train docs")
+
+    def vectorize(texts):
+        X = word_vec.transform(texts)
+        if char_vec is not None:
+            X = sparse.hstack([X, char_vec.transform(texts)], format="csr")
+        return X.tocsr()
+
+def save_csr(prefix, X):
+    """CSR as three plain .npy files (uncompressed, so they can be memory-mapped back)."""
+    np.save(f"{prefix}_data.npy", X.data)
+    np.save(f"{prefix}_indices.npy", X.indices)
+    np.save(f"{prefix}_indptr.npy", X.indptr)
+    return list(X.shape)
+
+def load_csr(prefix, shape):
+    """Memory-mapped read-only CSR: pages are only read from disk when rows are touched."""
+    return sparse.csr_matrix(
+        tuple(np.load(f"{prefix}_{name}.npy", mmap_mode="r") for name in ("data", "indices", "indptr")),
+        shape=tuple(shape), copy=False,
+    )
+
+# Fit on TRAIN ONLY (avoid leakage) — on every train row of the split, labelled or not
+# (stream mode never materializes Xtr/Xva/Xte; batches are vectorized inside the training loop)
+if cache_hit:
+    word_vec, char_vec = joblib.load(CACHE_DIR / "vectorizers.joblib")
+    shapes = json.loads((CACHE_DIR / "shapes.json").read_text())
+    Xtr, Xva, Xte = (load_csr(CACHE_DIR / name, shapes[name]) for name in ("Xtr", "Xva", "Xte"))
+elif TRAIN_MODE != "stream":
+    texts_tr = df["text_clean"].iloc[pos_tr]
+    texts_va = df["text_clean"].iloc[pos_va]
+    texts_te = df["text_clean"].iloc[pos_te]
+    word_vec.fit(texts_tr) 
+    Xtr_w = word_vec.transform(texts_tr) 
+    Xva_w = word_vec.transform(texts_va) 
+    Xte_w = word_vec.transform(texts_te) 
+
+    if USE_CHAR_NGRAMS:
+        char_vec.fit(texts_tr) 
+        Xtr_c = char_vec.transform(texts_tr) 
+        Xva_c = char_vec.transform(texts_va) 
+        Xte_c = char_vec.transform(texts_te) 
+        Xtr = sparse.hstack([Xtr_w, Xtr_c], format="csr")
+        Xva = sparse.hstack([Xva_w, Xva_c], format="csr")
+        Xte = sparse.hstack([Xte_w, Xte_c], format="csr")
+    else:
+        Xtr, Xva, Xte = Xtr_w.tocsr(), Xva_w.tocsr(), Xte_w.tocsr()
+
+    if CACHE_DIR is not None:
+        # Write to a temp dir, then rename: an interrupted run never leaves a half-written cache
+        tmp_dir = CACHE_DIR.with_name(CACHE_DIR.name + ".tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        shapes = {name: save_csr(tmp_dir / name, X) for name, X in (("Xtr", Xtr), ("Xva", Xva), ("Xte", Xte))}
+        (tmp_dir / "shapes.json").write_text(json.dumps(shapes))
+        np.savez(tmp_dir / "split.npz", train=pos_tr, val=pos_va, test=pos_te)
+        if VECTORIZER == "tfidf":
+            word_vec.stop_words_ = None
+        joblib.dump((word_vec, char_vec), tmp_dir / "vectorizers.joblib")
+        (tmp_dir / "done").touch()
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        os.replace(tmp_dir, CACHE_DIR)
+        print(f"Feature cache written: {CACHE_DIR}")
+
+if TRAIN_MODE != "stream" and not has_labels.all():
+    # Drop rows without kept labels (row selection copies only the rows that are used)
+    Xtr, Xva, Xte = Xtr[has_labels[pos_tr]], Xva[has_labels[pos_va]], Xte[has_labels[pos_te]]
+
+# Binarize labels (fix order); sparse in stream mode so Y stays small next to the batches
 from sklearn.preprocessing import MultiLabelBinarizer
-mlb = MultiLabelBinarizer()
+mlb = MultiLabelBinarizer(sparse_output=(TRAIN_MODE == "stream"))
 mlb.fit(train["labels"])  # establishes class order
 Ytr = mlb.transform(train["labels"]).astype("int8")
 Yva = mlb.transform(val["labels"]).astype("int8")
@@ -178,16 +361,14 @@ pos_counts = np.asarray(Ytr.sum(axis=0)).ravel() if hasattr(Ytr, "toarray") else
 mask_cols = pos_counts >= 2
 if mask_cols.sum() < len(mask_cols):
     kept_classes = mlb.classes_[mask_cols]
-    mlb = MultiLabelBinarizer(classes=kept_classes)
+    mlb = MultiLabelBinarizer(classes=kept_classes, sparse_output=(TRAIN_MODE == "stream"))
     mlb.fit([kept_classes])
     Ytr = mlb.transform(train["labels"]).astype("int8")
     Yva = mlb.transform(val["labels"]).astype("int8")
     Yte = mlb.transform(test["labels"]).astype("int8")
     print(f"Filtered labels with <2 positives in TRAIN: now {len(kept_classes)} classes")
 
-# Optionally cache
-# NOTE: skip caching giant sparse matrices to save disk/RAM on Kaggle free
-# (no X cache written)
+# X matrices are cached in PRECOMP_DIR above (USE_FEATURE_CACHE); labels are cheap to rebuild
 
 # %% [6] TRAIN — OneVsRest + SGD (logistic), early stopping
 from sklearn.linear_model import SGDClassifier
@@ -205,10 +386,52 @@ base = SGDClassifier(
     random_state=SEED,
 )
 
-clf = OneVsRestClassifier(base, n_jobs=N_JOBS, verbose=1)
-clf.fit(Xtr, Ytr)
+if TRAIN_MODE == "stream":
+    import time
+    from sklearn.base import clone
+    from sklearn.preprocessing import LabelBinarizer
+
+    # One binary head per label, updated with partial_fit on every streamed batch
+    # (early stopping needs the whole train set, so it is not used here)
+    base.set_params(early_stopping=False)
+    heads = [clone(base) for _ in range(Ytr.shape[1])]
+    Ytr = Ytr.tocsr()
+    train_rows = train["row"].to_numpy()
+    for epoch in range(STREAM_EPOCHS):
+        t0, seen = time.perf_counter(), 0
+        for sel, texts in iter_text_batches(train_rows, seed=SEED + epoch):
+            Xb = vectorize(texts)
+            Yb = Ytr[sel].toarray()
+            for j, head in enumerate(heads):
+                head.partial_fit(Xb, Yb[:, j], classes=[0, 1])
+            seen += len(sel)
+        print(f"Epoch {epoch + 1}/{STREAM_EPOCHS}: {seen} docs in {time.perf_counter() - t0:.1f}s")
+
+    # Wrap the heads as a fitted OneVsRestClassifier so saving/serving code is unchanged
+    clf = OneVsRestClassifier(base, n_jobs=N_JOBS)
+    clf.estimators_ = heads
+    clf.label_binarizer_ = LabelBinarizer(sparse_output=True).fit(Ytr)
+    clf.n_features_in_ = heads[0].n_features_in_
+elif N_JOBS > 1:
+    # Labels partitioned across processes; Xtr written once as float64 CSR and mmapped by every worker
+    import sys
+    if not (REPO_UTILS / "parallel_ovr.py").exists():
+        raise FileNotFoundError(f"N_JOBS > 1 needs utils/parallel_ovr.py (looked in {REPO_UTILS}); set N_JOBS = 1")
+    sys.path.append(str(REPO_UTILS))
+    from parallel_ovr import fit_ovr_parallel
+    clf = fit_ovr_parallel(base, Xtr, Ytr, n_workers=N_JOBS)
+else:
+    clf = OneVsRestClassifier(base, n_jobs=1, verbose=1)
+    clf.fit(Xtr, Ytr)
 
 # %% [7] SAVE ARTIFACTS (shrink to float32)
+# stop_words_ (terms pruned by max_features/min_df) is only kept for introspection and
+# can be larger than the vocabulary itself; drop it before pickling
+if VECTORIZER == "tfidf":
+    word_vec.stop_words_ = None
+if char_vec is not None:
+    char_vec.stop_words_ = None
+
 for est in getattr(clf, "estimators_", []):
     if hasattr(est, "coef_"):
         est.coef_ = est.coef_.astype("float32", copy=False)
@@ -223,6 +446,8 @@ joblib.dump({
     "cfg": {
         "WORD_NGRAM_RANGE": WORD_NGRAM_RANGE,
         "CHAR_NGRAM_RANGE": CHAR_NGRAM_RANGE,
+        "VECTORIZER": VECTORIZER,
+        "HASH_N_FEATURES": HASH_N_FEATURES,
         "MAX_FEATURES_WORD": MAX_FEATURES_WORD,
         "MAX_FEATURES_CHAR": MAX_FEATURES_CHAR,
         "SUBLINEAR_TF": SUBLINEAR_TF,
@@ -232,14 +457,39 @@ joblib.dump({
         "VAL_FRACTION": VAL_FRACTION,
         "TOPK": TOPK,
         "SEED": SEED,
+        "TRAIN_MODE": TRAIN_MODE,
     }
 }, CKPT_MODEL, compress=3)
 print("Saved model →", CKPT_MODEL)
 
-# %% [10] INFERENCE helper
+# %% [10] INFERENCE helper — fused scoring (one matrix product for all labels)
 import pandas as pd
+from scipy.special import expit
+
+def stack_ovr_weights(clf):
+    """Stack every head's coef_/intercept_ into W_T (features × labels, C-contiguous) and B."""
+    W_T = np.zeros((clf.n_features_in_, len(clf.estimators_)), dtype=np.float32)
+    B = np.zeros(len(clf.estimators_), dtype=np.float32)
+    for j, est in enumerate(clf.estimators_):
+        if hasattr(est, "coef_"):
+            W_T[:, j] = np.ravel(est.coef_)
+            B[j] = np.ravel(est.intercept_)[0]
+        else:  # _ConstantPredictor (label always 0 or always 1 in TRAIN)
+            B[j] = np.inf if float(est.y_[0]) > 0 else -np.inf
+    return W_T, B
+
+W_T, B = stack_ovr_weights(clf)
+
+def topk(P, K):
+    """Batch top-K: argpartition picks K candidates per row, then only those K are sorted."""
+    K = min(K, P.shape[1])
+    idx = np.argpartition(P, P.shape[1] - K, axis=1)[:, -K:]
+    probs = np.take_along_axis(P, idx, axis=1)
+    order = np.argsort(-probs, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(probs, order, axis=1)
 
 def predict_topk(texts, K=TOPK):
+    """Returns (codes, probs) arrays of shape (len(texts), K), highest probability first."""
     s = pd.Series(texts).map(truncate_tokens)
     Xw = word_vec.transform(s)
     if char_vec is not None:
@@ -248,34 +498,29 @@ def predict_topk(texts, K=TOPK):
         X = hstack([Xw, Xc], format="csr")
     else:
         X = Xw
-    P = clf.predict_proba(X)
-    codes = mlb.classes_
-    out = []
-    for i in range(len(texts)):
-        idx = np.argsort(-P[i])[:K]
-        out.append([(codes[j], float(P[i,j])) for j in idx])
-    return out
+    P = expit(X @ W_T + B)  # same as clf.predict_proba(X), without the per-head loop
+    idx, probs = topk(P, K)
+    return mlb.classes_[idx], probs
 
 # %% [11] DEMO & EXPORT small sample
 samples = [
     "Service: MEDICINE\nHistory: chest pain, HTN, DM, hyperlipidemia...",
     "Service: SURGERY\nPost-op day #2, fever, wound infection, antibiotics...",
 ]
-for i, preds in enumerate(predict_topk(samples, K=TOPK), 1):
+for i, (codes_i, probs_i) in enumerate(zip(*predict_topk(samples, K=TOPK)), 1):
     print(f"\nCase {i}:")
-    for code, prob in preds:
+    for code, prob in zip(codes_i, probs_i):
         print(f"  {code}: {prob:.3f}")
 
-# optional: export 50 predictions from TEST
-out = []
-for i in range(min(50, len(test))):
-    srow = test.iloc[i]
-    topk = predict_topk([srow["text_clean"]], K=TOPK)[0]
-    out.append({
-        "subject_id": srow["subject_id"],
-        "hadm_id": srow["hadm_id"],
-        "gold": ";".join(srow["labels"]),
-        "pred_topK": ";".join([f"{c}:{p:.3f}" for c,p in topk])
-    })
-pd.DataFrame(out).to_csv(WORK_DIR/"preds_sample.csv", index=False)
+# optional: export 50 predictions from TEST (scored as one batch)
+export = test.head(50)
+export_texts = export["text_clean"].tolist() if "text_clean" in export else read_texts(export["row"].to_numpy())
+codes_k, probs_k = predict_topk(export_texts, K=TOPK)
+out = pd.DataFrame({
+    "subject_id": export["subject_id"].values,
+    "hadm_id": export["hadm_id"].values,
+    "gold": export["labels"].map(";".join).values,
+    "pred_topK": [";".join(f"{c}:{p:.3f}" for c, p in zip(cr, pr)) for cr, pr in zip(codes_k, probs_k)],
+})
+out.to_csv(WORK_DIR/"preds_sample.csv", index=False)
 print("Saved:", WORK_DIR/"preds_sample.csv")
\ No newline at end of file
@@ -68,19 +68,8 @@ def calculate_fully_correct(gold_set: Set[str], pred_list: List[str]) -> bool:
     return gold_set.issubset(top_10_preds)
 
 
-def main():
-    """Hàm chính để tính toán các chỉ số đánh giá."""
-    print("=" * 60)
-    print("ĐÁNH GIÁ KẾT QUẢ DỰ ĐOÁN")
-    print("=" * 60)
-    
-    # Đọc file CSV
-    print(f"\nĐang đọc file: {PREDS_FILE}")
-    df = pd.read_csv(PREDS_FILE)
-    total_cases = len(df)
-    print(f"Tổng số ca kiểm tra: {total_cases}")
-    
-    # Tính toán các chỉ số
+def compute_metrics(gold_sets: List[Set[str]], pred_lists: List[List[str]]) -> dict:
+    """Tính Hit@1/3/5/10, số mã đúng và số ca đúng hoàn toàn cho danh sách (gold, pred)."""
     hit_at_1 = 0
     hit_at_3 = 0
     hit_at_5 = 0
@@ -88,10 +77,7 @@ def main():
     total_correct_codes = 0
     fully_correct_cases = 0
     
-    for idx, row in df.iterrows():
-        gold_set = parse_gold(row["gold"])
-        pred_list = parse_pred_topk(row["pred_topK"], top_k=10)
-        
+    for gold_set, pred_list in zip(gold_sets, pred_lists):
         # Tính Hit@K
         if calculate_hit_at_k(gold_set, pred_list, k=1):
             hit_at_1 += 1
@@ -110,6 +96,41 @@ def main():
         if calculate_fully_correct(gold_set, pred_list):
             fully_correct_cases += 1
     
+    return {
+        "total_cases": len(gold_sets),
+        "hit_at_1": hit_at_1,
+        "hit_at_3": hit_at_3,
+        "hit_at_5": hit_at_5,
+        "hit_at_10": hit_at_10,
+        "total_correct_codes": total_correct_codes,
+        "fully_correct_cases": fully_correct_cases,
+    }
+
+
+def main():
+    """Hàm chính để tính toán các chỉ số đánh giá."""
+    print("=" * 60)
+    print("ĐÁNH GIÁ KẾT QUẢ DỰ ĐOÁN")
+    print("=" * 60)
+    
+    # Đọc file CSV
+    print(f"\nĐang đọc file: {PREDS_FILE}")
+    df = pd.read_csv(PREDS_FILE)
+    total_cases = len(df)
+    print(f"Tổng số ca kiểm tra: {total_cases}")
+    
+    # Tính toán các chỉ số
+    metrics = compute_metrics(
+        [parse_gold(g) for g in df["gold"]],
+        [parse_pred_topk(p, top_k=10) for p in df["pred_topK"]],
+    )
+    hit_at_1 = metrics["hit_at_1"]
+    hit_at_3 = metrics["hit_at_3"]
+    hit_at_5 = metrics["hit_at_5"]
+    hit_at_10 = metrics["hit_at_10"]
+    total_correct_codes = metrics["total_correct_codes"]
+    fully_correct_cases = metrics["fully_correct_cases"]
+    
     # Tính tỷ lệ
     hit_at_1_pct = (hit_at_1 / total_cases) * 100
     hit_at_3_pct = (hit_at_3 / total_cases) * 100
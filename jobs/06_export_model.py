@@ -0,0 +1,158 @@
+"""
+Script để export model ovr_sgd_tfidf.joblib sang định dạng mảng (.npy) cho serving.
+Prune trọng số theo độ lớn (magnitude) cho từng nhãn, lưu dạng CSR, và in báo cáo
+bộ nhớ tiết kiệm được so với mức giảm Hit@K (dùng các chỉ số của 05_evaluate.py) trên các note
+held-out (tập val, hoặc test với --split test) của split theo bệnh nhân giống 04_train.py.
+
+Cách dùng:
+    python jobs/06_export_model.py                 # export với KEEP_FRACTION mặc định
+    python jobs/06_export_model.py --keep 0.2      # giữ 20% trọng số lớn nhất mỗi nhãn
+    python jobs/06_export_model.py --split test    # báo cáo Hit@K trên tập test
+    python jobs/06_export_model.py --no-report     # bỏ qua báo cáo Hit@K
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import joblib
+import pandas as pd
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+MODELS_DIR = BASE_DIR / "models"
+
+sys.path.append(str(BASE_DIR / "src"))
+sys.path.append(str(BASE_DIR / "utils"))
+from artifacts import export_artifacts, load_serving_model, prune_weights, weights_nbytes  # noqa: E402
+from eval_helpers import load_evaluate_module, load_heldout_sample  # noqa: E402
+from predict_worker import featurize  # noqa: E402
+from scoring import LinearOvRScorer, stack_ovr_weights, topk  # noqa: E402
+
+# File input / output
+MODEL_FILE = MODELS_DIR / "ovr_sgd_tfidf.joblib"
+OUTPUT_DIR = MODELS_DIR / "ovr_sgd_tfidf_arrays"
+EVAL_FILE = DATA_DIR / "proc" / "train_unified.parquet"
+REPORT_FILE = OUTPUT_DIR / "prune_report.csv"
+
+# Cấu hình
+KEEP_FRACTION = 0.1                          # tỉ lệ trọng số giữ lại mỗi nhãn khi export
+REPORT_KEEP_FRACTIONS = [1.0, 0.5, 0.2, 0.1, 0.05, 0.02]
+EVAL_SAMPLES = 2000                          # số note dùng để đo Hit@K
+SEED = 40
+
+
+def load_eval_set(split):
+    """Lấy mẫu note held-out + nhãn gold (chỉ giữ các mã có trong model) từ train_unified.parquet.
+
+    Feature được dựng bằng predict_worker.featurize trên model load như serving, nên cắt token và
+    ghép word/char giống hệt lúc dự đoán.
+    """
+    df = load_heldout_sample(EVAL_FILE, EVAL_SAMPLES, part=split, seed=SEED)
+    model = load_serving_model(str(MODEL_FILE))
+
+    known = set(model["classes"])
+    gold_sets = [set(str(c).split(";")) & known for c in df["icd_codes"]]
+    keep = [len(g) > 0 for g in gold_sets]
+    texts = df["text_clean"][keep].tolist()
+    gold_sets = [g for g, k in zip(gold_sets, keep) if k]
+
+    X = featurize(model, texts, model["cfg"].get("MAX_TOKENS_PER_DOC", 8000))
+    return X, gold_sets
+
+
+def prune_report(bundle, coef_T, intercept, split):
+    """So sánh bộ nhớ trọng số và Hit@K giữa model dense và các mức prune.
+
+    Cột export_format: "dense" khi CSR đã prune không nhỏ hơn dense — export_artifacts sẽ lưu
+    dense không prune ở mức đó.
+    """
+    evaluate = load_evaluate_module()
+    X, gold_sets = load_eval_set(split)
+    classes = bundle["mlb"].classes_
+    dense_bytes = weights_nbytes(coef_T)
+    print(f"   Số note đánh giá ({split}): {len(gold_sets):,}")
+
+    rows = []
+    for keep in REPORT_KEEP_FRACTIONS:
+        W = coef_T if keep >= 1.0 else prune_weights(coef_T, keep)
+        scorer = LinearOvRScorer(W, intercept)
+
+        t0 = time.perf_counter()
+        idx, _ = topk(scorer.predict_proba(X), 10)
+        elapsed = time.perf_counter() - t0
+
+        metrics = evaluate.compute_metrics(gold_sets, [list(r) for r in classes[idx]])
+        n = metrics["total_cases"]
+        rows.append({
+            "keep_fraction": keep,
+            "weights_mb": weights_nbytes(W) / 1024 / 1024,
+            "memory_saved_pct": (1 - weights_nbytes(W) / dense_bytes) * 100,
+            "export_format": "csr" if keep < 1.0 and weights_nbytes(W) < dense_bytes else "dense",
+            "hit@1": metrics["hit_at_1"] / n * 100,
+            "hit@3": metrics["hit_at_3"] / n * 100,
+            "hit@5": metrics["hit_at_5"] / n * 100,
+            "hit@10": metrics["hit_at_10"] / n * 100,
+            "avg_correct": metrics["total_correct_codes"] / n,
+            "score_ms_per_note": elapsed / n * 1000,
+        })
+
+    report = pd.DataFrame(rows)
+    base = report.iloc[0]
+    for k in ["hit@1", "hit@3", "hit@5", "hit@10"]:
+        report[f"{k}_drop"] = base[k] - report[k]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export model sang định dạng .npy (có prune)")
+    parser.add_argument("--keep", type=float, default=KEEP_FRACTION,
+                        help="Tỉ lệ trọng số giữ lại mỗi nhãn (1.0 = không prune)")
+    parser.add_argument("--split", choices=["val", "test"], default="val",
+                        help="Phần held-out dùng cho báo cáo Hit@K")
+    parser.add_argument("--no-report", action="store_true", help="Bỏ qua báo cáo Hit@K")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("EXPORT MODEL SANG ĐỊNH DẠNG .npy")
+    print("=" * 60)
+
+    if not MODEL_FILE.exists():
+        print(f"❌ File không tồn tại: {MODEL_FILE}")
+        return
+
+    print(f"\n📖 Đang đọc: {MODEL_FILE.name}")
+    bundle = joblib.load(MODEL_FILE)
+    coef_T, intercept = stack_ovr_weights(bundle["clf"])
+    print(f"   Shape trọng số (features × labels): {coef_T.shape}")
+    print(f"   Bộ nhớ dense: {weights_nbytes(coef_T) / 1024 / 1024:.1f} MB")
+
+    print(f"\n💾 Export (keep_fraction={args.keep}) → {OUTPUT_DIR}")
+    meta = export_artifacts(bundle, OUTPUT_DIR, keep_fraction=args.keep,
+                            coef_T=coef_T, intercept=intercept)
+    disk_mb = sum(p.stat().st_size for p in OUTPUT_DIR.glob("*") if p.is_file()) / 1024 / 1024
+    if meta["keep_fraction"] != args.keep:
+        print(f"   ⚠️  CSR đã prune không nhỏ hơn dense ở keep={args.keep}, đã lưu dense không prune")
+    print(f"   Số trọng số giữ lại: {meta['nnz']:,}")
+    print(f"   Kích thước thư mục: {disk_mb:.1f} MB (joblib gốc: {MODEL_FILE.stat().st_size / 1024 / 1024:.1f} MB)")
+
+    if not args.no_report:
+        if not EVAL_FILE.exists():
+            print(f"\n⚠️  Không có {EVAL_FILE}, bỏ qua báo cáo Hit@K")
+        else:
+            print("\n📊 Báo cáo bộ nhớ vs Hit@K:")
+            report = prune_report(bundle, coef_T, intercept, args.split)
+            print(report.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+            report.to_csv(REPORT_FILE, index=False)
+            print(f"\n✅ Đã lưu báo cáo: {REPORT_FILE}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+    print("\n💡 Serving: đặt MODEL_FORMAT=arrays để src/main.py load thư mục này")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Script dự đoán hàng loạt (offline) top-K mã ICD cho file Parquet có cột text_clean.
+Đọc input theo từng record batch (không load cả file), vectorize + chấm điểm từng batch lớn
+trên process pool, ghi dần kết quả ra Parquet và báo cáo tốc độ (rows/sec).
+
+Cách dùng:
+    python jobs/07_batch_predict.py                                  # train_unified.parquet
+    python jobs/07_batch_predict.py --input notes.parquet --output preds.parquet
+    python jobs/07_batch_predict.py --model-format arrays --workers 8 --batch-size 4096
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+MODELS_DIR = BASE_DIR / "models"
+
+sys.path.append(str(BASE_DIR / "src"))
+from artifacts import load_serving_model  # noqa: E402
+from predict_worker import predict_topk  # noqa: E402
+
+# File input / output
+INPUT_FILE = DATA_DIR / "proc" / "train_unified.parquet"
+OUTPUT_FILE = DATA_DIR / "proc" / "preds_topk.parquet"
+MODEL_FILE = MODELS_DIR / "ovr_sgd_tfidf.joblib"
+ARRAYS_DIR = MODELS_DIR / "ovr_sgd_tfidf_arrays"
+
+# Cấu hình
+TEXT_COLUMN = "text_clean"
+ID_COLUMNS = ["subject_id", "hadm_id"]       # giữ lại trong output nếu có trong input
+TOPK = 10
+BATCH_SIZE = 2048                            # số note mỗi batch gửi cho worker
+WORKERS = os.cpu_count() or 1
+LOG_EVERY = 10                               # in tiến độ sau mỗi N batch
+
+# Model dùng chung cho các worker (load trước khi fork, kế thừa copy-on-write / mmap)
+_MODEL = None
+
+
+def load_model(model_format):
+    """Load model giống src/main.py: bundle joblib hoặc thư mục mảng từ 06_export_model.py"""
+    return load_serving_model(str(ARRAYS_DIR if model_format == "arrays" else MODEL_FILE))
+
+
+def score_batch(texts, k):
+    """Top-K cho một batch note (chạy trong worker): (codes, probs) shape (n, k)"""
+    codes, probs = predict_topk(_MODEL, texts, k, _MODEL["cfg"].get("MAX_TOKENS_PER_DOC", 8000))
+    return codes.astype(str), probs.astype(np.float32)
+
+
+def output_schema(input_schema, id_columns, k):
+    """Schema output: các cột id của input + top-K mã / xác suất (fixed-size list)"""
+    return pa.schema(
+        [input_schema.field(c) for c in id_columns]
+        + [pa.field("pred_codes", pa.list_(pa.string(), k)), pa.field("pred_probs", pa.list_(pa.float32(), k))]
+    )
+
+
+def to_table(batch, schema, codes, probs):
+    """Ghép cột id của input với kết quả top-K (thứ tự xác suất giảm dần)"""
+    k = codes.shape[1]
+    columns = {c: batch.column(c) for c in schema.names[:-2]}
+    columns["pred_codes"] = pa.FixedSizeListArray.from_arrays(pa.array(codes.ravel(), pa.string()), k)
+    columns["pred_probs"] = pa.FixedSizeListArray.from_arrays(pa.array(probs.ravel(), pa.float32()), k)
+    return pa.table(columns, schema=schema)
+
+
+def main():
+    global _MODEL
+
+    parser = argparse.ArgumentParser(description="Dự đoán top-K ICD hàng loạt cho file Parquet")
+    parser.add_argument("--input", type=Path, default=INPUT_FILE)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--model-format", choices=["joblib", "arrays"], default="joblib")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--topk", type=int, default=TOPK)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DỰ ĐOÁN HÀNG LOẠT (BATCH INFERENCE)")
+    print("=" * 60)
+
+    if not args.input.exists():
+        print(f"❌ File không tồn tại: {args.input}")
+        return
+
+    print(f"\n📖 Đang load model ({args.model_format})...")
+    _MODEL = load_model(args.model_format)
+    print(f"   Số nhãn: {len(_MODEL['classes']):,}")
+
+    pf = pq.ParquetFile(args.input)
+    if TEXT_COLUMN not in pf.schema_arrow.names:
+        print(f"❌ Thiếu cột {TEXT_COLUMN} trong {args.input}")
+        return
+    id_columns = [c for c in ID_COLUMNS if c in pf.schema_arrow.names]
+    total = pf.metadata.num_rows
+    print(f"\n📖 Input: {args.input} ({total:,} dòng, {pf.num_row_groups} row group)")
+    print(f"   Workers: {args.workers}, batch size: {args.batch_size:,}, top-K: {args.topk}")
+
+    if total == 0:
+        print("   ⚠️  Input không có dòng nào, ghi file output rỗng (chỉ có schema)")
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    # Tạo writer trước khi đọc batch: input rỗng vẫn cho ra file Parquet hợp lệ với đúng schema
+    schema = output_schema(pf.schema_arrow, id_columns, args.topk)
+    writer = pq.ParquetWriter(args.output, schema)
+    batches = pf.iter_batches(batch_size=args.batch_size, columns=id_columns + [TEXT_COLUMN])
+
+    # fork: worker kế thừa _MODEL đã load, không phải load lại model trong từng process
+    ctx = multiprocessing.get_context("fork")
+    # Giới hạn số batch đang xử lý để bộ nhớ không phụ thuộc kích thước input;
+    # kết quả được ghi theo đúng thứ tự input
+    max_in_flight = 2 * args.workers
+    pending = deque()
+    done_rows = 0
+    done_batches = 0
+    t0 = time.perf_counter()
+
+    def write_next():
+        nonlocal done_rows, done_batches
+        batch, future = pending.popleft()
+        writer.write_table(to_table(batch, schema, *future.result()))
+        done_rows += batch.num_rows
+        done_batches += 1
+        if done_batches % LOG_EVERY == 0:
+            elapsed = time.perf_counter() - t0
+            print(f"   {done_rows:,}/{total:,} dòng — {done_rows / elapsed:,.0f} rows/sec")
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+            for batch in batches:
+                texts = batch.column(TEXT_COLUMN).to_pylist()
+                pending.append((batch, pool.submit(score_batch, texts, args.topk)))
+                if len(pending) >= max_in_flight:
+                    write_next()
+            while pending:
+                write_next()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - t0
+    print(f"\n✅ Đã dự đoán {done_rows:,} dòng trong {elapsed:.1f}s "
+          f"({done_rows / max(elapsed, 1e-9):,.0f} rows/sec)")
+    print(f"✅ Đã lưu: {args.output}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+So sánh các bundle model (vd. TF-IDF có từ điển và biến thể hashing từ 04_train.py với
+VECTORIZER = "hashing") về độ chính xác, độ trễ và bộ nhớ khi serving.
+
+Mỗi bundle (file joblib hoặc thư mục mảng từ 06_export_model.py) được load bằng
+load_serving_model (src/artifacts.py, cùng hàm src/main.py dùng) và đánh giá trên cùng một mẫu
+note held-out (tập val, hoặc test với --split test) của split theo bệnh nhân giống 04_train.py:
+    - load_s: thời gian load + dựng scorer/vectorizer serving
+    - bundle_mb: kích thước trên đĩa; vectorizer_mb / weights_mb: bộ nhớ mảng khi serving
+    - hit@K: dùng các chỉ số của 05_evaluate.py
+    - single_ms_p50/p95: độ trễ vectorize + chấm điểm một note; batch_notes_per_s: theo batch
+
+Cách dùng:
+    python jobs/08_compare_vectorizers.py models/ovr_sgd_tfidf.joblib models/ovr_sgd_hashing.joblib
+    python jobs/08_compare_vectorizers.py a.joblib b.joblib --samples 5000 --batch-size 512
+    python jobs/08_compare_vectorizers.py a.joblib b.joblib --split test
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+sys.path.append(str(BASE_DIR / "src"))
+sys.path.append(str(BASE_DIR / "utils"))
+from artifacts import load_serving_model, weights_nbytes  # noqa: E402
+from eval_helpers import load_evaluate_module, load_heldout_sample  # noqa: E402
+from predict_worker import predict_topk  # noqa: E402
+
+# File input / output
+EVAL_FILE = DATA_DIR / "proc" / "train_unified.parquet"
+REPORT_FILE = DATA_DIR / "proc" / "vectorizer_comparison.csv"
+
+# Cấu hình
+EVAL_SAMPLES = 2000                          # số note dùng để đo Hit@K / throughput
+LATENCY_SAMPLES = 200                        # số note đo độ trễ từng request
+BATCH_SIZE = 256
+SEED = 40
+
+
+def timed_load(path):
+    """Load bundle giống src/main.py (load_serving_model); trả về (model, thời gian load)"""
+    t0 = time.perf_counter()
+    model = load_serving_model(str(path))
+    return model, time.perf_counter() - t0
+
+
+def vectorizer_nbytes(word_vec) -> int:
+    """Số byte các mảng của vectorizer serving (từ điển hash + idf, hoặc chỉ idf)"""
+    n = word_vec.idf.nbytes
+    vocab = getattr(word_vec, "vocabulary", None)
+    if vocab is not None:
+        n += vocab.hashes.nbytes + vocab.index.nbytes
+    return n
+
+
+def bundle_mb(path):
+    """Kích thước trên đĩa (MB): file joblib hoặc tổng các file của thư mục mảng"""
+    path = Path(path)
+    files = [p for p in path.glob("*") if p.is_file()] if path.is_dir() else [path]
+    return sum(p.stat().st_size for p in files) / 1024 / 1024
+
+
+def score(model, texts):
+    """Top-10 mã ICD cho một list note bằng predict_topk mà src/main.py dùng khi serving"""
+    codes, _ = predict_topk(model, texts, 10, model["cfg"].get("MAX_TOKENS_PER_DOC", 8000))
+    return codes
+
+
+def compare(paths, df, batch_size):
+    evaluate = load_evaluate_module()
+    rows = []
+    for path in paths:
+        print(f"\n📖 {path}")
+        model, load_s = timed_load(path)
+        known = set(model["classes"])
+        gold_sets = [set(str(c).split(";")) & known for c in df["icd_codes"]]
+        keep = [len(g) > 0 for g in gold_sets]
+        texts = [t for t, k in zip(df["text_clean"], keep) if k]
+        gold_sets = [g for g, k in zip(gold_sets, keep) if k]
+
+        t0 = time.perf_counter()
+        preds = []
+        for start in range(0, len(texts), batch_size):
+            preds.extend(list(r) for r in score(model, texts[start:start + batch_size]))
+        batch_s = time.perf_counter() - t0
+
+        latencies = []
+        for text in texts[:LATENCY_SAMPLES]:
+            t0 = time.perf_counter()
+            score(model, [text])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        metrics = evaluate.compute_metrics(gold_sets, preds)
+        n = metrics["total_cases"]
+        rows.append({
+            "model": str(path),
+            "vectorizer": model["cfg"].get("VECTORIZER", "tfidf"),
+            "n_features": model["scorer"].n_features,
+            "load_s": load_s,
+            "bundle_mb": bundle_mb(path),
+            "vectorizer_mb": vectorizer_nbytes(model["word_vec"]) / 1024 / 1024,
+            "weights_mb": weights_nbytes(model["scorer"].coef_T) / 1024 / 1024,
+            "hit@1": metrics["hit_at_1"] / n * 100,
+            "hit@3": metrics["hit_at_3"] / n * 100,
+            "hit@5": metrics["hit_at_5"] / n * 100,
+            "hit@10": metrics["hit_at_10"] / n * 100,
+            "single_ms_p50": float(np.percentile(latencies, 50)),
+            "single_ms_p95": float(np.percentile(latencies, 95)),
+            "batch_notes_per_s": len(texts) / batch_s,
+        })
+        print(f"   {n:,} note, load {load_s:.2f}s")
+        del model
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh độ chính xác / độ trễ / bộ nhớ của các bundle model")
+    parser.add_argument("models", nargs="+", type=Path, help="Các file .joblib / thư mục mảng cần so sánh")
+    parser.add_argument("--eval-file", type=Path, default=EVAL_FILE)
+    parser.add_argument("--samples", type=int, default=EVAL_SAMPLES)
+    parser.add_argument("--split", choices=["val", "test"], default="val", help="Phần held-out dùng để đánh giá")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--output", type=Path, default=REPORT_FILE)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SO SÁNH VECTORIZER / MODEL")
+    print("=" * 60)
+
+    missing = [p for p in args.models + [args.eval_file] if not p.exists()]
+    if missing:
+        print(f"❌ File không tồn tại: {', '.join(map(str, missing))}")
+        return
+
+    df = load_heldout_sample(args.eval_file, args.samples, part=args.split, seed=SEED)
+    print(f"\n📖 Mẫu đánh giá: {len(df):,} note ({args.split}) từ {args.eval_file.name}")
+
+    report = compare(args.models, df, args.batch_size)
+    print("\n📊 Kết quả:")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    report.to_csv(args.output, index=False)
+    print(f"\n✅ Đã lưu: {args.output}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
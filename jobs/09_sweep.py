@@ -0,0 +1,354 @@
+"""
+Sweep hyperparameter cho OvR + SGD (các knob ở cell [1] của 04_train.py) trên process pool.
+
+Mỗi cấu hình vectorizer (WORD_NGRAM_RANGE × MAX_FEATURES_WORD) chỉ vectorize một lần; ma trận
+train/val được ghi dạng CSR .npy (utils/parallel_ovr.py) và mọi trial của nhóm đó mmap dùng
+chung, không copy. Các trial (ALPHA × MIN_LABEL_FREQ × MAX_LABELS) được xếp lịch sao cho tổng
+bộ nhớ ước tính của các trial đang chạy không vượt --memory-gb. Nhãn của một trial luôn là
+phần đầu của danh sách nhãn (sort theo tần suất giảm dần) nên Y cũng chỉ ghi một lần.
+
+Split theo bệnh nhân, lọc nhãn và vectorizer giống 04_train.py. Kết quả mỗi trial (Hit@K trên
+tập val, thời gian train, kích thước trọng số, độ trễ chấm điểm) được ghi dần vào một bảng
+CSV; cột `pareto` đánh dấu các trial không bị trial khác vượt cả về hit@5 lẫn weights_mb.
+
+Cách dùng:
+    python jobs/09_sweep.py --alpha 1e-5 3e-5 1e-4 --max-labels 1000 2000
+    python jobs/09_sweep.py --ngram 1,1 1,2 --max-features 200000 400000 --workers 4 --memory-gb 24
+    python jobs/09_sweep.py --limit 5000 --alpha 1e-5 1e-4        # chạy thử nhanh
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+from sklearn.multiclass import OneVsRestClassifier
+from sklearn.preprocessing import MultiLabelBinarizer
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+sys.path.append(str(BASE_DIR / "src"))
+sys.path.append(str(BASE_DIR / "utils"))
+from artifacts import weights_nbytes  # noqa: E402
+from eval_helpers import load_evaluate_module, split_positions  # noqa: E402
+from parallel_ovr import dump_shared, load_shared  # noqa: E402
+from scoring import LinearOvRScorer, stack_ovr_weights, topk  # noqa: E402
+
+# File input / output
+INPUT_FILE = DATA_DIR / "proc" / "train_unified.parquet"
+FREQ_FILE = DATA_DIR / "proc" / "icd_hadm_freq.csv"
+OUTPUT_FILE = DATA_DIR / "proc" / "sweep_results.csv"
+FEATURES_DIR = DATA_DIR / "proc" / "sweep_features"
+
+# Cấu hình cố định (giống 04_train.py)
+MAX_TOKENS_PER_DOC = 8000
+MIN_DF = 2
+SUBLINEAR_TF = True
+EARLY_STOP = True
+VAL_FRACTION = 0.1
+SEED = 40
+
+# Grid mặc định
+ALPHAS = [1e-5]
+MIN_LABEL_FREQS = [10]
+MAX_LABELS = [2000]
+NGRAM_RANGES = [(1, 2)]
+MAX_FEATURES_WORD = [400_000]
+
+LATENCY_SAMPLES = 100                        # số note val đo độ trễ chấm điểm từng note
+MEMORY_OVERHEAD = 300 * 1024 * 1024          # byte cộng thêm cho mỗi trial (interpreter, sklearn...)
+
+# Module 05_evaluate.py (load trước khi fork, worker kế thừa)
+_EVALUATE = None
+
+
+def truncate_tokens(text, mx=MAX_TOKENS_PER_DOC):
+    return " ".join(str(text).split()[:mx])
+
+
+def load_label_frequency(df, freq_file):
+    """(icd_full, hadm_freq) sort giảm dần theo tần suất: icd_hadm_freq.csv hoặc đếm từ df"""
+    if freq_file.exists():
+        freq = pd.read_csv(freq_file)
+    else:
+        codes = df["icd_codes_list"].explode()
+        freq = codes.value_counts().rename_axis("icd_full").reset_index(name="hadm_freq")
+    return freq.sort_values(["hadm_freq", "icd_full"], ascending=[False, True]).reset_index(drop=True)
+
+
+def estimate_trial_bytes(n_features, n_labels, nnz_train):
+    """Bộ nhớ ước tính của một trial: coef float64 của các head + ma trận gộp float32
+    + bản copy các dòng train có nhãn (trường hợp xấu nhất) + overhead"""
+    return n_features * n_labels * (8 + 4) + nnz_train * 12 + MEMORY_OVERHEAD
+
+
+def run_trial(trial):
+    """Train + đánh giá một trial trong worker; trả về một dòng của bảng kết quả"""
+    X, y_indices, y_indptr = load_shared(trial["train_dir"], trial["train_shape"])
+    n = trial["n_labels"]
+    Y = sparse.csc_matrix(
+        (np.ones(y_indptr[n], dtype=np.int8), y_indices[:y_indptr[n]], y_indptr[:n + 1]),
+        shape=(X.shape[0], n),
+    )
+    # Giống 04_train.py: bỏ nhãn có < 2 dòng dương tính, bỏ dòng không còn nhãn nào
+    cols = np.flatnonzero(np.diff(Y.indptr) >= 2)
+    Y = Y[:, cols].tocsr()
+    rows = np.flatnonzero(np.diff(Y.indptr) > 0)
+    if len(rows) < X.shape[0]:
+        X, Y = X[rows], Y[rows]
+
+    base = SGDClassifier(
+        loss="log_loss",
+        penalty="l2",
+        alpha=trial["alpha"],
+        learning_rate="optimal",
+        early_stopping=trial["early_stop"],
+        validation_fraction=VAL_FRACTION,
+        n_iter_no_change=3,
+        random_state=SEED,
+    )
+    t0 = time.perf_counter()
+    clf = OneVsRestClassifier(base, n_jobs=1).fit(X, Y)
+    train_s = time.perf_counter() - t0
+    scorer = LinearOvRScorer(*stack_ovr_weights(clf))
+    del clf, X, Y
+
+    # Đánh giá trên val: gold = các nhãn của trial
+    Xv, v_indices, v_indptr = load_shared(trial["val_dir"], trial["val_shape"])
+    Yv = sparse.csc_matrix(
+        (np.ones(v_indptr[n], dtype=np.int8), v_indices[:v_indptr[n]], v_indptr[:n + 1]),
+        shape=(Xv.shape[0], n),
+    )[:, cols].tocsr()
+    classes = np.asarray(trial["classes"], dtype=object)[cols]
+    rows_v = np.flatnonzero(np.diff(Yv.indptr) > 0)
+    Xv = Xv[rows_v]
+    gold_sets = [set(classes[Yv.indices[Yv.indptr[r]:Yv.indptr[r + 1]]]) for r in rows_v]
+    preds = []
+    for start in range(0, Xv.shape[0], 1024):
+        idx, _ = topk(scorer.predict_proba(Xv[start:start + 1024]), 10)
+        preds.extend(list(r) for r in classes[idx])
+    metrics = _EVALUATE.compute_metrics(gold_sets, preds)
+    total = max(metrics["total_cases"], 1)
+
+    latencies = []
+    for i in range(min(LATENCY_SAMPLES, Xv.shape[0])):
+        t0 = time.perf_counter()
+        topk(scorer.predict_proba(Xv[i:i + 1]), 10)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    return {
+        "ngram_range": trial["ngram_range"],
+        "max_features_word": trial["max_features"],
+        "alpha": trial["alpha"],
+        "min_label_freq": trial["min_label_freq"],
+        "max_labels": trial["max_labels"],
+        "n_labels": len(cols),
+        "n_features": scorer.n_features,
+        "train_rows": len(rows),
+        "val_rows": metrics["total_cases"],
+        "train_s": train_s,
+        "weights_mb": weights_nbytes(scorer.coef_T) / 1024 / 1024,
+        "hit@1": metrics["hit_at_1"] / total * 100,
+        "hit@3": metrics["hit_at_3"] / total * 100,
+        "hit@5": metrics["hit_at_5"] / total * 100,
+        "hit@10": metrics["hit_at_10"] / total * 100,
+        "vectorize_ms_per_note": trial["vectorize_ms"],
+        "score_ms_p50": float(np.percentile(latencies, 50)) if latencies else float("nan"),
+        "score_ms_p95": float(np.percentile(latencies, 95)) if latencies else float("nan"),
+        "est_memory_mb": trial["est_bytes"] / 1024 / 1024,
+    }
+
+
+def mark_pareto(results):
+    """pareto = True nếu không trial nào có hit@5 >= và weights_mb <= (tốt hơn ở ít nhất một chỉ số)"""
+    hit = results["hit@5"].to_numpy()
+    size = results["weights_mb"].to_numpy()
+    dominated = [
+        bool(np.any((hit >= h) & (size <= s) & ((hit > h) | (size < s))))
+        for h, s in zip(hit, size)
+    ]
+    results["pareto"] = ~np.array(dominated, dtype=bool)
+    return results
+
+
+def vectorize_group(df, pos_tr, pos_va, Y_tr, Y_va, ngram_range, max_features, out_dir):
+    """Fit TF-IDF trên train, ghi X/Y train và val cho các worker mmap; trả về thông tin nhóm"""
+    vec = TfidfVectorizer(
+        ngram_range=ngram_range,
+        max_features=max_features,
+        min_df=MIN_DF,
+        sublinear_tf=SUBLINEAR_TF,
+        norm="l2",
+        dtype=np.float32,
+    )
+    texts_tr = df["text_clean"].iloc[pos_tr]
+    texts_va = df["text_clean"].iloc[pos_va]
+    Xtr = vec.fit_transform(texts_tr)
+    Xva = vec.transform(texts_va)
+
+    # Độ trễ vectorize từng note (chỉ phụ thuộc vectorizer, dùng chung cho các trial của nhóm)
+    sample = texts_va.head(LATENCY_SAMPLES).tolist()
+    t0 = time.perf_counter()
+    for text in sample:
+        vec.transform([text])
+    vectorize_ms = (time.perf_counter() - t0) * 1000 / max(len(sample), 1)
+
+    train_dir, val_dir = out_dir / "train", out_dir / "val"
+    return {
+        "train_dir": str(train_dir),
+        "val_dir": str(val_dir),
+        "train_shape": dump_shared(Xtr, Y_tr, train_dir),
+        "val_shape": dump_shared(Xva, Y_va, val_dir),
+        "nnz_train": Xtr.nnz,
+        "vectorize_ms": vectorize_ms,
+    }
+
+
+def parse_ngram(value):
+    lo, hi = (int(v) for v in value.split(","))
+    return (lo, hi)
+
+
+def main():
+    global _EVALUATE
+
+    total_ram = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    parser = argparse.ArgumentParser(description="Sweep hyperparameter OvR + SGD trên process pool")
+    parser.add_argument("--alpha", type=float, nargs="+", default=ALPHAS)
+    parser.add_argument("--min-label-freq", type=int, nargs="+", default=MIN_LABEL_FREQS)
+    parser.add_argument("--max-labels", type=int, nargs="+", default=MAX_LABELS)
+    parser.add_argument("--ngram", type=parse_ngram, nargs="+", default=NGRAM_RANGES, help="vd. 1,2")
+    parser.add_argument("--max-features", type=int, nargs="+", default=MAX_FEATURES_WORD)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--memory-gb", type=float, default=total_ram * 0.7 / 1024 ** 3,
+                        help="Tổng bộ nhớ ước tính tối đa của các trial chạy đồng thời")
+    parser.add_argument("--limit", type=int, default=None, help="Chỉ dùng N note (chạy thử)")
+    parser.add_argument("--input", type=Path, default=INPUT_FILE)
+    parser.add_argument("--freq-file", type=Path, default=FREQ_FILE)
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--features-dir", type=Path, default=FEATURES_DIR)
+    parser.add_argument("--keep-features", action="store_true", help="Giữ lại ma trận đã vectorize")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("SWEEP HYPERPARAMETER OvR + SGD")
+    print("=" * 60)
+
+    if not args.input.exists():
+        print(f"❌ File không tồn tại: {args.input}")
+        return
+
+    print(f"\n📖 Đang đọc: {args.input}")
+    df = pd.read_parquet(args.input, columns=["subject_id", "icd_codes", "text_clean"])
+    if args.limit is not None and len(df) > args.limit:
+        df = df.sample(args.limit, random_state=SEED).reset_index(drop=True)
+    df["text_clean"] = df["text_clean"].map(truncate_tokens)
+    df["icd_codes_list"] = df["icd_codes"].astype(str).str.split(";")
+    print(f"   {len(df):,} note")
+
+    # Nhãn của mọi trial là phần đầu của danh sách này (sort theo tần suất giảm dần)
+    freq = load_label_frequency(df, args.freq_file)
+    freq = freq[freq["hadm_freq"] >= min(args.min_label_freq)].head(max(args.max_labels))
+    classes = freq["icd_full"].tolist()
+    if not classes:
+        print(f"❌ Không có nhãn nào có tần suất >= {min(args.min_label_freq)}")
+        return
+    known = set(classes)
+    labels = df["icd_codes_list"].map(lambda L: [c for c in L if c in known])
+    mlb = MultiLabelBinarizer(classes=classes, sparse_output=True).fit([classes])
+
+    pos_tr, pos_va, _ = split_positions(df["subject_id"])
+    Y_tr = mlb.transform(labels.iloc[pos_tr])
+    Y_va = mlb.transform(labels.iloc[pos_va])
+    print(f"   Train: {len(pos_tr):,}, val: {len(pos_va):,}, nhãn tối đa: {len(classes):,}")
+
+    def n_labels_for(min_freq, max_labels):
+        return int(min(max_labels, (freq["hadm_freq"] >= min_freq).sum()))
+
+    trials_per_group = list(itertools.product(args.alpha, args.min_label_freq, args.max_labels))
+    groups = list(itertools.product(args.ngram, args.max_features))
+    print(f"\n📊 {len(groups)} nhóm vectorizer × {len(trials_per_group)} trial = "
+          f"{len(groups) * len(trials_per_group)} trial")
+    budget = args.memory_gb * 1024 ** 3
+    print(f"   Workers: {args.workers}, bộ nhớ tối đa: {args.memory_gb:.1f} GB")
+
+    _EVALUATE = load_evaluate_module()
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    running = {}          # future → (trial, group_key)
+    remaining = {}        # group_key → số trial chưa xong (xoá ma trận khi về 0)
+    used = 0
+    t_start = time.perf_counter()
+
+    def collect(done):
+        nonlocal used
+        for future in done:
+            trial, key = running.pop(future)
+            used -= trial["est_bytes"]
+            row = future.result()
+            results.append(row)
+            print(f"   ✅ ngram={row['ngram_range']} feat={row['max_features_word']} alpha={row['alpha']:g} "
+                  f"labels={row['n_labels']} → hit@5 {row['hit@5']:.2f}%, {row['train_s']:.1f}s")
+            remaining[key] -= 1
+            if remaining[key] == 0 and not args.keep_features:
+                shutil.rmtree(args.features_dir / key, ignore_errors=True)
+            report = mark_pareto(pd.DataFrame(results))
+            args.output.parent.mkdir(parents=True, exist_ok=True)
+            report.to_csv(args.output, index=False)
+
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+        for ngram_range, max_features in groups:
+            key = f"ngram{ngram_range[0]}{ngram_range[1]}_feat{max_features}"
+            print(f"\n📖 Vectorize nhóm {key}...")
+            # Vectorize nhóm tiếp theo trong khi các worker vẫn train trial của nhóm trước
+            group = vectorize_group(df, pos_tr, pos_va, Y_tr, Y_va, ngram_range, max_features,
+                                    args.features_dir / key)
+            print(f"   Shape train: {group['train_shape']}, nnz: {group['nnz_train']:,}")
+            remaining[key] = len(trials_per_group)
+
+            for alpha, min_freq, max_labels in trials_per_group:
+                n_labels = n_labels_for(min_freq, max_labels)
+                trial = dict(group, alpha=alpha, min_label_freq=min_freq, max_labels=max_labels,
+                             n_labels=n_labels, classes=classes[:n_labels],
+                             ngram_range=f"{ngram_range[0]},{ngram_range[1]}", max_features=max_features,
+                             early_stop=(EARLY_STOP and args.limit is None))
+                trial["est_bytes"] = estimate_trial_bytes(group["train_shape"][1], n_labels, group["nnz_train"])
+                if trial["est_bytes"] > budget:
+                    print(f"   ⚠️  Trial alpha={alpha:g} labels={n_labels} ước tính "
+                          f"{trial['est_bytes'] / 1024 ** 3:.1f} GB > ngân sách, chạy riêng")
+                # Chờ đến khi đủ bộ nhớ (hoặc không còn trial nào đang chạy)
+                while running and (used + trial["est_bytes"] > budget or len(running) >= args.workers):
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+                running[pool.submit(run_trial, trial)] = (trial, key)
+                used += trial["est_bytes"]
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    report = mark_pareto(pd.DataFrame(results)).sort_values("hit@5", ascending=False)
+    report.to_csv(args.output, index=False)
+    print(f"\n📊 Kết quả ({len(report)} trial, {time.perf_counter() - t_start:.1f}s):")
+    print(report.to_string(index=False, float_format=lambda v: f"{v:.3g}"))
+    print(f"\n✅ Đã lưu: {args.output}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+Benchmark đường inference của một bundle model (không cần dữ liệu MIMIC: note được sinh ngẫu
+nhiên từ từ điển của chính model).
+
+Load model và tra tên ICD bằng chính các hàm src/main.py dùng (load_serving_model, load_icd_titles,
+icd_title trong src/artifacts.py; joblib hoặc thư mục mảng từ 06_export_model.py) và đo:
+    - load: thời gian load, RSS trước / sau khi load
+    - single: độ trễ một request theo độ dài note (tới MAX_TOKENS_PER_DOC), p50/p95/p99 của
+      từng bước: truncate, vectorize, score, topk, title (tra tên ICD) và end_to_end (đúng hàm
+      predict_topk mà src/main.py dùng: cắt token ngay trong transform)
+    - batch: throughput (note/s) theo batch size, thời gian mỗi bước tính trên một note
+Kết quả ghi ra JSON; --baseline so sánh với một file JSON của lần chạy trước.
+
+Cách dùng:
+    python jobs/10_benchmark_inference.py
+    python jobs/10_benchmark_inference.py --model-format arrays --output bench_arrays.json
+    python jobs/10_benchmark_inference.py --baseline data/proc/bench_inference.json --repeats 200
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import scipy
+import sklearn
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+MODELS_DIR = BASE_DIR / "models"
+
+sys.path.append(str(BASE_DIR / "src"))
+from artifacts import icd_title, load_icd_titles, load_serving_model  # noqa: E402
+from predict_worker import predict_topk  # noqa: E402
+from scoring import topk  # noqa: E402
+from vectorizer import truncate_tokens  # noqa: E402
+
+# File input / output
+OUTPUT_FILE = DATA_DIR / "proc" / "bench_inference.json"
+ICD_FILES = [                                # file tên ICD, giống load_icd_mapping() của src/main.py
+    MODELS_DIR / "d_icd_diagnoses.csv.gz",
+    DATA_DIR / "mimiciv" / "3.1" / "hosp" / "d_icd_diagnoses.csv.gz",
+    DATA_DIR / "proc" / "d_icd_diagnoses.csv.gz",
+]
+
+# Cấu hình
+TOPK = 10                                    # giống TOPK của src/main.py
+NOTE_LENGTHS = [50, 200, 1000, 4000, 8000]   # số token mỗi note (cắt ở MAX_TOKENS_PER_DOC của model)
+BATCH_SIZES = [1, 8, 32, 128, 512]
+BATCH_NOTE_LENGTH = 1000
+REPEATS = 100                                # số request đo cho mỗi độ dài note
+SEED = 40
+STAGES = ["truncate", "vectorize", "score", "topk", "title"]
+
+# Từ dùng thêm khi model không có từ điển (hashing) hoặc để có token ngoài từ điển
+FILLER_WORDS = (
+    "patient admitted with history of chest pain shortness breath fever cough nausea vomiting "
+    "abdominal pain hypertension diabetes mellitus chronic kidney disease heart failure atrial "
+    "fibrillation pneumonia sepsis discharged home stable condition follow up medications daily"
+).split()
+
+
+def rss_mb():
+    """RSS hiện tại (MB): /proc/self/status trên Linux, nếu không có thì dùng ru_maxrss"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_model(model_format, models_dir):
+    """Load model bằng load_serving_model của src/main.py; trả về (model, terms) — terms dùng để sinh note"""
+    name = "ovr_sgd_tfidf_arrays" if model_format == "arrays" else "ovr_sgd_tfidf.joblib"
+    model = load_serving_model(str(models_dir / name), with_terms=True)
+    return model, model.pop("terms")
+
+
+def load_title_map(icd_file, classes):
+    """{(version, code): long_title} từ d_icd_diagnoses; không có file thì sinh tên giả cho các nhãn"""
+    candidates = [icd_file] if icd_file is not None else ICD_FILES
+    for path in candidates:
+        if path.exists():
+            return load_icd_titles(path), str(path)
+    title_map = {}
+    for code in classes:
+        ver, c = str(code).split("-", 1)
+        title_map[(int(ver), c)] = f"Synthetic title for {code}"
+    return title_map, None
+
+
+def make_word_pool(terms):
+    """Unigram của từ điển model (+ từ thông dụng), thứ tự ngẫu nhiên để tần suất kiểu Zipf"""
+    words = sorted({t for t in terms if " " not in t} | set(FILLER_WORDS))
+    rng = np.random.default_rng(SEED)
+    return np.array(words, dtype=object)[rng.permutation(len(words))]
+
+
+def make_notes(pool, n_tokens, count, rng):
+    """`count` note tổng hợp, mỗi note `n_tokens` token (tần suất từ theo phân phối Zipf)"""
+    notes = []
+    for _ in range(count):
+        ids = np.minimum(rng.zipf(1.3, size=n_tokens) - 1, len(pool) - 1)
+        notes.append("Service: MEDICINE\n" + " ".join(pool[ids]))
+    return notes
+
+
+def predict_stages(model, title_map, texts, max_tokens):
+    """Chạy từng bước của một request / batch, trả về {bước: giây}"""
+    t = {}
+    t0 = time.perf_counter()
+    truncated = [truncate_tokens(str(s), max_tokens) for s in texts]
+    t["truncate"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    X = model["word_vec"].transform(truncated)
+    if model["char_vec"] is not None:
+        from scipy.sparse import hstack
+        X = hstack([X, model["char_vec"].transform(truncated)], format="csr")
+    t["vectorize"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    P = model["scorer"].predict_proba(X)
+    t["score"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    idx, probs = topk(P, TOPK)
+    codes = model["classes"][idx]
+    t["topk"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    [[icd_title(title_map, c) for c in row] for row in codes]
+    t["title"] = time.perf_counter() - t0
+    return t
+
+
+def predict_end_to_end(model, title_map, texts, max_tokens):
+    """Đường serving của src/main.py: predict_worker.predict_topk + tra tên như format_predictions"""
+    codes, _ = predict_topk(model, texts, TOPK, max_tokens)
+    return [[icd_title(title_map, c) for c in row] for row in codes]
+
+
+def percentiles(values_s):
+    ms = np.asarray(values_s) * 1000
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def bench_single(model, title_map, pool, max_tokens, repeats):
+    rng = np.random.default_rng(SEED)
+    results = []
+    for n_tokens in sorted({min(n, max_tokens) for n in NOTE_LENGTHS}):
+        notes = make_notes(pool, n_tokens, repeats, rng)
+        predict_end_to_end(model, title_map, notes[:1], max_tokens)  # warm-up
+        stage_times = {s: [] for s in STAGES}
+        e2e = []
+        for note in notes:
+            for stage, sec in predict_stages(model, title_map, [note], max_tokens).items():
+                stage_times[stage].append(sec)
+            t0 = time.perf_counter()
+            predict_end_to_end(model, title_map, [note], max_tokens)
+            e2e.append(time.perf_counter() - t0)
+        row = {"tokens": n_tokens, "requests": repeats, "end_to_end": percentiles(e2e)}
+        row.update({s: percentiles(v) for s, v in stage_times.items()})
+        results.append(row)
+        print(f"   {n_tokens:>5} token: p50 {row['end_to_end']['p50_ms']:.2f} ms, "
+              f"p95 {row['end_to_end']['p95_ms']:.2f} ms")
+    return results
+
+
+def bench_batch(model, title_map, pool, max_tokens, n_notes):
+    rng = np.random.default_rng(SEED + 1)
+    n_tokens = min(BATCH_NOTE_LENGTH, max_tokens)
+    notes = make_notes(pool, n_tokens, n_notes, rng)
+    results = []
+    for batch_size in BATCH_SIZES:
+        stage_totals = dict.fromkeys(STAGES, 0.0)
+        t0 = time.perf_counter()
+        for start in range(0, len(notes), batch_size):
+            predict_end_to_end(model, title_map, notes[start:start + batch_size], max_tokens)
+        elapsed = time.perf_counter() - t0
+        for start in range(0, len(notes), batch_size):
+            for stage, sec in predict_stages(model, title_map, notes[start:start + batch_size], max_tokens).items():
+                stage_totals[stage] += sec
+        row = {"batch_size": batch_size, "tokens": n_tokens, "notes": len(notes),
+               "notes_per_s": len(notes) / elapsed}
+        row.update({f"{s}_ms_per_note": total * 1000 / len(notes) for s, total in stage_totals.items()})
+        results.append(row)
+        print(f"   batch {batch_size:>4}: {row['notes_per_s']:,.0f} note/s")
+    return results
+
+
+def compare_baseline(result, baseline):
+    """In thay đổi (%) của p50 end-to-end và throughput so với lần chạy trước"""
+    print("\n📊 So với baseline (+ là chậm hơn / throughput thấp hơn):")
+    old_single = {r["tokens"]: r for r in baseline.get("single", [])}
+    for row in result["single"]:
+        old = old_single.get(row["tokens"])
+        if old:
+            new_ms, old_ms = row["end_to_end"]["p50_ms"], old["end_to_end"]["p50_ms"]
+            print(f"   single {row['tokens']:>5} token p50: {old_ms:.2f} → {new_ms:.2f} ms "
+                  f"({(new_ms / old_ms - 1) * 100:+.1f}%)")
+    old_batch = {r["batch_size"]: r for r in baseline.get("batch", [])}
+    for row in result["batch"]:
+        old = old_batch.get(row["batch_size"])
+        if old:
+            print(f"   batch {row['batch_size']:>4}: {old['notes_per_s']:,.0f} → {row['notes_per_s']:,.0f} note/s "
+                  f"({(1 - row['notes_per_s'] / old['notes_per_s']) * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference của bundle model với note tổng hợp")
+    parser.add_argument("--model-format", choices=["joblib", "arrays"], default="joblib")
+    parser.add_argument("--models-dir", type=Path, default=MODELS_DIR)
+    parser.add_argument("--icd-file", type=Path, default=None, help="d_icd_diagnoses.csv.gz (mặc định tự tìm)")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="Số request đo cho mỗi độ dài note")
+    parser.add_argument("--batch-notes", type=int, default=1024, help="Số note cho phần đo throughput")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    parser.add_argument("--baseline", type=Path, default=None, help="JSON của lần chạy trước để so sánh")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("BENCHMARK INFERENCE")
+    print("=" * 60)
+
+    print(f"\n📖 Đang load model ({args.model_format}) từ {args.models_dir}...")
+    rss_before = rss_mb()
+    t0 = time.perf_counter()
+    model, terms = load_model(args.model_format, args.models_dir)
+    load_s = time.perf_counter() - t0
+    rss_after = rss_mb()
+    title_map, icd_source = load_title_map(args.icd_file, model["classes"])
+    max_tokens = model["cfg"].get("MAX_TOKENS_PER_DOC", 8000)
+    print(f"   {load_s:.2f}s, RSS {rss_before:.0f} → {rss_after:.0f} MB")
+    print(f"   Số nhãn: {model['scorer'].n_labels:,}, số feature: {model['scorer'].n_features:,}")
+    if icd_source is None:
+        print("   ⚠️  Không có d_icd_diagnoses.csv.gz, dùng tên ICD giả")
+
+    pool = make_word_pool(terms)
+    print(f"\n📊 Độ trễ một request ({args.repeats} request / độ dài):")
+    single = bench_single(model, title_map, pool, max_tokens, args.repeats)
+    print(f"\n📊 Throughput theo batch ({args.batch_notes} note, {min(BATCH_NOTE_LENGTH, max_tokens)} token):")
+    batch = bench_batch(model, title_map, pool, max_tokens, args.batch_notes)
+
+    result = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model": {
+            "format": args.model_format,
+            "models_dir": str(args.models_dir),
+            "vectorizer": type(model["word_vec"]).__name__,
+            "n_features": model["scorer"].n_features,
+            "n_labels": model["scorer"].n_labels,
+            "max_tokens": max_tokens,
+            "word_pool": len(pool),
+            "title_source": icd_source,
+        },
+        "env": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "sklearn": sklearn.__version__,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+        },
+        "load": {"seconds": load_s, "rss_mb_before": rss_before, "rss_mb_after": rss_after,
+                 "rss_mb_delta": rss_after - rss_before, "rss_mb_end": rss_mb()},
+        "single": single,
+        "batch": batch,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    print(f"\n✅ Đã lưu: {args.output}")
+
+    if args.baseline is not None:
+        if args.baseline.exists():
+            with open(args.baseline, encoding="utf-8") as f:
+                compare_baseline(result, json.load(f))
+        else:
+            print(f"\n⚠️  Không thấy baseline: {args.baseline}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+"""
+Load test HTTP cho FastAPI app: bắn /predict, /translate/en-vi, /translate/vi-en đồng thời
+theo tỉ lệ cấu hình được và báo cáo throughput, histogram độ trễ, tỉ lệ lỗi theo từng endpoint
+cho từng số uvicorn worker — dùng để ước lượng số replica cho production.
+
+Với mỗi giá trị --workers, script tự khởi động `uvicorn loadtest_app:app` (src/main.py với
+backend dịch giả lập utils/loadtest_app.py, không gọi Google) trên một port trống, chờ server
+sẵn sàng, chạy warm-up rồi đo trong --duration giây với --concurrency client (mỗi client một
+kết nối keep-alive, gửi request kế tiếp ngay khi nhận response). --url để đo một server có sẵn.
+
+Cách dùng:
+    python jobs/11_load_test.py                                   # workers 1, 2, 4
+    python jobs/11_load_test.py --workers 1 2 --concurrency 32 --duration 30
+    python jobs/11_load_test.py --mix predict=1                   # chỉ /predict
+    python jobs/11_load_test.py --translate-latency-ms 150 --translate-error-rate 0.01
+    python jobs/11_load_test.py --url http://localhost:3000       # server đang chạy sẵn
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+OUTPUT_FILE = BASE_DIR / "data" / "proc" / "load_test.json"
+
+# Endpoint → path
+ENDPOINTS = {
+    "predict": "/predict",
+    "translate_en_vi": "/translate/en-vi",
+    "translate_vi_en": "/translate/vi-en",
+}
+
+# Cấu hình
+DEFAULT_MIX = "predict=0.6,translate_en_vi=0.2,translate_vi_en=0.2"
+WORKER_COUNTS = [1, 2, 4]
+CONCURRENCY = 16
+DURATION_S = 20
+WARMUP_S = 3
+REQUEST_TIMEOUT_S = 30
+STARTUP_TIMEOUT_S = 180                      # load model có thể mất vài chục giây
+CACHE_HIT_RATIO = 0.2                        # tỉ lệ request lặp lại payload cũ (trúng cache của server)
+NOTE_TOKENS = (50, 1000)                     # số token mỗi note /predict (min, max)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+SEED = 40
+
+EN_WORDS = (
+    "patient presents with chest pain shortness of breath fatigue fever cough nausea vomiting "
+    "abdominal pain headache dizziness history of hypertension diabetes kidney disease heart "
+    "failure atrial fibrillation pneumonia sepsis admitted discharged stable condition follow up"
+).split()
+VI_WORDS = (
+    "bệnh nhân đau ngực khó thở mệt mỏi sốt ho buồn nôn nôn đau bụng đau đầu chóng mặt tiền sử "
+    "tăng huyết áp tiểu đường bệnh thận suy tim rung nhĩ viêm phổi nhiễm trùng nhập viện xuất viện"
+).split()
+
+
+def parse_mix(value):
+    """'predict=0.6,translate_en_vi=0.4' → {endpoint: trọng số đã chuẩn hoá}"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Endpoint không hợp lệ: {name} ({', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    total = sum(mix.values())
+    if total <= 0:
+        raise argparse.ArgumentTypeError("Tổng trọng số phải > 0")
+    return {name: w / total for name, w in mix.items() if w > 0}
+
+
+class PayloadFactory:
+    """Sinh body JSON cho từng endpoint; một phần request lặp lại payload cũ (cache hit)"""
+
+    def __init__(self, cache_hit_ratio, seed):
+        self.cache_hit_ratio = cache_hit_ratio
+        self.rng = random.Random(seed)
+        self.seen = {name: [] for name in ENDPOINTS}
+
+    def _new(self, endpoint):
+        rng = self.rng
+        if endpoint == "predict":
+            n = rng.randint(*NOTE_TOKENS)
+            notes = " ".join(rng.choice(EN_WORDS) for _ in range(n))
+            return {"age": rng.randint(18, 90), "gender": rng.choice(["M", "F"]), "notes": notes}
+        words = EN_WORDS if endpoint == "translate_en_vi" else VI_WORDS
+        return {"text": " ".join(rng.choice(words) for _ in range(rng.randint(3, 20)))}
+
+    def make(self, endpoint):
+        seen = self.seen[endpoint]
+        if seen and self.rng.random() < self.cache_hit_ratio:
+            return self.rng.choice(seen)
+        body = json.dumps(self._new(endpoint)).encode("utf-8")
+        if len(seen) < 1000:
+            seen.append(body)
+        return body
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, port, args):
+    """uvicorn loadtest_app:app (src/main.py + backend dịch giả lập) trong process group riêng"""
+    env = dict(os.environ)
+    env["TRANSLATION_BACKEND"] = "fake"
+    env["FAKE_TRANSLATE_LATENCY_MS"] = str(args.translate_latency_ms)
+    env["FAKE_TRANSLATE_JITTER_MS"] = str(args.translate_jitter_ms)
+    env["FAKE_TRANSLATE_ERROR_RATE"] = str(args.translate_error_rate)
+    cmd = [
+        sys.executable, "-m", "uvicorn", "loadtest_app:app",
+        "--app-dir", str(BASE_DIR / "utils"),
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    return subprocess.Popen(cmd, env=env, cwd=BASE_DIR, start_new_session=True)
+
+
+def wait_ready(host, port, proc, timeout):
+    """Chờ GET / trả 200 (server đã import xong app + load model)"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"Server thoát sớm (exit code {proc.returncode})")
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=2)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Server không sẵn sàng sau {timeout}s")
+
+
+def stop_server(proc):
+    if proc is None or proc.poll() is not None:
+        return
+    os.killpg(proc.pid, signal.SIGTERM)
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def client_loop(host, port, mix, factory, deadline, records, seed):
+    """Một client closed-loop: một kết nối keep-alive, gửi request kế tiếp ngay khi có response"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    conn = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT_S)
+    headers = {"Content-Type": "application/json"}
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(names, weights)[0]
+        body = factory.make(endpoint)
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", ENDPOINTS[endpoint], body, headers)
+            resp = conn.getresponse()
+            resp.read()
+            status = resp.status
+        except Exception as exc:  # lỗi kết nối / timeout: mở kết nối mới
+            status = type(exc).__name__
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT_S)
+        records.append((endpoint, status, time.perf_counter() - t0))
+    conn.close()
+
+
+def run_load(host, port, mix, concurrency, duration, cache_hit_ratio, seed):
+    """Chạy `concurrency` client trong `duration` giây; trả về (records, thời gian thực tế)"""
+    factory = PayloadFactory(cache_hit_ratio, seed)
+    records = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=client_loop, args=(host, port, mix, factory, deadline, records, seed + i))
+        for i in range(concurrency)
+    ]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return records, time.perf_counter() - t0
+
+
+def summarize(records, elapsed):
+    """Chỉ số theo endpoint (+ 'all'): throughput, tỉ lệ lỗi, phân vị + histogram độ trễ (request thành công)"""
+    by_endpoint = {}
+    for name in sorted({r[0] for r in records}) + ["all"]:
+        rows = records if name == "all" else [r for r in records if r[0] == name]
+        ok = np.array([lat for _, status, lat in rows if status == 200]) * 1000
+        errors = {}
+        for _, status, _ in rows:
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        counts = np.histogram(ok, bins=[0] + LATENCY_BUCKETS_MS + [np.inf])[0] if len(ok) else []
+        stats = {
+            "requests": len(rows),
+            "ok": int(len(ok)),
+            "errors": errors,
+            "error_rate": (len(rows) - len(ok)) / max(len(rows), 1),
+            "throughput_rps": len(ok) / elapsed,
+            "histogram_ms": {
+                f"<={edge}" if edge != np.inf else f">{LATENCY_BUCKETS_MS[-1]}": int(c)
+                for edge, c in zip(LATENCY_BUCKETS_MS + [np.inf], counts)
+            },
+        }
+        if len(ok):
+            stats.update({
+                "mean_ms": float(ok.mean()),
+                "p50_ms": float(np.percentile(ok, 50)),
+                "p90_ms": float(np.percentile(ok, 90)),
+                "p95_ms": float(np.percentile(ok, 95)),
+                "p99_ms": float(np.percentile(ok, 99)),
+                "max_ms": float(ok.max()),
+            })
+        by_endpoint[name] = stats
+    return by_endpoint
+
+
+def print_level(label, summary):
+    print(f"\n📊 {label}")
+    print(f"   {'endpoint':<16}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'lỗi %':>8}")
+    for name, s in summary.items():
+        print(f"   {name:<16}{s['throughput_rps']:>9.1f}{s.get('p50_ms', float('nan')):>9.1f}"
+              f"{s.get('p95_ms', float('nan')):>9.1f}{s.get('p99_ms', float('nan')):>9.1f}"
+              f"{s['error_rate'] * 100:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /predict và /translate theo số uvicorn worker")
+    parser.add_argument("--workers", type=int, nargs="+", default=WORKER_COUNTS, help="Số uvicorn worker cần đo")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Số client đồng thời")
+    parser.add_argument("--duration", type=float, default=DURATION_S, help="Số giây đo cho mỗi mức")
+    parser.add_argument("--warmup", type=float, default=WARMUP_S)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Tỉ lệ request theo endpoint (mặc định {DEFAULT_MIX})")
+    parser.add_argument("--cache-hit-ratio", type=float, default=CACHE_HIT_RATIO,
+                        help="Tỉ lệ request lặp lại payload đã gửi")
+    parser.add_argument("--translate-latency-ms", type=float, default=80.0, help="Độ trễ backend dịch giả lập")
+    parser.add_argument("--translate-jitter-ms", type=float, default=20.0)
+    parser.add_argument("--translate-error-rate", type=float, default=0.0)
+    parser.add_argument("--url", default=None, help="Đo server có sẵn thay vì tự khởi động (bỏ qua --workers)")
+    parser.add_argument("--output", type=Path, default=OUTPUT_FILE)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("LOAD TEST HTTP")
+    print("=" * 60)
+    print(f"\n   Mix: {', '.join(f'{k}={v:.2f}' for k, v in args.mix.items())}")
+    print(f"   Concurrency: {args.concurrency}, thời gian đo: {args.duration}s (warm-up {args.warmup}s)")
+
+    levels = [None] if args.url else args.workers
+    results = []
+    for workers in levels:
+        proc = None
+        try:
+            if args.url:
+                parsed = urlparse(args.url)
+                host, port = parsed.hostname, parsed.port or 80
+                label = f"server {args.url}"
+            else:
+                host, port = "127.0.0.1", free_port()
+                label = f"{workers} worker"
+                print(f"\n▶️  Khởi động uvicorn ({label}, port {port})...")
+                proc = start_server(workers, port, args)
+            wait_ready(host, port, proc, STARTUP_TIMEOUT_S)
+
+            if args.warmup > 0:
+                run_load(host, port, args.mix, args.concurrency, args.warmup, args.cache_hit_ratio, SEED + 1000)
+            records, elapsed = run_load(host, port, args.mix, args.concurrency, args.duration,
+                                        args.cache_hit_ratio, SEED)
+            summary = summarize(records, elapsed)
+            print_level(label, summary)
+            results.append({"workers": workers, "url": args.url, "seconds": elapsed, "endpoints": summary})
+        except (RuntimeError, TimeoutError) as exc:
+            print(f"\n❌ {exc}")
+            results.append({"workers": workers, "url": args.url, "error": str(exc)})
+        finally:
+            stop_server(proc)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "mix": args.mix,
+            "cache_hit_ratio": args.cache_hit_ratio,
+            "translator": None if args.url else {
+                "backend": "fake",
+                "latency_ms": args.translate_latency_ms,
+                "jitter_ms": args.translate_jitter_ms,
+                "error_rate": args.translate_error_rate,
+            },
+            "cpu_count": os.cpu_count(),
+            "latency_buckets_ms": LATENCY_BUCKETS_MS,
+        },
+        "levels": results,
+    }
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ Đã lưu: {args.output}")
+
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Chạy pipeline tiền xử lý / đánh giá theo đồ thị phụ thuộc, bỏ qua các bước còn hợp lệ.
+
+Mỗi bước khai báo script, file input, file output và tham số. Fingerprint của một bước gồm
+nội dung script (+ module dùng chung), nội dung các file input (kể cả config) và tham số;
+nếu fingerprint không đổi và các file output vẫn nguyên như lần chạy trước thì bước đó được
+bỏ qua. Thứ tự và phụ thuộc giữa các bước suy ra từ input/output (output của bước trước là
+input của bước sau). Trạng thái được lưu ở data/proc/.pipeline_state.json.
+
+Cách dùng:
+    python jobs/run_pipeline.py                    # chạy các bước mặc định (chỉ bước cần chạy lại)
+    python jobs/run_pipeline.py preprocess         # chỉ preprocess và các bước nó phụ thuộc
+    python jobs/run_pipeline.py --dry-run          # xem bước nào sẽ chạy / bỏ qua
+    python jobs/run_pipeline.py --force filter     # chạy lại filter dù còn hợp lệ
+    python jobs/run_pipeline.py --csv              # filter/unify export kèm .csv.gz
+
+jobs/04_train.py là notebook Kaggle (đường dẫn /kaggle/...) nên không nằm trong pipeline;
+model và preds_sample.csv nó tạo ra được coi là input từ bên ngoài của các bước evaluate/export.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+# Đường dẫn gốc của project
+BASE_DIR = Path(__file__).parent.parent
+STATE_FILE = BASE_DIR / "data" / "proc" / ".pipeline_state.json"
+
+HOSP = "data/mimiciv/3.1/hosp"
+PROC = "data/proc"
+LITE = "data/mimic-iv-lite"
+
+# Các bước của pipeline (đường dẫn tương đối so với BASE_DIR)
+#   script: file chạy; code: module dùng chung (đổi code → chạy lại); args: tham số dòng lệnh
+#   default: có chạy khi không chỉ định bước nào không
+STAGES = {
+    "sample": {
+        "script": "jobs/00_create_sample_data.py",
+        "inputs": [f"{HOSP}/admissions.csv.gz", f"{HOSP}/d_icd_diagnoses.csv.gz",
+                   f"{HOSP}/diagnoses_icd.csv.gz", f"{HOSP}/patients.csv.gz",
+                   "data/mimic-iv-note/2.2/note/discharge.csv.gz"],
+        "outputs": [f"{LITE}/admissions.csv", f"{LITE}/d_icd_diagnoses.csv", f"{LITE}/diagnoses_icd.csv",
+                    f"{LITE}/patients.csv", f"{LITE}/discharge.csv"],
+        "default": False,
+    },
+    "filter": {
+        "script": "jobs/01_filter_non_disease_icd.py.py",
+        "code": ["utils/diagnoses_io.py"],
+        "inputs": [f"{HOSP}/d_icd_diagnoses.csv.gz", f"{HOSP}/diagnoses_icd.csv.gz",
+                   "configs/non_disease_icd.json"],
+        "outputs": [f"{PROC}/d_icd_diagnoses.parquet", f"{PROC}/diagnoses_icd.parquet"],
+        "csv_flag": True,
+    },
+    "unify": {
+        "script": "jobs/02_unify_duplicate_icd.py",
+        "code": ["utils/diagnoses_io.py"],
+        "inputs": [f"{HOSP}/d_icd_diagnoses.csv.gz", f"{HOSP}/diagnoses_icd.csv.gz"],
+        "outputs": [f"{LITE}/duplicate_icd_diagnoses.csv", f"{LITE}/icd_deduplicated_mapping.csv",
+                    f"{PROC}/diagnoses_icd_unified.parquet"],
+        "csv_flag": True,
+    },
+    "frequency": {
+        "script": "utils/count_icd_frequency.py",
+        "code": ["utils/diagnoses_io.py"],
+        "inputs": [f"{PROC}/diagnoses_icd.parquet"],
+        "outputs": [f"{PROC}/icd_hadm_freq.csv"],
+    },
+    "preprocess": {
+        "script": "jobs/03_preprocess.py",
+        "code": ["utils/diagnoses_io.py"],
+        "inputs": ["data/mimic-iv-note/2.2/note/discharge.csv.gz", f"{HOSP}/patients.csv.gz",
+                   f"{HOSP}/admissions.csv.gz", f"{PROC}/diagnoses_icd_unified.parquet"],
+        "outputs": [f"{PROC}/train_unified.parquet"],
+    },
+    "evaluate": {
+        "script": "jobs/05_evaluate.py",
+        "inputs": [f"{PROC}/preds_sample.csv"],
+        "outputs": [],
+    },
+    "export": {
+        "script": "jobs/06_export_model.py",
+        "code": ["jobs/05_evaluate.py", "src/artifacts.py", "src/scoring.py", "src/vectorizer.py"],
+        "inputs": ["models/ovr_sgd_tfidf.joblib", f"{PROC}/train_unified.parquet"],
+        "outputs": ["models/ovr_sgd_tfidf_arrays/meta.json"],
+        "default": False,
+    },
+}
+
+
+def stage_dependencies(name):
+    """Các bước tạo ra input của bước `name`"""
+    inputs = set(STAGES[name]["inputs"])
+    return [other for other, stage in STAGES.items()
+            if other != name and inputs & set(stage["outputs"])]
+
+
+def resolve_order(targets):
+    """Sắp xếp topo: các bước cần chạy (kèm phụ thuộc) theo thứ tự chạy"""
+    order, visiting = [], set()
+
+    def visit(name):
+        if name in order:
+            return
+        if name in visiting:
+            raise ValueError(f"Phụ thuộc vòng tại bước: {name}")
+        visiting.add(name)
+        for dep in stage_dependencies(name):
+            visit(dep)
+        visiting.discard(name)
+        order.append(name)
+
+    for name in targets:
+        visit(name)
+    return order
+
+
+def load_state():
+    if STATE_FILE.exists():
+        with open(STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}, "stages": {}}
+
+
+def save_state(state):
+    STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STATE_FILE.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, STATE_FILE)
+
+
+def file_stat(path):
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def file_hash(rel_path, state):
+    """sha1 nội dung file; dùng lại hash đã lưu nếu kích thước + mtime không đổi"""
+    path = BASE_DIR / rel_path
+    if not path.exists():
+        return None
+    stat = file_stat(path)
+    cached = state["files"].get(rel_path)
+    if cached is not None and cached["stat"] == stat:
+        return cached["sha1"]
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    state["files"][rel_path] = {"stat": stat, "sha1": h.hexdigest()}
+    return h.hexdigest()
+
+
+def stage_args(name, args):
+    stage = STAGES[name]
+    return ["--csv"] if stage.get("csv_flag") and args.csv else []
+
+
+def stage_fingerprint(name, args, state):
+    stage = STAGES[name]
+    payload = {
+        "script": file_hash(stage["script"], state),
+        "code": {p: file_hash(p, state) for p in stage.get("code", [])},
+        "inputs": {p: file_hash(p, state) for p in stage["inputs"]},
+        "args": stage_args(name, args),
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def outputs_valid(name, state):
+    """Output còn nguyên như lần chạy thành công trước (tồn tại, cùng kích thước + mtime)"""
+    recorded = state["stages"].get(name, {}).get("outputs", {})
+    for rel_path in STAGES[name]["outputs"]:
+        path = BASE_DIR / rel_path
+        if not path.exists() or recorded.get(rel_path) != file_stat(path):
+            return False
+    return True
+
+
+def run_stage(name, args):
+    stage = STAGES[name]
+    cmd = [sys.executable, str(BASE_DIR / stage["script"])] + stage_args(name, args)
+    return subprocess.run(cmd, cwd=BASE_DIR).returncode
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy pipeline, bỏ qua các bước còn hợp lệ")
+    parser.add_argument("stages", nargs="*", help=f"Các bước cần chạy ({', '.join(STAGES)})")
+    parser.add_argument("--force", action="store_true", help="Chạy lại các bước được chỉ định dù còn hợp lệ")
+    parser.add_argument("--dry-run", action="store_true", help="Chỉ in kế hoạch, không chạy")
+    parser.add_argument("--csv", action="store_true", help="filter/unify export kèm .csv.gz")
+    args = parser.parse_args()
+
+    unknown = [s for s in args.stages if s not in STAGES]
+    if unknown:
+        parser.error(f"Bước không tồn tại: {', '.join(unknown)}")
+    targets = args.stages or [name for name, stage in STAGES.items() if stage.get("default", True)]
+    forced = set(args.stages) if args.force else set()
+
+    print("=" * 60)
+    print("PIPELINE")
+    print("=" * 60)
+
+    state = load_state()
+    order = resolve_order(targets)
+    print(f"\n📋 Thứ tự: {' → '.join(order)}")
+
+    planned = set()   # các bước (sẽ) chạy lại trong lần này
+    blocked = set()   # các bước thiếu input, bị bỏ qua cùng các bước phụ thuộc
+    for name in order:
+        stage = STAGES[name]
+        deps = stage_dependencies(name)
+        if blocked & set(deps):
+            print(f"\n⚠️  {name}: bỏ qua vì bước phụ thuộc không chạy được")
+            blocked.add(name)
+            continue
+        produced = {p for d in deps for p in STAGES[d]["outputs"]}
+        missing = [p for p in stage["inputs"] if p not in produced and not (BASE_DIR / p).exists()]
+        if missing:
+            print(f"\n⚠️  {name}: thiếu input {', '.join(missing)}, bỏ qua")
+            blocked.add(name)
+            continue
+
+        if args.dry_run and planned & set(deps):
+            # Output của bước trước sẽ đổi nên chưa biết trước fingerprint
+            print(f"\n▶️  {name}: {stage['script']} (nếu output của {', '.join(sorted(planned & set(deps)))} thay đổi)")
+            planned.add(name)
+            continue
+
+        fingerprint = stage_fingerprint(name, args, state)
+        previous = state["stages"].get(name, {})
+        if name not in forced and previous.get("fingerprint") == fingerprint and outputs_valid(name, state):
+            print(f"\n⏭️  {name}: không đổi, bỏ qua")
+            continue
+
+        print(f"\n▶️  {name}: {stage['script']}")
+        planned.add(name)
+        if args.dry_run:
+            continue
+
+        t0 = time.perf_counter()
+        returncode = run_stage(name, args)
+        if returncode != 0:
+            print(f"\n❌ {name} thất bại (exit code {returncode}), dừng pipeline")
+            save_state(state)
+            sys.exit(returncode)
+
+        state["stages"][name] = {
+            "fingerprint": stage_fingerprint(name, args, state),
+            "outputs": {p: file_stat(BASE_DIR / p) for p in stage["outputs"] if (BASE_DIR / p).exists()},
+            "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": round(time.perf_counter() - t0, 1),
+        }
+        save_state(state)
+        print(f"✅ {name}: xong trong {state['stages'][name]['seconds']}s")
+
+    save_state(state)
+    print("\n" + "=" * 60)
+    print("✨ HOÀN THÀNH!")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
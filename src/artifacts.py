@@ -0,0 +1,263 @@
+"""
+Định dạng model dạng mảng (thư mục .npy không nén) thay cho ovr_sgd_tfidf.joblib.
+Mọi mảng lớn được load bằng mmap (read-only) nên các uvicorn worker trên cùng máy
+dùng chung một bản trong page cache thay vì mỗi worker giữ một bản copy.
+
+Cấu trúc thư mục:
+    meta.json            cấu hình train, shape, tham số vectorizer, tỉ lệ trọng số giữ lại
+    coef_T.npy           trọng số dense (n_features, n_labels) — khi không prune
+    coef_data.npy    \\
+    coef_indices.npy  >  trọng số đã prune, CSR shape (n_features, n_labels)
+    coef_indptr.npy  /
+    intercept.npy        (n_labels,)
+    classes.npy          mã ICD theo thứ tự cột
+    vocab_terms.txt      từ điển của word_vec, mỗi dòng một từ theo thứ tự feature index
+                         (chỉ để tra cứu/kiểm tra, serving không load file này)
+    vocab_hash.npy       hash 64-bit đã sort của từng từ  \\  CompactVocabulary
+    vocab_index.npy      feature index tương ứng          /
+    idf.npy              idf của word_vec (model hashing: idf theo bucket, không có các file vocab_*)
+    char_vec.joblib      char_vec (chỉ khi train có USE_CHAR_NGRAMS)
+"""
+
+import json
+import math
+import os
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from scoring import LinearOvRScorer, stack_ovr_weights
+from vectorizer import (
+    ArrayTfidfVectorizer,
+    CompactVocabulary,
+    HashingTfidfVectorizer,
+    hashing_params,
+    is_hashing,
+    serving_vectorizer,
+    vectorizer_params,
+    vocabulary_terms,
+)
+
+FORMAT_VERSION = 3
+# Số từ mẫu lưu trong meta.json để kiểm tra hàm hash lúc load
+_VOCAB_CHECK_TERMS = 16
+_PRUNE_BLOCK = 64
+
+
+def prune_weights(coef_T, keep_fraction: float):
+    """Giữ lại `keep_fraction` trọng số có |w| lớn nhất của từng nhãn (theo cột).
+
+    Prune theo từng nhãn để nhãn hiếm vẫn giữ được các từ khoá quan trọng nhất.
+    Trả về ma trận CSR shape (n_features, n_labels). Mỗi trọng số CSR tốn 8 byte (giá trị +
+    chỉ số cột) so với 4 byte dense float32, nên chỉ nhỏ hơn dense khi giữ lại < ~50% ô.
+    """
+    if not 0.0 < keep_fraction <= 1.0:
+        raise ValueError("keep_fraction must be in (0, 1]")
+    n_features, n_labels = coef_T.shape
+    rows, cols, data = [], [], []
+    for start in range(0, n_labels, _PRUNE_BLOCK):
+        block = np.array(coef_T[:, start:start + _PRUNE_BLOCK].T)  # (block, n_features)
+        for offset, w in enumerate(block):
+            nz = np.flatnonzero(w)
+            n_keep = math.ceil(keep_fraction * len(nz))
+            if n_keep < len(nz):
+                mag = np.abs(w[nz])
+                nz = nz[np.argpartition(mag, len(nz) - n_keep)[-n_keep:]]
+            rows.append(nz.astype(np.int32))
+            cols.append(np.full(len(nz), start + offset, dtype=np.int32))
+            data.append(w[nz])
+    W = sparse.csr_matrix(
+        (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_features, n_labels),
+        dtype=coef_T.dtype,
+    )
+    W.sort_indices()
+    return W
+
+
+def weights_nbytes(coef_T) -> int:
+    """Số byte bộ nhớ của ma trận trọng số (dense hoặc CSR)."""
+    if sparse.issparse(coef_T):
+        return coef_T.data.nbytes + coef_T.indices.nbytes + coef_T.indptr.nbytes
+    return coef_T.nbytes
+
+
+def export_artifacts(bundle: dict, out_dir, keep_fraction: float = 1.0, coef_T=None, intercept=None):
+    """Ghi bundle joblib (clf, word_vec, char_vec, mlb, cfg) ra thư mục .npy.
+
+    keep_fraction < 1 → lưu trọng số đã prune dạng CSR; = 1 → lưu dense. Nếu CSR đã prune
+    không nhỏ hơn coef_T dense thì cảnh báo và lưu dense không prune (keep_fraction = 1 trong meta).
+    Có thể truyền sẵn (coef_T, intercept) đã gộp để khỏi gộp lại.
+    """
+    if coef_T is None or intercept is None:
+        coef_T, intercept = stack_ovr_weights(bundle["clf"])
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Xoá trọng số của lần export trước (có thể khác dạng dense/CSR)
+    for name in ("coef_T.npy", "coef_data.npy", "coef_indices.npy", "coef_indptr.npy"):
+        path = os.path.join(out_dir, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+    W = prune_weights(coef_T, keep_fraction) if keep_fraction < 1.0 else None
+    if W is not None and weights_nbytes(W) >= weights_nbytes(coef_T):
+        warnings.warn(
+            f"Pruned CSR weights ({weights_nbytes(W):,} bytes at keep_fraction={keep_fraction}) are not "
+            f"smaller than dense coef_T ({weights_nbytes(coef_T):,} bytes); exporting dense weights instead"
+        )
+        W, keep_fraction = None, 1.0
+
+    if W is not None:
+        np.save(os.path.join(out_dir, "coef_data.npy"), W.data)
+        np.save(os.path.join(out_dir, "coef_indices.npy"), W.indices)
+        np.save(os.path.join(out_dir, "coef_indptr.npy"), W.indptr)
+        nnz = int(W.nnz)
+    else:
+        np.save(os.path.join(out_dir, "coef_T.npy"), np.ascontiguousarray(coef_T))
+        nnz = int(np.count_nonzero(coef_T))
+
+    np.save(os.path.join(out_dir, "intercept.npy"), intercept)
+    np.save(os.path.join(out_dir, "classes.npy"), np.asarray(bundle["mlb"].classes_, dtype=str))
+
+    word_vec = bundle["word_vec"]
+    if is_hashing(word_vec):
+        # Model hashing: chỉ cần idf theo bucket, xoá từ điển của lần export trước (nếu có)
+        for name in ("vocab_terms.txt", "vocab_hash.npy", "vocab_index.npy"):
+            path = os.path.join(out_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+        params = hashing_params(word_vec)
+        terms = []
+        np.save(os.path.join(out_dir, "idf.npy"), np.asarray(word_vec[-1].idf_))
+    else:
+        # Từ điển + idf dạng mảng thay cho TfidfVectorizer pickle (bỏ luôn stop_words_)
+        params = vectorizer_params(word_vec)
+        terms = vocabulary_terms(word_vec)
+        if any("\n" in t for t in terms):
+            raise ValueError("Vocabulary terms must not contain newlines")
+        with open(os.path.join(out_dir, "vocab_terms.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(terms))
+        vocab = CompactVocabulary.build(terms)
+        np.save(os.path.join(out_dir, "vocab_hash.npy"), vocab.hashes)
+        np.save(os.path.join(out_dir, "vocab_index.npy"), vocab.index)
+        np.save(os.path.join(out_dir, "idf.npy"), np.asarray(word_vec.idf_))
+
+    char_path = os.path.join(out_dir, "char_vec.joblib")
+    if bundle["char_vec"] is not None:
+        joblib.dump(bundle["char_vec"], char_path)
+    elif os.path.exists(char_path):
+        os.remove(char_path)
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "n_features": int(coef_T.shape[0]),
+        "n_labels": int(coef_T.shape[1]),
+        "n_word_features": params.get("n_features", len(terms)),
+        "keep_fraction": keep_fraction,
+        "nnz": nnz,
+        "vectorizer": params,
+        "vocab_check": {t: i for i, t in enumerate(terms) if i % max(1, len(terms) // _VOCAB_CHECK_TERMS) == 0},
+        "cfg": bundle.get("cfg", {}),
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def load_artifacts(model_dir, mmap: bool = True) -> dict:
+    """Load thư mục .npy, trả về dict gồm scorer, word_vec, char_vec, classes, cfg, meta.
+
+    mmap=True: các mảng được map read-only từ file (dùng chung page cache giữa các process).
+    """
+    with open(os.path.join(model_dir, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format: {meta.get('format_version')}")
+
+    mmap_mode = "r" if mmap else None
+
+    def _load(name):
+        return np.load(os.path.join(model_dir, name), mmap_mode=mmap_mode)
+
+    shape = (meta["n_features"], meta["n_labels"])
+    if os.path.exists(os.path.join(model_dir, "coef_T.npy")):
+        coef_T = _load("coef_T.npy")
+    else:
+        coef_T = sparse.csr_matrix(
+            (_load("coef_data.npy"), _load("coef_indices.npy"), _load("coef_indptr.npy")),
+            shape=shape,
+            copy=False,
+        )
+
+    if meta["vectorizer"].get("kind") == "hashing":
+        word_vec = HashingTfidfVectorizer(_load("idf.npy"), meta["vectorizer"])
+    else:
+        vocab = CompactVocabulary(_load("vocab_hash.npy"), _load("vocab_index.npy"))
+        # Đảm bảo hàm hash hiện tại cho cùng kết quả với lúc export
+        check = meta.get("vocab_check", {})
+        if check and list(vocab.lookup(list(check))) != list(check.values()):
+            raise ValueError("Vocabulary hash mismatch; re-export the model with this pandas version")
+        word_vec = ArrayTfidfVectorizer(vocab, _load("idf.npy"), meta["vectorizer"])
+
+    char_path = os.path.join(model_dir, "char_vec.joblib")
+    char_vec = joblib.load(char_path) if os.path.exists(char_path) else None
+
+    return {
+        "scorer": LinearOvRScorer(coef_T, _load("intercept.npy")),
+        "word_vec": word_vec,
+        "char_vec": char_vec,
+        "classes": np.load(os.path.join(model_dir, "classes.npy")),
+        "cfg": meta.get("cfg", {}),
+        "meta": meta,
+    }
+
+
+def load_serving_model(path, mmap: bool = True, with_terms: bool = False) -> dict:
+    """Load model cho serving: bundle joblib (04_train.py) hoặc thư mục mảng (06_export_model.py).
+
+    Trả về dict gồm scorer, word_vec, char_vec, classes, cfg (+ meta với thư mục mảng). Dùng
+    chung cho src/main.py và các job batch / benchmark để mọi nơi chạy cùng một đường load.
+    with_terms=True: thêm "terms" — từ điển của word_vec theo feature index (rỗng với model hashing).
+    """
+    if os.path.isdir(path):
+        model = load_artifacts(path, mmap=mmap)
+        if with_terms:
+            terms_path = os.path.join(path, "vocab_terms.txt")
+            if os.path.exists(terms_path):
+                with open(terms_path, encoding="utf-8") as f:
+                    model["terms"] = f.read().split("\n")
+            else:
+                model["terms"] = []
+        return model
+    bundle = joblib.load(path)
+    model = {
+        # Gộp các estimator thành một ma trận trọng số (clf không được giữ lại)
+        "scorer": LinearOvRScorer.from_ovr(bundle["clf"]),
+        # Vectorizer serving dùng từ điển hash gọn thay cho dict vocabulary_ của sklearn
+        # (model hashing: không có từ điển, chỉ có idf theo bucket)
+        "word_vec": serving_vectorizer(bundle["word_vec"]),
+        "char_vec": bundle["char_vec"],
+        "classes": bundle["mlb"].classes_,
+        "cfg": bundle["cfg"],
+    }
+    if with_terms:
+        model["terms"] = [] if is_hashing(bundle["word_vec"]) else vocabulary_terms(bundle["word_vec"])
+    return model
+
+
+def load_icd_titles(path) -> dict:
+    """{(icd_version, icd_code): long_title} từ d_icd_diagnoses.csv(.gz) của MIMIC-IV."""
+    d = pd.read_csv(path, usecols=["icd_code", "icd_version", "long_title"], dtype={"icd_code": str})
+    return {(int(v), c.strip()): lt for c, v, lt in zip(d.icd_code, d.icd_version, d.long_title)}
+
+
+def icd_title(title_map: dict, code_with_prefix: str) -> str:
+    """Tên bệnh cho mã dạng "<version>-<code>" (vd. "10-I10"); "(unknown title)" nếu không tra được."""
+    try:
+        ver_str, code = code_with_prefix.split("-", 1)
+        return title_map.get((int(ver_str), code), "(unknown title)")
+    except Exception:
+        return "(unknown title)"
@@ -0,0 +1,136 @@
+"""
+Micro-batching cho các request dự đoán đồng thời.
+Gom các item được submit trong một khoảng thời gian ngắn (max_wait_ms) hoặc đến khi đủ
+max_batch_size, chạy hàm batch một lần cho cả nhóm (trong executor, ngoài event loop)
+rồi trả kết quả về từng caller.
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+
+class QueueFullError(RuntimeError):
+    """Số request đang chờ đã vượt `max_pending` (API trả 503)."""
+
+
+class MicroBatcher:
+    """Gom các request đồng thời thành batch và gọi `batch_fn` một lần cho cả batch.
+
+    `batch_fn` nhận list item và phải trả về list kết quả cùng độ dài, cùng thứ tự.
+    `executor`: nơi chạy `batch_fn` (None → chạy thẳng trên event loop);
+    `max_concurrency`: số batch chạy song song tối đa (thường = số worker của executor);
+    `max_pending`: số item tối đa đang chờ/đang chạy, vượt quá thì submit ném QueueFullError.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        max_concurrency: int = 1,
+        max_pending: Optional[int] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        self.executor = executor
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def submit(self, item: Any) -> Any:
+        """Đưa một item vào hàng đợi và chờ kết quả của riêng item đó."""
+        if self.max_pending is not None and self.pending >= self.max_pending:
+            raise QueueFullError(f"{self.pending} predictions pending (limit {self.max_pending})")
+        self._ensure_started()
+        future = self._loop.create_future()
+        self.pending += 1
+        try:
+            await self._queue.put((item, future))
+            return await future
+        finally:
+            self.pending -= 1
+
+    def _ensure_started(self):
+        # Khởi động worker lười (lazy) trên event loop hiện tại
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._worker = loop.create_task(self._run())
+
+    async def stop(self):
+        """Dừng worker (gọi khi shutdown app)."""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    async def _collect(self) -> List[Tuple[Any, asyncio.Future]]:
+        """Chờ item đầu tiên, sau đó gom thêm đến khi đủ batch hoặc hết thời gian chờ."""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # Lấy ngay các item đã có sẵn trong hàng đợi
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            # Chờ có slot trống rồi mới gom batch: khi mọi worker đều bận, request dồn lại
+            # thành batch lớn hơn thay vì xếp hàng trong executor
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            # Bỏ các request mà client đã huỷ (vd. ngắt kết nối)
+            batch = [(item, fut) for item, fut in batch if not fut.done()]
+            if batch:
+                self._loop.create_task(self._process(batch))
+            else:
+                self._slots.release()
+
+    async def _process(self, batch: List[Tuple[Any, asyncio.Future]]):
+        items = [item for item, _ in batch]
+        try:
+            if self.executor is None:
+                results = self.batch_fn(items)
+            else:
+                results = await self._loop.run_in_executor(self.executor, self.batch_fn, items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"batch_fn returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as exc:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(exc)
+            return
+        finally:
+            self._slots.release()
+        for (_, fut), result in zip(batch, results):
+            if not fut.done():
+                fut.set_result(result)
@@ -1,13 +1,26 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, HTTPException, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ValidationError
 from typing import List
-import joblib
-import numpy as np
-import pandas as pd
 from pathlib import Path
 import os
-from deep_translator import GoogleTranslator
+import sys
+import hashlib
+import json
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Cho phép import các module cùng thư mục src/ (chạy bằng `src.main:app` hoặc `main:app`)
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batching import MicroBatcher, QueueFullError
+from artifacts import icd_title, load_icd_titles, load_serving_model
+import predict_worker
+from cache import LRUCache
+from translation import SQLiteTranslationStore, TranslationService, create_backend
 
 app = FastAPI(title="Revita Symptom Diagnosis API", version="1.0.0")
 
@@ -23,17 +36,35 @@ app.add_middleware(
 # Lấy môi trường từ biến môi trường
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development").lower()
 
-# Load model and data
-def load_model():
+# Định dạng model: "joblib" (bundle gốc từ 04_train) hoặc "arrays" (thư mục .npy từ 06_export_model)
+MODEL_FORMAT = os.getenv("MODEL_FORMAT", "joblib").lower()
+
+def _file_version(path) -> str:
+    """Phiên bản model theo kích thước + thời điểm sửa file (đổi khi model được ghi lại)."""
+    st = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:12]
+
+def model_paths():
+    """(đường dẫn model, file dùng để tính phiên bản) theo ENVIRONMENT và MODEL_FORMAT."""
     if ENVIRONMENT == "production":
         # Production: load từ absolute path (mount từ volume)
-        model_path = "/app/models/ovr_sgd_tfidf.joblib"
+        models_dir = "/app/models"
     else:
         # Development: load từ relative path
-        model_path = os.path.join(os.path.dirname(__file__), "..", "models", "ovr_sgd_tfidf.joblib")
+        models_dir = os.path.join(os.path.dirname(__file__), "..", "models")
     
-    bundle = joblib.load(model_path)
-    return bundle
+    if MODEL_FORMAT == "arrays":
+        model_path = os.path.join(models_dir, "ovr_sgd_tfidf_arrays")
+        return model_path, os.path.join(model_path, "meta.json")
+    model_path = os.path.join(models_dir, "ovr_sgd_tfidf.joblib")
+    return model_path, model_path
+
+# Load model and data
+def load_model():
+    model_path, version_file = model_paths()
+    model = load_serving_model(model_path)
+    model["version"] = _file_version(version_file)
+    return model
 
 def load_icd_mapping():
     if ENVIRONMENT == "production":
@@ -43,22 +74,58 @@ def load_icd_mapping():
         # Development: load từ relative path
         data_path = os.path.join(os.path.dirname(__file__), "..", "data", "mimiciv", "3.1", "hosp", "d_icd_diagnoses.csv.gz")
     
-    d = pd.read_csv(data_path, compression="gzip", usecols=["icd_code","icd_version","long_title"])
-    title_map = {(int(v), c.strip()): lt for c, v, lt in zip(d.icd_code, d.icd_version, d.long_title)}
-    return title_map
+    return load_icd_titles(data_path)
 
 # Default config
 MAX_TOKENS = 8000  # Default value
+TOPK = 10
+
+# Cấu hình micro-batching cho /predict
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "32"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+
+# Dự đoán chạy trong pool riêng để event loop luôn rảnh: "thread" (mặc định) hoặc "process"
+PREDICT_EXECUTOR = os.getenv("PREDICT_EXECUTOR", "thread").lower()
+# Cách tạo process worker: "forkserver" (mặc định) hoặc "spawn"; không dùng "fork" (xem src/predict_worker.py)
+PREDICT_MP_CONTEXT = os.getenv("PREDICT_MP_CONTEXT", "forkserver").lower()
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Số request /predict tối đa đang chờ + đang chạy; vượt quá trả 503
+PREDICT_MAX_QUEUE = int(os.getenv("PREDICT_MAX_QUEUE", "256"))
+
+# Số bản ghi mỗi chunk của /predict/batch (mỗi chunk: một lần transform + predict_proba)
+PREDICT_BATCH_CHUNK_SIZE = int(os.getenv("PREDICT_BATCH_CHUNK_SIZE", "256"))
+# Số byte mỗi lần đọc file upload JSONL của /predict/batch/upload
+UPLOAD_READ_CHUNK_SIZE = int(os.getenv("UPLOAD_READ_CHUNK_SIZE", str(1024 * 1024)))
+
+# Cache kết quả /predict (PREDICT_CACHE_SIZE=0 để tắt)
+prediction_cache = LRUCache(
+    maxsize=int(os.getenv("PREDICT_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PREDICT_CACHE_TTL", "3600")),
+)
+MODEL_VERSION = None
+
+# Cấu hình dịch: backend (TRANSLATION_BACKEND), cache bộ nhớ, cache SQLite tuỳ chọn (TRANSLATION_CACHE_DB)
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "google").lower()
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB")
+translation_service = TranslationService(
+    create_backend(TRANSLATION_BACKEND),
+    cache=LRUCache(maxsize=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000"))),
+    store=SQLiteTranslationStore(TRANSLATION_CACHE_DB) if TRANSLATION_CACHE_DB else None,
+    max_workers=int(os.getenv("TRANSLATION_WORKERS", "8")),
+)
 
 # Load model and data once at startup
 try:
     bundle = load_model()
-    clf = bundle["clf"]
+    scorer = bundle["scorer"]
     word_vec = bundle["word_vec"]
     char_vec = bundle["char_vec"]
-    mlb = bundle["mlb"]
+    classes = bundle["classes"]
     cfg = bundle["cfg"]
     MAX_TOKENS = cfg.get("MAX_TOKENS_PER_DOC", 8000)
+    # Model mới → bỏ toàn bộ kết quả đã cache (key cũng chứa MODEL_VERSION)
+    MODEL_VERSION = bundle["version"]
+    prediction_cache.clear()
     title_map = load_icd_mapping()
     model_loaded = True
 except Exception as e:
@@ -84,44 +151,195 @@ class TranslationRequest(BaseModel):
     text: str
 
 # Helper functions
-def _truncate(s, mx=MAX_TOKENS):
-    return " ".join(str(s).split()[:mx])
-
-def _to_X(texts):
-    s = pd.Series(texts).map(_truncate)
-    Xw = word_vec.transform(s)
-    if char_vec is not None:
-        from scipy.sparse import hstack
-        Xc = char_vec.transform(s)
-        return hstack([Xw, Xc], format="csr")
-    return Xw
-
 def predict_topk(texts, K=5):
-    P = clf.predict_proba(_to_X(texts))
-    codes = mlb.classes_
-    out = []
-    for i in range(len(texts)):
-        idx = np.argsort(-P[i])[:K]
-        out.append([(codes[j], float(P[i,j])) for j in idx])
-    return out
+    """Trả về (codes, probs): hai mảng shape (len(texts), K), xác suất giảm dần."""
+    # Cắt MAX_TOKENS, tokenize, tạo n-gram và tra từ điển trong một lượt (cùng code với process worker)
+    return predict_worker.predict_topk(bundle, texts, K, MAX_TOKENS)
+
+def patient_text(patient: "PatientInfo") -> str:
+    # Combine patient info with notes for prediction
+    return f"Age: {patient.age}, Gender: {patient.gender}. {patient.notes}"
+
+def format_predictions(codes, probs) -> List["DiseasePrediction"]:
+    return [
+        DiseasePrediction(
+            icd_code=code,
+            probability=float(probability),
+            disease_name=icd_name_from_prefixed(code),
+        )
+        for code, probability in zip(codes, probs)
+    ]
 
 def icd_name_from_prefixed(code_with_prefix: str) -> str:
+    return icd_title(title_map, code_with_prefix)
+
+def prediction_cache_key(text: str) -> str:
+    """Key cache: hash của text đã chuẩn hoá + phiên bản model.
+
+    Chỉ chuẩn hoá những gì vectorizer vốn bỏ qua (khoảng trắng thừa, chữ hoa nếu lowercase),
+    nên hai input cùng key luôn cho cùng kết quả dự đoán.
+    """
+    normalized = " ".join(text.split())
+    if word_vec.params["lowercase"]:
+        normalized = normalized.lower()
+    return hashlib.sha256(f"{MODEL_VERSION}\x00{TOPK}\x00{normalized}".encode("utf-8")).hexdigest()
+
+def predict_batch(texts):
+    """Top-K cho một batch, trả về list (codes, probs) theo từng text (chạy trong executor)."""
+    return list(zip(*predict_topk(texts, K=TOPK)))
+
+def create_predict_executor():
+    """Pool chạy dự đoán; trả về (executor, hàm batch chạy trong executor đó)."""
+    if PREDICT_EXECUTOR == "process" and model_loaded:
+        # Process này đã có thread (event loop, pool dịch) nên worker không được tạo bằng fork;
+        # mỗi worker tự load model trong initializer (arrays: mmap, dùng chung page cache)
+        executor = ProcessPoolExecutor(
+            max_workers=PREDICT_WORKERS,
+            mp_context=multiprocessing.get_context(PREDICT_MP_CONTEXT),
+            initializer=predict_worker.init_worker,
+            initargs=(model_paths()[0],),
+        )
+        return executor, functools.partial(predict_worker.predict_batch, k=TOPK)
+    return ThreadPoolExecutor(max_workers=PREDICT_WORKERS, thread_name_prefix="predict"), predict_batch
+
+predict_executor, predict_batch_fn = create_predict_executor()
+
+# Gom các request /predict đồng thời: một lần transform + một lần predict_proba cho cả batch
+predict_batcher = MicroBatcher(
+    predict_batch_fn,
+    max_batch_size=PREDICT_MAX_BATCH_SIZE,
+    max_wait_ms=PREDICT_MAX_WAIT_MS,
+    executor=predict_executor,
+    max_concurrency=PREDICT_WORKERS,
+    max_pending=PREDICT_MAX_QUEUE,
+)
+
+def _ndjson(record: dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+async def stream_batch_predictions(records):
+    """Chấm điểm theo chunk và stream NDJSON (mỗi dòng một bản ghi) ngay khi chunk xong.
+
+    `records`: async iterable các (index, PatientInfo hoặc thông báo lỗi dạng str). Chỉ giữ
+    một chunk trong bộ nhớ nên dung lượng không phụ thuộc kích thước input. Nếu đọc input lỗi
+    giữa chừng (status 200 đã gửi), các bản ghi đã đọc vẫn được trả về, kèm một dòng
+    {"error"} cuối cùng để client biết kết quả không đầy đủ.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def flush(chunk):
+        valid = [(i, p) for i, p in chunk if isinstance(p, PatientInfo)]
+        results = []
+        if valid:
+            # Dùng chung pool với /predict, không chặn event loop
+            results = await loop.run_in_executor(
+                predict_executor, predict_batch_fn, [patient_text(p) for _, p in valid]
+            )
+        by_index = dict(zip((i for i, _ in valid), results))
+        lines = []
+        for i, p in chunk:
+            if i in by_index:
+                codes, probs = by_index[i]
+                lines.append(_ndjson({
+                    "index": i,
+                    "predictions": [d.dict() for d in format_predictions(codes, probs)],
+                }))
+            else:
+                lines.append(_ndjson({"index": i, "error": p}))
+        return b"".join(lines)
+
+    chunk = []
+    read_error = None
+    iterator = records.__aiter__()
+    while True:
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            break
+        except Exception as exc:
+            read_error = exc
+            break
+        chunk.append(item)
+        if len(chunk) >= PREDICT_BATCH_CHUNK_SIZE:
+            yield await flush(chunk)
+            chunk = []
+    if chunk:
+        yield await flush(chunk)
+    if read_error is not None:
+        yield _ndjson({"error": f"Failed to read input: {read_error}"})
+
+def _validate_record(i, record):
+    try:
+        return i, PatientInfo(**record)
+    except (TypeError, ValidationError) as exc:
+        return i, f"Invalid record: {exc}"
+
+def _parse_jsonl_line(i, line):
     try:
-        ver_str, code = code_with_prefix.split("-", 1)
-        return title_map.get((int(ver_str), code), "(unknown title)")
-    except Exception:
-        return "(unknown title)"
+        return _validate_record(i, json.loads(line))
+    except ValueError as exc:
+        return i, f"Invalid JSON: {exc}"
+
+async def iter_jsonl_records(file: UploadFile):
+    """Đọc file JSONL theo chunk bằng `await file.read` (không chặn event loop), từng dòng (bỏ dòng trống)."""
+    i = 0
+    pending = b""
+    while True:
+        data = await file.read(UPLOAD_READ_CHUNK_SIZE)
+        lines = (pending + data).split(b"\n")
+        # Dòng cuối có thể chưa đọc hết, giữ lại ghép với chunk sau
+        pending = lines.pop() if data else b""
+        for line in lines:
+            if not line.strip():
+                continue
+            yield _parse_jsonl_line(i, line)
+            i += 1
+        if not data:
+            break
 
-def translate_text(text: str, source_lang: str, target_lang: str) -> str:
+async def iter_parquet_records(file: UploadFile):
+    """Đọc file Parquet theo từng record batch (cột age, gender, notes).
+
+    pyarrow chỉ đọc đồng bộ nên việc mở file và đọc từng batch chạy trong threadpool.
+    """
+    import pyarrow.parquet as pq
+
+    pf = await run_in_threadpool(pq.ParquetFile, file.file)
+    batches = pf.iter_batches(batch_size=PREDICT_BATCH_CHUNK_SIZE, columns=["age", "gender", "notes"])
+    i = 0
+    while True:
+        batch = await run_in_threadpool(next, batches, None)
+        if batch is None:
+            break
+        for record in batch.to_pylist():
+            yield _validate_record(i, record)
+            i += 1
+
+async def _prepend(first, records):
+    yield first
+    async for item in records:
+        yield item
+
+async def translate_text(text: str, source_lang: str, target_lang: str) -> str:
     if not text or not text.strip():
         raise HTTPException(status_code=400, detail="Text to translate must not be empty.")
     try:
-        translator = GoogleTranslator(source=source_lang, target=target_lang)
-        return translator.translate(text)
+        # Chạy ngoài event loop, có cache theo (source, target, text)
+        return await translation_service.translate(text, source_lang, target_lang)
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Translation failed: {exc}")
 
 # API endpoints
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await predict_batcher.stop()
+    predict_executor.shutdown(wait=False)
+    translation_service.shutdown()
+
 @app.get("/docs")
 async def get_docs():
     return {"message": "xin chào"}
@@ -135,30 +353,75 @@ async def predict_disease(patient: PatientInfo):
     if not model_loaded:
         raise Exception("Model not loaded. Please check if model files exist.")
     
-    # Combine patient info with notes for prediction
-    combined_text = f"Age: {patient.age}, Gender: {patient.gender}. {patient.notes}"
+    combined_text = patient_text(patient)
     
-    # Get predictions
-    predictions = predict_topk([combined_text], K=10)[0]
-    
-    # Format response
-    disease_predictions = []
-    for code, probability in predictions:
-        disease_name = icd_name_from_prefixed(code)
-        disease_predictions.append(DiseasePrediction(
-            icd_code=code,
-            probability=probability,
-            disease_name=disease_name
-        ))
+    # Get predictions (ưu tiên cache, nếu không thì gom batch cùng các request đồng thời khác)
+    cache_key = prediction_cache_key(combined_text)
+    cached = prediction_cache.get(cache_key)
+    if cached is None:
+        try:
+            cached = await predict_batcher.submit(combined_text)
+        except QueueFullError:
+            raise HTTPException(status_code=503, detail="Prediction queue is full, please retry later.")
+        prediction_cache.set(cache_key, cached)
+    codes, probs = cached
     
     return PredictionResponse(
-        predictions=disease_predictions,
+        predictions=format_predictions(codes, probs),
         patient_info=patient
     )
 
+@app.post("/predict/batch")
+async def predict_batch_endpoint(patients: List[PatientInfo]):
+    """Dự đoán cho nhiều bệnh nhân; trả về NDJSON {"index", "predictions"} theo thứ tự input."""
+    if not model_loaded:
+        raise Exception("Model not loaded. Please check if model files exist.")
+    return StreamingResponse(
+        stream_batch_predictions(_aiter(enumerate(patients))),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/predict/batch/upload")
+async def predict_batch_upload(file: UploadFile = File(...)):
+    """Như /predict/batch nhưng đọc từ file upload: JSONL (.jsonl/.ndjson) hoặc Parquet (.parquet).
+
+    Bản ghi không hợp lệ trả về dòng {"index", "error"} thay vì làm hỏng cả batch; file hỏng
+    giữa chừng kết thúc stream bằng một dòng {"error"}.
+    """
+    if not model_loaded:
+        raise Exception("Model not loaded. Please check if model files exist.")
+    name = (file.filename or "").lower()
+    if name.endswith(".parquet"):
+        # Đọc trước batch đầu tiên để file không phải Parquet trả 400 thay vì stream lỗi
+        records = iter_parquet_records(file)
+        try:
+            first = await records.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except Exception as exc:
+            raise HTTPException(status_code=400, detail=f"Invalid Parquet file: {exc}")
+        if first is not None:
+            records = _prepend(first, records)
+    elif name.endswith((".jsonl", ".ndjson")):
+        records = iter_jsonl_records(file)
+    else:
+        raise HTTPException(status_code=400, detail="Unsupported file type, expected .jsonl, .ndjson or .parquet.")
+    return StreamingResponse(
+        stream_batch_predictions(records),
+        media_type="application/x-ndjson",
+    )
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "model_version": MODEL_VERSION,
+        "prediction_cache": prediction_cache.stats(),
+        "translation_cache": translation_service.cache.stats(),
+    }
+
 @app.post("/translate/en-vi")
 async def translate_en_vi(payload: TranslationRequest):
-    translated_text = translate_text(payload.text, "en", "vi")
+    translated_text = await translate_text(payload.text, "en", "vi")
     return {
         "source_language": "en",
         "target_language": "vi",
@@ -168,7 +431,7 @@ async def translate_en_vi(payload: TranslationRequest):
 
 @app.post("/translate/vi-en")
 async def translate_vi_en(payload: TranslationRequest):
-    translated_text = translate_text(payload.text, "vi", "en")
+    translated_text = await translate_text(payload.text, "vi", "en")
     return {
         "source_language": "vi",
         "target_language": "en",
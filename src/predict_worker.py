@@ -0,0 +1,45 @@
+"""
+Vectorize + chấm điểm top-K dùng chung cho src/main.py và các process worker của
+PREDICT_EXECUTOR=process.
+
+Worker được tạo bằng forkserver (mặc định) hoặc spawn, không fork trực tiếp từ process uvicorn:
+lúc đó process đã có nhiều thread (event loop, pool dịch, MicroBatcher) và process con tạo bằng
+fork có thể kẹt vĩnh viễn ở một lock mà thread khác đang giữ đúng lúc fork. Vì không kế thừa
+model từ process cha, mỗi worker load model một lần trong `init_worker`; với thư mục mảng
+(MODEL_FORMAT=arrays) các mảng được mmap nên mọi worker dùng chung một bản trong page cache.
+"""
+
+from scipy.sparse import hstack
+
+from artifacts import load_serving_model
+from scoring import topk
+
+# Model của process worker (load trong init_worker)
+_MODEL = None
+
+
+def featurize(model: dict, texts, max_tokens: int):
+    """Ma trận feature cho list text: word_vec (cắt max_tokens ngay trong transform) + char_vec nếu có."""
+    Xw = model["word_vec"].transform(texts, max_tokens=max_tokens)
+    if model["char_vec"] is not None:
+        Xc = model["char_vec"].transform([" ".join(str(t).split()[:max_tokens]) for t in texts])
+        return hstack([Xw, Xc], format="csr")
+    return Xw
+
+
+def predict_topk(model: dict, texts, k: int, max_tokens: int):
+    """Trả về (codes, probs): hai mảng shape (len(texts), k), xác suất giảm dần."""
+    idx, probs = topk(model["scorer"].predict_proba(featurize(model, texts, max_tokens)), k)
+    return model["classes"][idx], probs
+
+
+def init_worker(model_path: str):
+    """Initializer của ProcessPoolExecutor: load model một lần cho mỗi worker."""
+    global _MODEL
+    _MODEL = load_serving_model(model_path)
+
+
+def predict_batch(texts, k: int):
+    """Top-K cho một batch trong worker, trả về list (codes, probs) theo từng text."""
+    max_tokens = _MODEL["cfg"].get("MAX_TOKENS_PER_DOC", 8000)
+    return list(zip(*predict_topk(_MODEL, texts, k, max_tokens)))
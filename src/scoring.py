@@ -0,0 +1,95 @@
+"""
+Tính xác suất cho toàn bộ nhãn bằng một phép nhân ma trận duy nhất,
+thay vì lặp qua từng SGDClassifier bên trong OneVsRestClassifier.
+"""
+
+import numpy as np
+from scipy import sparse
+from scipy.special import expit
+
+# Số nhãn ghép mỗi lần khi gộp trọng số (tránh ghi cột từng phần tử, thân thiện cache)
+_STACK_BLOCK = 64
+
+
+def stack_ovr_weights(clf, dtype=np.float32):
+    """Gộp coef_/intercept_ của mọi estimator thành một ma trận trọng số liên tục.
+
+    Trả về (coef_T, intercept):
+        coef_T: shape (n_features, n_labels), C-contiguous — tức ma trận labels × features
+                được lưu dạng chuyển vị để `X_csr @ coef_T` không phải copy lại ma trận.
+        intercept: shape (n_labels,)
+    """
+    estimators = clf.estimators_
+    n_labels = len(estimators)
+    n_features = clf.n_features_in_
+    coef_T = np.zeros((n_features, n_labels), dtype=dtype)
+    intercept = np.zeros(n_labels, dtype=dtype)
+
+    for start in range(0, n_labels, _STACK_BLOCK):
+        stop = min(start + _STACK_BLOCK, n_labels)
+        block = np.zeros((stop - start, n_features), dtype=dtype)
+        for j in range(start, stop):
+            est = estimators[j]
+            if hasattr(est, "coef_"):
+                block[j - start] = np.ravel(est.coef_)
+                intercept[j] = np.ravel(est.intercept_)[0]
+            else:
+                # _ConstantPredictor: nhãn luôn 0 hoặc luôn 1 trong tập train
+                intercept[j] = np.inf if float(est.y_[0]) > 0 else -np.inf
+        coef_T[:, start:stop] = block.T
+    return coef_T, intercept
+
+
+class LinearOvRScorer:
+    """Scorer one-vs-rest tuyến tính: P = sigmoid(X @ coef_T + intercept).
+
+    Cho kết quả tương đương `OneVsRestClassifier(SGDClassifier(loss="log_loss")).predict_proba`.
+    """
+
+    def __init__(self, coef_T, intercept):
+        if coef_T.shape[1] != intercept.shape[0]:
+            raise ValueError(
+                f"coef_T has {coef_T.shape[1]} labels but intercept has {intercept.shape[0]}"
+            )
+        self.coef_T = coef_T
+        self.intercept = intercept
+
+    @classmethod
+    def from_ovr(cls, clf):
+        return cls(*stack_ovr_weights(clf))
+
+    @property
+    def n_features(self) -> int:
+        return self.coef_T.shape[0]
+
+    @property
+    def n_labels(self) -> int:
+        return self.coef_T.shape[1]
+
+    def decision_function(self, X):
+        Z = X @ self.coef_T
+        if sparse.issparse(Z):
+            Z = Z.toarray()
+        Z = np.asarray(Z)
+        Z += self.intercept
+        return Z
+
+    def predict_proba(self, X):
+        return expit(self.decision_function(X))
+
+
+def topk(P, K):
+    """Chọn K nhãn có xác suất cao nhất cho mọi dòng cùng lúc.
+
+    Dùng argpartition (O(L)) để lấy K ứng viên rồi chỉ sort K phần tử đó.
+    Trả về (idx, probs), cả hai shape (n, K), sắp xếp giảm dần theo xác suất.
+    """
+    P = np.asarray(P)
+    K = max(1, min(K, P.shape[1]))
+    if K < P.shape[1]:
+        idx = np.argpartition(P, P.shape[1] - K, axis=1)[:, -K:]
+    else:
+        idx = np.broadcast_to(np.arange(P.shape[1]), P.shape)
+    probs = np.take_along_axis(P, idx, axis=1)
+    order = np.argsort(-probs, axis=1, kind="stable")
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(probs, order, axis=1)
@@ -0,0 +1,190 @@
+"""
+Dịch văn bản cho các endpoint /translate: backend có thể thay thế, cache LRU trong bộ nhớ
+(+ lưu xuống SQLite nếu cấu hình) và chạy lời gọi mạng ngoài event loop.
+"""
+
+import asyncio
+import contextvars
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Protocol
+
+from cache import LRUCache
+
+
+class TranslationBackend(Protocol):
+    def translate(self, text: str, source: str, target: str) -> str:
+        ...
+
+
+class _PooledRequests:
+    """`requests.get` qua một `requests.Session` theo từng thread (giữ kết nối keep-alive), kèm timeout."""
+
+    def __init__(self, timeout: float):
+        import requests
+
+        self._requests = requests
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def get(self, url, **kwargs):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        kwargs.setdefault("timeout", self._timeout)
+        return session.get(url, **kwargs)
+
+
+# Pool HTTP của GoogleBackend đang dịch trong context (thread) hiện tại
+_ACTIVE_POOL: contextvars.ContextVar = contextvars.ContextVar("translation_http_pool", default=None)
+_INSTALL_LOCK = threading.Lock()
+
+
+class _RequestsDispatcher:
+    """Thay cho module `requests` bên trong deep_translator.google.
+
+    deep_translator gọi `requests.get(...)` của module trực tiếp (mỗi lần mở kết nối mới) và
+    không cho truyền HTTP client. Dispatcher chỉ chuyển `get` sang pool của GoogleBackend khi
+    lời gọi nằm trong GoogleBackend.translate; mọi lời gọi khác (code khác dùng deep_translator)
+    và mọi thuộc tính khác đi thẳng tới module `requests` thật như chưa bị thay.
+    """
+
+    def __init__(self, requests_module):
+        self._requests = requests_module
+
+    def get(self, url, **kwargs):
+        pool = _ACTIVE_POOL.get()
+        if pool is None:
+            return self._requests.get(url, **kwargs)
+        return pool.get(url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._requests, name)
+
+
+def _install_dispatcher(google_module):
+    """Thay `google_module.requests` bằng _RequestsDispatcher, chỉ một lần cho cả process."""
+    with _INSTALL_LOCK:
+        if not isinstance(google_module.requests, _RequestsDispatcher):
+            google_module.requests = _RequestsDispatcher(google_module.requests)
+
+
+class GoogleBackend:
+    """GoogleTranslator (deep_translator), dùng lại instance theo (thread, cặp ngôn ngữ).
+
+    Lần tạo backend đầu tiên thay `deep_translator.google.requests` (thuộc tính module, có hiệu
+    lực cho cả process) bằng _RequestsDispatcher; việc thay là idempotent. Mỗi backend có pool
+    session + timeout riêng, chỉ dùng trong lời gọi translate của chính nó — các backend khác và
+    code khác dùng deep_translator vẫn gọi `requests` như bình thường.
+    """
+
+    def __init__(self, timeout: float = 10.0):
+        from deep_translator import google
+
+        _install_dispatcher(google)
+        self._translator_cls = google.GoogleTranslator
+        self._pool = _PooledRequests(timeout)
+        self._local = threading.local()
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        # GoogleTranslator.translate ghi vào _url_params nên không dùng chung giữa các thread
+        translators = getattr(self._local, "translators", None)
+        if translators is None:
+            translators = self._local.translators = {}
+        translator = translators.get((source, target))
+        if translator is None:
+            translator = translators[(source, target)] = self._translator_cls(source=source, target=target)
+        token = _ACTIVE_POOL.set(self._pool)
+        try:
+            return translator.translate(text)
+        finally:
+            _ACTIVE_POOL.reset(token)
+
+
+# Các backend có sẵn; đăng ký thêm bằng register_backend (vd. bản giả lập cho test)
+BACKENDS: Dict[str, Callable[[], TranslationBackend]] = {
+    "google": GoogleBackend,
+}
+
+
+def register_backend(name: str, factory: Callable[[], TranslationBackend]):
+    BACKENDS[name] = factory
+
+
+def create_backend(name: str) -> TranslationBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown translation backend: {name} (available: {sorted(BACKENDS)})")
+    return BACKENDS[name]()
+
+
+class SQLiteTranslationStore:
+    """Cache bền vững trên đĩa (SQLite) cho bản dịch, key (source, target, text)."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "source TEXT NOT NULL, target TEXT NOT NULL, text TEXT NOT NULL, "
+                "translated TEXT NOT NULL, PRIMARY KEY (source, target, text))"
+            )
+            self._conn.commit()
+
+    def get(self, source: str, target: str, text: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translated FROM translations WHERE source = ? AND target = ? AND text = ?",
+                (source, target, text),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, source: str, target: str, text: str, translated: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                (source, target, text, translated),
+            )
+            self._conn.commit()
+
+
+class TranslationService:
+    """Dịch có cache; lời gọi backend (blocking) chạy trong thread pool riêng."""
+
+    def __init__(
+        self,
+        backend: TranslationBackend,
+        cache: Optional[LRUCache] = None,
+        store: Optional[SQLiteTranslationStore] = None,
+        max_workers: int = 4,
+    ):
+        self.backend = backend
+        self.cache = cache if cache is not None else LRUCache(maxsize=0)
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="translate")
+
+    def _translate_uncached(self, text: str, source: str, target: str) -> str:
+        if self.store is not None:
+            stored = self.store.get(source, target, text)
+            if stored is not None:
+                return stored
+        translated = self.backend.translate(text, source, target)
+        if self.store is not None and translated is not None:
+            self.store.set(source, target, text, translated)
+        return translated
+
+    async def translate(self, text: str, source: str, target: str) -> str:
+        key = (source, target, text)
+        translated = self.cache.get(key)
+        if translated is None:
+            loop = asyncio.get_running_loop()
+            translated = await loop.run_in_executor(
+                self._executor, self._translate_uncached, text, source, target
+            )
+            if translated is not None:
+                self.cache.set(key, translated)
+        return translated
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
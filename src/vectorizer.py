@@ -0,0 +1,267 @@
+"""
+TF-IDF vectorizer dựng lại từ mảng (từ điển dạng hash + idf) thay cho TfidfVectorizer đã pickle.
+Cho kết quả giống hệt `TfidfVectorizer.transform` (cùng analyzer, cùng thứ tự phép tính).
+
+Biến thể hashing (HashingVectorizer + idf theo bucket) không có từ điển: chỉ cần tham số
+và mảng idf, transform không có trạng thái nên chạy song song thoải mái.
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import normalize
+
+# Các tham số của TfidfVectorizer cần lưu lại để transform giống hệt lúc train
+ANALYZER_PARAMS = ("lowercase", "token_pattern", "ngram_range", "strip_accents", "stop_words")
+TFIDF_PARAMS = ("binary", "sublinear_tf", "norm", "use_idf")
+HASHING_PARAMS = ("n_features", "alternate_sign", "binary")
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+def vectorizer_params(vec) -> dict:
+    """Lấy tham số (dạng JSON) của một TfidfVectorizer word-level đã fit."""
+    params = vec.get_params()
+    if params["analyzer"] != "word" or params["tokenizer"] is not None or params["preprocessor"] is not None:
+        raise ValueError("Only word-level TfidfVectorizer without custom tokenizer/preprocessor is supported")
+    out = {k: params[k] for k in ANALYZER_PARAMS + TFIDF_PARAMS}
+    out["ngram_range"] = list(out["ngram_range"])
+    out["dtype"] = np.dtype(params["dtype"]).name
+    return out
+
+
+def is_hashing(vec) -> bool:
+    """Vectorizer train là Pipeline HashingVectorizer → TfidfTransformer (biến thể hashing)."""
+    return isinstance(vec, Pipeline) and isinstance(vec[0], HashingVectorizer)
+
+
+def hashing_params(vec) -> dict:
+    """Lấy tham số (dạng JSON) của Pipeline HashingVectorizer → TfidfTransformer đã fit."""
+    hasher, tfidf = vec[0], vec[-1]
+    params = hasher.get_params()
+    if params["analyzer"] != "word" or params["tokenizer"] is not None or params["preprocessor"] is not None:
+        raise ValueError("Only word-level HashingVectorizer without custom tokenizer/preprocessor is supported")
+    if params["norm"] is not None:
+        raise ValueError("HashingVectorizer must use norm=None (normalization is done after idf)")
+    out = {k: params[k] for k in ANALYZER_PARAMS + HASHING_PARAMS}
+    out["ngram_range"] = list(out["ngram_range"])
+    out.update({k: tfidf.get_params()[k] for k in ("sublinear_tf", "norm", "use_idf")})
+    out["dtype"] = np.dtype(params["dtype"]).name
+    out["kind"] = "hashing"
+    return out
+
+
+def vocabulary_terms(vec) -> list:
+    """Danh sách từ theo đúng thứ tự feature index."""
+    terms = [None] * len(vec.vocabulary_)
+    for term, idx in vec.vocabulary_.items():
+        terms[idx] = term
+    return terms
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text sau `max_tokens` token (tách theo khoảng trắng) mà không ghép lại chuỗi.
+
+    Với token_pattern chỉ khớp ký tự chữ/số (mặc định), cho cùng tập token với
+    `" ".join(text.split()[:max_tokens])` nhưng không tạo chuỗi mới.
+    """
+    parts = text.split(None, max_tokens)
+    if len(parts) <= max_tokens:
+        return text
+    return text[:len(text) - len(parts[-1])]
+
+
+def _idf_diag(idf, n_features):
+    """Ma trận chéo idf dạng CSR, cùng dạng với TfidfTransformer.fit (cùng dtype với idf)."""
+    return sparse.diags(idf, offsets=0, shape=(n_features, n_features), format="csr", dtype=idf.dtype)
+
+
+def _word_ngrams(tokens, min_n: int, max_n: int) -> list:
+    """Cùng tập n-gram với CountVectorizer._word_ngrams (khi không có stop words)."""
+    out = list(tokens) if min_n == 1 else []
+    for n in range(max(min_n, 2), max_n + 1):
+        if n == 2:
+            out.extend(map(" ".join, zip(tokens, tokens[1:])))
+        else:
+            out.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return out
+
+
+def hash_terms(terms) -> np.ndarray:
+    """Hash 64-bit ổn định (SipHash của pandas, key cố định) cho một list chuỗi."""
+    return pd.util.hash_array(np.asarray(terms, dtype=object), categorize=False)
+
+
+class CompactVocabulary:
+    """Từ điển feature gọn: mảng hash 64-bit đã sort + feature index tương ứng.
+
+    Thay cho dict `vocabulary_` (~400k key str): chỉ tốn 12 byte/từ, có thể mmap,
+    và tra cứu cả batch token bằng một lần `np.searchsorted`.
+    """
+
+    def __init__(self, hashes, index):
+        self.hashes = hashes
+        self.index = index
+
+    @classmethod
+    def build(cls, terms):
+        """Dựng từ danh sách từ theo thứ tự feature index."""
+        hashes = hash_terms(terms)
+        order = np.argsort(hashes, kind="stable")
+        hashes = hashes[order]
+        if len(hashes) > 1 and np.any(hashes[1:] == hashes[:-1]):
+            raise ValueError("Hash collision inside vocabulary")
+        return cls(hashes, order.astype(np.int32))
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def lookup(self, features) -> np.ndarray:
+        """Feature index của từng token (-1 nếu ngoài từ điển)."""
+        if len(features) == 0 or len(self.hashes) == 0:
+            return np.full(len(features), -1, dtype=np.int32)
+        h = hash_terms(features)
+        # Tìm kiếm với needle đã sort nhanh hơn nhiều trên từ điển lớn (truy cập bộ nhớ tuần tự)
+        order = np.argsort(h)
+        pos = np.empty(len(h), dtype=np.intp)
+        pos[order] = np.searchsorted(self.hashes, h[order])
+        pos[pos == len(self.hashes)] = 0
+        found = self.hashes[pos] == h
+        return np.where(found, self.index[pos], -1).astype(np.int32)
+
+
+class ArrayTfidfVectorizer:
+    """Transform giống `TfidfVectorizer.transform`, dựng từ CompactVocabulary + mảng idf."""
+
+    def __init__(self, vocabulary: CompactVocabulary, idf, params: dict):
+        self.params = params
+        self.vocabulary = vocabulary
+        self.n_features = len(idf)
+        self.dtype = np.dtype(params["dtype"])
+        analyzer_kwargs = {k: params[k] for k in ANALYZER_PARAMS}
+        analyzer_kwargs["ngram_range"] = tuple(analyzer_kwargs["ngram_range"])
+        self._analyze = CountVectorizer(**analyzer_kwargs).build_analyzer()
+        # Đường nhanh một lượt (cắt → lower → regex → n-gram) khi cấu hình là mặc định
+        self._fast = (
+            params["token_pattern"] == DEFAULT_TOKEN_PATTERN
+            and params["strip_accents"] is None
+            and params["stop_words"] is None
+        )
+        self._findall = re.compile(params["token_pattern"]).findall
+        self.idf = idf
+        self._idf_diag = _idf_diag(idf, self.n_features) if params["use_idf"] else None
+
+    @classmethod
+    def from_sklearn(cls, vec):
+        """Dựng từ một TfidfVectorizer đã fit (bỏ được dict vocabulary_ sau khi dựng)."""
+        return cls(
+            CompactVocabulary.build(vocabulary_terms(vec)),
+            np.asarray(vec.idf_),
+            vectorizer_params(vec),
+        )
+
+    def _analyze_doc(self, doc, max_tokens=None) -> list:
+        """Danh sách n-gram của một note; có `max_tokens` thì cắt như `" ".join(doc.split()[:max_tokens])`."""
+        if max_tokens is not None:
+            doc = str(doc)
+            if not self._fast:
+                doc = " ".join(doc.split()[:max_tokens])
+                return self._analyze(doc)
+            doc = truncate_tokens(doc, max_tokens)
+        elif not (self._fast and isinstance(doc, str)):
+            return self._analyze(doc)
+        if self.params["lowercase"]:
+            doc = doc.lower()
+        min_n, max_n = self.params["ngram_range"]
+        return _word_ngrams(self._findall(doc), min_n, max_n)
+
+    def _count(self, raw_documents, max_tokens=None):
+        """Ma trận đếm (CSR, index đã sort) giống CountVectorizer._count_vocab"""
+        features, doc_ids = [], []
+        n_docs = 0
+        for doc in raw_documents:
+            doc_features = self._analyze_doc(doc, max_tokens)
+            features.extend(doc_features)
+            doc_ids.append(np.full(len(doc_features), n_docs, dtype=np.int64))
+            n_docs += 1
+
+        # Tra cứu toàn bộ token của cả batch một lần, bỏ token ngoài từ điển
+        ids = self.vocabulary.lookup(features)
+        doc_ids = np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int64)
+        known = ids >= 0
+        keys, counts = np.unique(doc_ids[known] * self.n_features + ids[known], return_counts=True)
+
+        rows, cols = np.divmod(keys, self.n_features)
+        indptr = np.zeros(n_docs + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=n_docs), out=indptr[1:])
+        return sparse.csr_matrix(
+            (counts, cols.astype(np.int32), indptr),
+            shape=(n_docs, self.n_features),
+            dtype=self.dtype,
+        )
+
+    def transform(self, raw_documents, max_tokens=None):
+        """TF-IDF cho list note; `max_tokens` cắt mỗi note trong cùng lượt tokenize."""
+        X = self._count(raw_documents, max_tokens)
+        if self.params["binary"]:
+            X.data.fill(1)
+        # Cùng thứ tự với TfidfTransformer.transform để cho kết quả giống hệt từng bit
+        if self.params["sublinear_tf"]:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self._idf_diag is not None:
+            X = X @ self._idf_diag
+        if self.params["norm"] is not None:
+            X = normalize(X, norm=self.params["norm"], copy=False)
+        return X
+
+
+class HashingTfidfVectorizer:
+    """Transform giống Pipeline(HashingVectorizer, TfidfTransformer) lúc train, không cần từ điển.
+
+    Chỉ giữ tham số + mảng idf (n_features bucket); HashingVectorizer không có trạng thái.
+    """
+
+    def __init__(self, idf, params: dict):
+        self.params = params
+        self.n_features = params["n_features"]
+        self.dtype = np.dtype(params["dtype"])
+        hasher_kwargs = {k: params[k] for k in ANALYZER_PARAMS + HASHING_PARAMS}
+        hasher_kwargs["ngram_range"] = tuple(hasher_kwargs["ngram_range"])
+        self._hasher = HashingVectorizer(norm=None, dtype=self.dtype, **hasher_kwargs)
+        self._fast_truncate = params["token_pattern"] == DEFAULT_TOKEN_PATTERN
+        self.idf = idf
+        self._idf_diag = _idf_diag(idf, self.n_features) if params["use_idf"] else None
+
+    @classmethod
+    def from_sklearn(cls, vec):
+        """Dựng từ Pipeline(HashingVectorizer, TfidfTransformer) đã fit."""
+        return cls(np.asarray(vec[-1].idf_), hashing_params(vec))
+
+    def transform(self, raw_documents, max_tokens=None):
+        """TF-IDF cho list note; `max_tokens` cắt mỗi note trước khi hash."""
+        if max_tokens is not None:
+            if self._fast_truncate:
+                raw_documents = [truncate_tokens(str(d), max_tokens) for d in raw_documents]
+            else:
+                raw_documents = [" ".join(str(d).split()[:max_tokens]) for d in raw_documents]
+        X = self._hasher.transform(raw_documents)
+        # Cùng thứ tự với TfidfTransformer.transform
+        if self.params["sublinear_tf"]:
+            np.log(X.data, X.data)
+            X.data += 1
+        if self._idf_diag is not None:
+            X = X @ self._idf_diag
+        if self.params["norm"] is not None:
+            X = normalize(X, norm=self.params["norm"], copy=False)
+        return X
+
+
+def serving_vectorizer(vec):
+    """Vectorizer serving tương ứng với word_vec lúc train (TF-IDF có từ điển hoặc hashing)."""
+    if is_hashing(vec):
+        return HashingTfidfVectorizer.from_sklearn(vec)
+    return ArrayTfidfVectorizer.from_sklearn(vec)
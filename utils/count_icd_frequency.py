@@ -1,19 +1,20 @@
 """
 Script để đếm số lần các ICD code xuất hiện (theo hadm_id).
-Đọc từ file diagnoses_icd.csv.gz trong proc (đã lọc non-disease) và tạo file icd_hadm_freq.csv.
+Đọc từ file diagnoses_icd.parquet trong proc (đã lọc non-disease) và tạo file icd_hadm_freq.csv.
 Format: icd_full, hadm_freq (số lần xuất hiện unique hadm_id)
 """
 
-import pandas as pd
 from pathlib import Path
 
+from diagnoses_io import HadmCodeIndex
+
 # Đường dẫn
 BASE_DIR = Path(__file__).parent.parent
 DATA_DIR = BASE_DIR / "data"
 PROC_DIR = DATA_DIR / "proc"
 
 # File input và output
-INPUT_FILE = PROC_DIR / "diagnoses_icd.csv.gz"  # File đã lọc non-disease trong proc
+INPUT_FILE = PROC_DIR / "diagnoses_icd.parquet"  # File đã lọc non-disease trong proc
 OUTPUT_FILE = PROC_DIR / "icd_hadm_freq.csv"
 
 def count_icd_frequency():
@@ -34,53 +35,18 @@ def count_icd_frequency():
     # Đếm tần suất ICD codes theo hadm_id (unique hadm_id)
     print("\n🔄 Đang đếm tần suất ICD codes theo hadm_id...")
     
-    total_rows = 0
-    chunk_size = 100_000
-    hadm_icd_dict = {}  # {hadm_id: set(icd_full)}
-    
-    # Đọc theo chunks để tiết kiệm memory
-    for chunk in pd.read_csv(INPUT_FILE, compression='gzip',
-                            usecols=['hadm_id', 'icd_code', 'icd_version'],
-                            chunksize=chunk_size, low_memory=False):
-        total_rows += len(chunk)
-        
-        # Tạo icd_full: version-code
-        chunk['icd_full'] = (
-            chunk['icd_version'].astype(str) + "-" + 
-            chunk['icd_code'].astype(str)
-        )
-        
-        # Nhóm theo hadm_id và lưu các ICD unique
-        for hadm_id, group in chunk.groupby('hadm_id'):
-            hadm_id_int = int(hadm_id)
-            if hadm_id_int not in hadm_icd_dict:
-                hadm_icd_dict[hadm_id_int] = set()
-            hadm_icd_dict[hadm_id_int].update(group['icd_full'].tolist())
-        
-        if total_rows % 1_000_000 == 0:
-            print(f"   Đã xử lý {total_rows:,} dòng...")
-    
-    print(f"   Tổng số dòng đã xử lý: {total_rows:,}")
-    print(f"   Tổng số hadm_id unique: {len(hadm_icd_dict):,}")
+    # Một lượt đọc: chỉ mục hadm_id -> icd_full (CSR, mã hoá số nguyên), đếm số hadm_id
+    # không trùng cho mỗi ICD trực tiếp trên mảng id
+    index = HadmCodeIndex.build(INPUT_FILE)
     
-    # Đếm số hadm_id cho mỗi ICD code
-    from collections import Counter
-    icd_hadm_counter = Counter()
-    for hadm_id, icd_set in hadm_icd_dict.items():
-        for icd_full in icd_set:
-            icd_hadm_counter[icd_full] += 1
+    print(f"   Tổng số dòng đã xử lý: {index.n_rows:,}")
+    print(f"   Tổng số hadm_id unique: {len(index):,}")
     
-    print(f"   Tổng số ICD code unique: {len(icd_hadm_counter):,}")
-    print(f"   Tổng số lần xuất hiện (hadm_freq): {sum(icd_hadm_counter.values()):,}")
+    # Format: icd_full, hadm_freq (sắp xếp theo hadm_freq giảm dần)
+    frequency_df = index.code_frequency()
     
-    # Tạo DataFrame với format: icd_full, hadm_freq
-    frequency_df = pd.DataFrame([
-        {'icd_full': icd, 'hadm_freq': count}
-        for icd, count in icd_hadm_counter.items()
-    ])
-    
-    # Sắp xếp theo hadm_freq giảm dần
-    frequency_df = frequency_df.sort_values('hadm_freq', ascending=False).reset_index(drop=True)
+    print(f"   Tổng số ICD code unique: {len(frequency_df):,}")
+    print(f"   Tổng số lần xuất hiện (hadm_freq): {frequency_df['hadm_freq'].sum():,}")
     
     # Lưu file
     PROC_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,190 @@
+"""
+Đọc / ghi các file trung gian của pipeline (diagnoses, d_icd_diagnoses) dạng Parquet.
+icd_code được lưu dạng dictionary (category), icd_version dạng int8; gzip CSV chỉ còn là
+định dạng export tuỳ chọn. Các hàm đọc nhận cả Parquet lẫn CSV (.csv / .csv.gz) nguồn.
+"""
+
+import gzip
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+CHUNK_SIZE = 200_000              # số dòng mỗi chunk khi đọc Parquet
+CSV_BLOCK_SIZE = 16 * 1024 * 1024  # số byte mỗi block khi đọc CSV (pyarrow, đa luồng)
+
+
+def is_parquet(path) -> bool:
+    return Path(path).suffix == ".parquet"
+
+
+def normalize_icd_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """icd_code → category (string), icd_version → int8 (nếu có các cột này)"""
+    if "icd_code" in df.columns:
+        df["icd_code"] = df["icd_code"].astype(str).astype("category")
+    if "icd_version" in df.columns:
+        df["icd_version"] = df["icd_version"].astype("int8")
+    return df
+
+
+def iter_chunks(path, columns=None, chunk_size=CHUNK_SIZE):
+    """Đọc file theo chunk (DataFrame), chỉ các cột `columns`
+
+    Parquet: đọc theo record batch. CSV: đọc stream bằng pyarrow (icd_code luôn là string,
+    không bị parse thành số như '0010' → 10).
+    """
+    if is_parquet(path):
+        pf = pq.ParquetFile(path)
+        for batch in pf.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+    reader = pacsv.open_csv(
+        str(path),
+        read_options=pacsv.ReadOptions(block_size=CSV_BLOCK_SIZE),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={"icd_code": pa.string()},
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas()
+
+
+def read_table(path, columns=None) -> pd.DataFrame:
+    """Đọc toàn bộ file (Parquet hoặc CSV) vào một DataFrame"""
+    if is_parquet(path):
+        return pd.read_parquet(path, columns=columns)
+    return pd.read_csv(path, usecols=columns, dtype={"icd_code": str}, low_memory=False)
+
+
+class ParquetChunkWriter:
+    """Ghi dần các chunk DataFrame vào một file Parquet (mỗi chunk một row group)"""
+
+    def __init__(self, path, compression="snappy"):
+        self.path = Path(path)
+        self.compression = compression
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, df: pd.DataFrame):
+        table = pa.Table.from_pandas(normalize_icd_columns(df), preserve_index=False)
+        if self._writer is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # Kiểu index của dictionary (int8/int16...) phụ thuộc số category của từng chunk,
+            # cố định int32 để mọi chunk cùng schema
+            schema = table.schema
+            if "icd_code" in schema.names:
+                i = schema.get_field_index("icd_code")
+                schema = schema.set(i, pa.field("icd_code", pa.dictionary(pa.int32(), pa.string())))
+            self._schema = schema
+            table = table.cast(schema)
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+        else:
+            table = table.cast(self._schema)
+        self._writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_parquet(df: pd.DataFrame, path):
+    """Ghi một DataFrame nhỏ (vd. d_icd_diagnoses) ra Parquet"""
+    with ParquetChunkWriter(path) as writer:
+        writer.write(df)
+
+
+def export_csv_gz(parquet_path, csv_path, chunk_size=CHUNK_SIZE):
+    """Export Parquet sang gzip CSV (một gzip stream duy nhất, không nối nhiều member)"""
+    with gzip.open(csv_path, "wt", encoding="utf-8", newline="") as f:
+        for i, chunk in enumerate(iter_chunks(parquet_path, chunk_size=chunk_size)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+
+
+class HadmCodeIndex:
+    """Chỉ mục hadm_id → các mã icd_full ('version-code') dạng CSR, dựng trong một lượt đọc
+
+    hadm_ids: hadm_id duy nhất (đã sort); codes: icd_full duy nhất (sort theo chuỗi);
+    code_ids[offsets[i]:offsets[i + 1]]: id (đã sort, không trùng) các mã của hadm_ids[i].
+    """
+
+    def __init__(self, hadm_ids, offsets, code_ids, codes, n_rows=0):
+        self.hadm_ids = hadm_ids
+        self.offsets = offsets
+        self.code_ids = code_ids
+        self.codes = codes
+        self.n_rows = n_rows
+
+    @classmethod
+    def build(cls, path, chunk_size=CHUNK_SIZE):
+        """Đọc (hadm_id, icd_code, icd_version) theo chunk, mã hoá icd_full thành số nguyên"""
+        vocab = {}            # icd_full → id theo thứ tự gặp
+        hadm_parts, code_parts = [], []
+        n_rows = 0
+        for chunk in iter_chunks(path, columns=["hadm_id", "icd_code", "icd_version"], chunk_size=chunk_size):
+            n_rows += len(chunk)
+            # Chỉ ghép chuỗi 'version-code' cho các cặp (code, version) duy nhất trong chunk
+            pair_ids, pairs = pd.MultiIndex.from_arrays(
+                [chunk["icd_code"].astype(str), chunk["icd_version"].astype(int)]
+            ).factorize()
+            pair_codes = np.array([
+                vocab.setdefault(f"{version}-{code}", len(vocab)) for code, version in pairs
+            ], dtype=np.int64)
+            hadm_parts.append(chunk["hadm_id"].to_numpy(dtype=np.int64))
+            code_parts.append(pair_codes[pair_ids])
+
+        codes = np.array(list(vocab), dtype=object)
+        hadm = np.concatenate(hadm_parts) if hadm_parts else np.empty(0, dtype=np.int64)
+        code = np.concatenate(code_parts) if code_parts else np.empty(0, dtype=np.int64)
+
+        # Đánh lại id theo thứ tự chuỗi để mã của mỗi hadm ra đúng thứ tự sorted()
+        order = np.argsort(codes.astype(str), kind="stable")
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        codes = codes[order]
+
+        # Một lần np.unique trên key (hadm, code): bỏ trùng và sort theo hadm rồi code
+        hadm_ids, hadm_pos = np.unique(hadm, return_inverse=True)
+        keys = np.unique(hadm_pos.astype(np.int64) * max(len(codes), 1) + rank[code])
+        rows, code_ids = np.divmod(keys, max(len(codes), 1))
+        offsets = np.zeros(len(hadm_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(hadm_ids)), out=offsets[1:])
+        return cls(hadm_ids, offsets, code_ids.astype(np.int32), codes, n_rows)
+
+    def __len__(self):
+        return len(self.hadm_ids)
+
+    @property
+    def n_pairs(self):
+        return len(self.code_ids)
+
+    def code_frequency(self) -> pd.DataFrame:
+        """Số hadm_id (không trùng) của mỗi icd_full, sort giảm dần theo hadm_freq"""
+        freq = np.bincount(self.code_ids, minlength=len(self.codes))
+        df = pd.DataFrame({"icd_full": self.codes, "hadm_freq": freq})
+        df = df[df["hadm_freq"] > 0]
+        return df.sort_values(["hadm_freq", "icd_full"], ascending=[False, True]).reset_index(drop=True)
+
+    def joined_codes(self, hadm_ids, sep=";") -> list:
+        """Chuỗi icd_full nối bằng `sep` cho từng hadm_id ('' nếu không có mã nào)"""
+        hadm_ids = np.asarray(hadm_ids, dtype=np.int64)
+        if len(self.hadm_ids) == 0:
+            return [""] * len(hadm_ids)
+        pos = np.minimum(np.searchsorted(self.hadm_ids, hadm_ids), len(self.hadm_ids) - 1)
+        found = self.hadm_ids[pos] == hadm_ids
+        return [
+            sep.join(self.codes[self.code_ids[self.offsets[p]:self.offsets[p + 1]]]) if ok else ""
+            for p, ok in zip(pos, found)
+        ]
@@ -0,0 +1,70 @@
+"""
+Hàm dùng chung cho các job đánh giá model (06_export_model, 08_compare_vectorizers, 09_sweep):
+import 05_evaluate.py, chia train/val/test theo bệnh nhân giống cell [4] của 04_train.py và
+lấy mẫu note held-out (không thuộc tập train của model) từ train_unified.parquet.
+
+Split chỉ khớp với model khi model được train trên toàn bộ train_unified.parquet
+(LIMIT_SAMPLES = None) với cùng TEST_SIZE / VAL_SIZE_WITHIN_TRAIN / SEED.
+"""
+
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+from sklearn.model_selection import GroupShuffleSplit
+
+JOBS_DIR = Path(__file__).parent.parent / "jobs"
+
+# Giống cell [1] của 04_train.py
+TEST_SIZE = 0.15
+VAL_SIZE_WITHIN_TRAIN = 0.1765
+SEED = 40
+
+
+def load_evaluate_module():
+    """Import jobs/05_evaluate.py (tên file bắt đầu bằng số nên không import trực tiếp được)"""
+    spec = importlib.util.spec_from_file_location("evaluate", JOBS_DIR / "05_evaluate.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def split_positions(subject_ids, test_size=TEST_SIZE, val_size=VAL_SIZE_WITHIN_TRAIN, seed=SEED):
+    """Vị trí dòng (train, val, test) theo bệnh nhân — cùng cách chia với 04_train.py"""
+    subject_ids = np.asarray(subject_ids)
+    gss1 = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=seed)
+    idx_tr, idx_te = next(gss1.split(subject_ids, groups=subject_ids))
+    gss2 = GroupShuffleSplit(n_splits=1, test_size=val_size, random_state=seed)
+    idx_tr2, idx_va = next(gss2.split(idx_tr, groups=subject_ids[idx_tr]))
+    return idx_tr[idx_tr2], idx_tr[idx_va], idx_te
+
+
+def read_rows(path, positions, columns):
+    """Đọc các dòng ở `positions` (đã sort) của file Parquet, từng row group một"""
+    pf = pq.ParquetFile(path)
+    positions = np.asarray(positions)
+    parts, start = [], 0
+    for rg in range(pf.num_row_groups):
+        n = pf.metadata.row_group(rg).num_rows
+        sel = positions[(positions >= start) & (positions < start + n)] - start
+        if len(sel):
+            parts.append(pf.read_row_group(rg, columns=columns).take(sel).to_pandas())
+        start += n
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, ignore_index=True)
+
+
+def load_heldout_sample(path, n_samples, part="val", seed=SEED, columns=("text_clean", "icd_codes")):
+    """Mẫu ngẫu nhiên tối đa `n_samples` dòng thuộc phần `part` ("val" hoặc "test") của split.
+
+    Chỉ đọc cột subject_id của cả file; các cột còn lại chỉ đọc cho những dòng được chọn.
+    """
+    subject_ids = pq.read_table(path, columns=["subject_id"]).column("subject_id").to_numpy()
+    _, pos_va, pos_te = split_positions(subject_ids)
+    pos = {"val": pos_va, "test": pos_te}[part]
+    if len(pos) > n_samples:
+        pos = np.random.default_rng(seed).choice(pos, n_samples, replace=False)
+    return read_rows(path, np.sort(pos), list(columns))
@@ -0,0 +1,49 @@
+"""
+ASGI app cho load test: chính src/main.py nhưng backend dịch là bản giả lập chạy local
+(không gọi Google), đăng ký qua translation.register_backend.
+
+FakeTranslatorBackend mô phỏng một lời gọi mạng blocking như GoogleBackend: ngủ
+FAKE_TRANSLATE_LATENCY_MS (± FAKE_TRANSLATE_JITTER_MS) rồi trả về text có đánh dấu ngôn ngữ
+đích; FAKE_TRANSLATE_ERROR_RATE là tỉ lệ lời gọi ném lỗi (endpoint trả 500).
+
+Chạy (jobs/11_load_test.py tự khởi động server này); TRANSLATION_BACKEND khác "fake" sẽ bị từ chối:
+    uvicorn loadtest_app:app --app-dir utils --workers 2
+"""
+
+import os
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+from translation import register_backend  # noqa: E402
+
+
+class FakeTranslatorBackend:
+    """Thay cho GoogleBackend: cùng interface translate(text, source, target), không cần mạng."""
+
+    def __init__(self, latency_ms=None, jitter_ms=None, error_rate=None):
+        self.latency_ms = float(os.getenv("FAKE_TRANSLATE_LATENCY_MS", "80") if latency_ms is None else latency_ms)
+        self.jitter_ms = float(os.getenv("FAKE_TRANSLATE_JITTER_MS", "20") if jitter_ms is None else jitter_ms)
+        self.error_rate = float(os.getenv("FAKE_TRANSLATE_ERROR_RATE", "0") if error_rate is None else error_rate)
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms))
+        time.sleep(delay / 1000)
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            raise RuntimeError("fake translator error")
+        return f"[{source}->{target}] {text}"
+
+
+register_backend("fake", FakeTranslatorBackend)
+# main.py tạo backend lúc import, nên phải đăng ký + chọn backend trước khi import. Không dùng
+# backend khác dù shell đã đặt TRANSLATION_BACKEND: load test không được gửi request thật tới Google
+if os.environ.get("TRANSLATION_BACKEND", "fake").lower() != "fake":
+    raise RuntimeError(
+        f"loadtest_app chỉ chạy với backend dịch giả lập, nhưng TRANSLATION_BACKEND="
+        f"{os.environ['TRANSLATION_BACKEND']!r}; bỏ biến này hoặc đặt TRANSLATION_BACKEND=fake"
+    )
+os.environ["TRANSLATION_BACKEND"] = "fake"
+
+from main import app  # noqa: E402,F401
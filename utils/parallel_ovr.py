@@ -0,0 +1,129 @@
+"""
+Train One-vs-Rest (mỗi nhãn một estimator nhị phân) song song trên nhiều process mà không
+nhân bản ma trận train.
+
+Xtr (CSR) được ghi một lần ra các file .npy (data float64 — kiểu SGDClassifier dùng nội bộ,
+nên fit không phải convert/copy lại X cho từng nhãn) và mỗi worker mở lại bằng mmap read-only:
+mọi process dùng chung một bản trong page cache. Y được lưu dạng CSC (chỉ các dòng dương tính
+của từng nhãn). Nhãn được chia thành các block nhỏ, phân phối động cho các worker; kết quả
+ghép lại thành một OneVsRestClassifier đã fit (cùng dạng `OneVsRestClassifier.fit`), nên phần
+lưu model / export / serving không phải đổi gì.
+"""
+
+import multiprocessing
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+from scipy import sparse
+from sklearn.base import clone
+from sklearn.multiclass import OneVsRestClassifier, _ConstantPredictor
+from sklearn.preprocessing import LabelBinarizer
+
+LABELS_PER_TASK = 16   # số nhãn mỗi task gửi cho worker (nhỏ để chia tải đều)
+
+# Ma trận đã mở trong worker (mỗi process chỉ mmap một lần)
+_SHARED = {}
+
+
+def _index_dtype(*maxvals):
+    """int32 nếu mọi giá trị chỉ số vừa int32, ngược lại int64 (không để chỉ số bị tràn âm thầm)"""
+    return np.int32 if max(maxvals) <= np.iinfo(np.int32).max else np.int64
+
+
+def dump_shared(X, Y, out_dir):
+    """Ghi X (CSR float64) và Y (CSC) ra out_dir dạng .npy để các worker mmap.
+
+    indices / indptr của X dùng chung một kiểu (int32, hoặc int64 khi nnz hay số feature vượt
+    int32) để scipy không phải copy lại mảng mmap khi dựng CSR trong worker.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    X = sparse.csr_matrix(X)
+    Y = sparse.csc_matrix(Y)
+    x_index = _index_dtype(X.nnz, X.shape[1])
+    np.save(out_dir / "X_data.npy", X.data.astype(np.float64, copy=False))
+    np.save(out_dir / "X_indices.npy", X.indices.astype(x_index, copy=False))
+    np.save(out_dir / "X_indptr.npy", X.indptr.astype(x_index, copy=False))
+    np.save(out_dir / "Y_indices.npy", Y.indices.astype(_index_dtype(Y.shape[0]), copy=False))
+    np.save(out_dir / "Y_indptr.npy", Y.indptr.astype(np.int64, copy=False))
+    return X.shape
+
+
+def load_shared(shared_dir, shape):
+    """Mở lại X / Y đã dump bằng mmap read-only (không copy dữ liệu)"""
+    key = str(shared_dir)
+    if key not in _SHARED:
+        d = Path(shared_dir)
+        X = sparse.csr_matrix(
+            (np.load(d / "X_data.npy", mmap_mode="r"),
+             np.load(d / "X_indices.npy", mmap_mode="r"),
+             np.load(d / "X_indptr.npy", mmap_mode="r")),
+            shape=shape,
+            copy=False,
+        )
+        _SHARED.clear()
+        _SHARED[key] = (X, np.load(d / "Y_indices.npy", mmap_mode="r"), np.load(d / "Y_indptr.npy"))
+    return _SHARED[key]
+
+
+def _fit_labels(shared_dir, shape, estimator, start, stop):
+    """Fit các nhãn [start, stop) trong worker; trả về (start, [estimator đã fit])"""
+    X, y_indices, y_indptr = load_shared(shared_dir, shape)
+    fitted = []
+    for j in range(start, stop):
+        y = np.zeros(shape[0], dtype=np.int64)
+        y[y_indices[y_indptr[j]:y_indptr[j + 1]]] = 1
+        if y_indptr[j + 1] - y_indptr[j] in (0, shape[0]):
+            # Nhãn chỉ có một giá trị trong train: giống OneVsRestClassifier._fit_binary
+            est = _ConstantPredictor().fit(X, np.unique(y))
+        else:
+            est = clone(estimator).fit(X, y)
+            # float32 ngay trong worker: giảm một nửa dữ liệu gửi về và RAM của process chính
+            est.coef_ = est.coef_.astype(np.float32)
+            est.intercept_ = est.intercept_.astype(np.float32)
+        fitted.append(est)
+    return start, fitted
+
+
+def fit_ovr_parallel(estimator, X, Y, n_workers, shared_dir=None, labels_per_task=LABELS_PER_TASK,
+                     mp_context="fork", verbose=True):
+    """Fit OneVsRestClassifier(estimator) trên `n_workers` process, X được chia sẻ qua mmap
+
+    Y: ma trận nhãn (n_samples, n_labels) dense hoặc sparse. shared_dir: thư mục ghi tạm
+    X / Y (mặc định thư mục tạm của hệ thống, bị xoá sau khi xong).
+    Trả về OneVsRestClassifier đã fit, coef_/intercept_ dạng float32.
+    """
+    cleanup = shared_dir is None
+    shared_dir = Path(tempfile.mkdtemp(prefix="ovr_mmap_") if shared_dir is None else shared_dir)
+    n_labels = Y.shape[1]
+    estimators = [None] * n_labels
+    t0 = time.perf_counter()
+    try:
+        shape = dump_shared(X, Y, shared_dir)
+        ctx = multiprocessing.get_context(mp_context)
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx) as pool:
+            futures = [
+                pool.submit(_fit_labels, str(shared_dir), shape, estimator, start,
+                            min(start + labels_per_task, n_labels))
+                for start in range(0, n_labels, labels_per_task)
+            ]
+            done = 0
+            for future in as_completed(futures):
+                start, fitted = future.result()
+                estimators[start:start + len(fitted)] = fitted
+                done += len(fitted)
+                if verbose and (done == n_labels or done % (labels_per_task * 10) == 0):
+                    print(f"   {done}/{n_labels} nhãn — {time.perf_counter() - t0:.1f}s")
+    finally:
+        if cleanup:
+            shutil.rmtree(shared_dir, ignore_errors=True)
+
+    clf = OneVsRestClassifier(estimator, n_jobs=n_workers)
+    clf.estimators_ = estimators
+    clf.label_binarizer_ = LabelBinarizer(sparse_output=True).fit(Y)
+    clf.n_features_in_ = X.shape[1]
+    return clf